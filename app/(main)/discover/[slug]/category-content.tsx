@@ -49,12 +49,14 @@ export function CategoryContent() {
 
       let filteredSubCategories = subs ?? [];
       if (filteredSubCategories.length > 0) {
-        const { data: listingRows } = await supabase
-          .from('listings')
+        // Precomputed by the sync scripts; avoids scanning every listing in the category.
+        const { data: statsRows } = await supabase
+          .from('category_listing_stats')
           .select('category_id')
+          .gt('listing_count', 0)
           .in('category_id', filteredSubCategories.map((sub) => sub.id));
 
-        const activeCategoryIds = new Set((listingRows ?? []).map((row) => row.category_id));
+        const activeCategoryIds = new Set((statsRows ?? []).map((row) => row.category_id));
         filteredSubCategories = filteredSubCategories.filter((sub) => activeCategoryIds.has(sub.id));
       }
 
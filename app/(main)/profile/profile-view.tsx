@@ -77,10 +77,21 @@ export function ProfileView({ user }: { user: User }) {
   }, [user.id]);
 
   const loadVisitCount = useCallback(async () => {
+    const { data } = await getSupabase()
+      .from('user_visit_totals')
+      .select('visit_count')
+      .eq('user_id', user.id)
+      .maybeSingle();
+    if (data) {
+      setVisitCount(data.visit_count || 0);
+      return;
+    }
+    // No totals row until the loyalty rollup has folded in this user's first visit.
     const { count } = await getSupabase()
       .from('store_visits')
       .select('*', { count: 'exact', head: true })
-      .eq('user_id', user.id);
+      .eq('user_id', user.id)
+      .not('verified_at', 'is', null);
     setVisitCount(count || 0);
   }, [user.id]);
 
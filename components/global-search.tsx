@@ -1,25 +1,26 @@
 'use client';
 
-import { useState, useEffect, useRef, useMemo, useCallback, Fragment } from 'react';
+import { useState, useEffect, useRef, Fragment } from 'react';
 import { useRouter } from 'next/navigation';
 import Link from 'next/link';
 import { Search, X, MapPin, Star, ArrowRight, Loader2, Utensils, ShoppingBag, Briefcase, Heart, Home } from 'lucide-react';
 import { getSupabase } from '@/lib/supabase';
 import { CORE_DISCOVER_CATEGORY_SLUGS } from '@/lib/discover-taxonomy';
 
-interface SearchListing {
-  id: string;
+// Row returned by the `search_listings` RPC over `listing_search_index`.
+interface SearchResult {
+  listing_id: string;
   name: string;
   neighborhood: string;
+  category_name: string;
+  category_slug: string;
   is_featured: boolean;
-  description: string;
-  tags: string[] | null;
-  categories:
-    | { name: string; slug: string; parent_id: string | null }
-    | { name: string; slug: string; parent_id: string | null }[]
-    | null;
+  rank: number;
 }
 
+const RESULT_LIMIT = 8;
+const SEARCH_DEBOUNCE_MS = 200;
+
 const SYNONYMS: Record<string, string[]> = {
   hair: ['hairdresser', 'salon', 'colouring', 'balayage', 'barber', 'stylist'],
   eat: ['restaurant', 'dining', 'food', 'cuisine'],
@@ -56,40 +57,8 @@ function getCategoryIcon(catName: string) {
   return CATEGORY_ICONS[catName] || Search;
 }
 
-function scoreResult(listing: SearchListing, terms: string[]): number {
-  let score = 0;
-  const name = listing.name.toLowerCase();
-  const desc = (listing.description || '').toLowerCase();
-  const category = getListingCategory(listing.categories);
-  const catName = category?.name.toLowerCase() || '';
-  const tags = (listing.tags || []).map(t => t.toLowerCase());
-
-  for (const term of terms) {
-    if (name.includes(term)) score += 10;
-    if (catName.includes(term)) score += 6;
-    if (tags.some(t => t.includes(term))) score += 5;
-    if (desc.includes(term)) score += 2;
-
-    const synonyms = SYNONYMS[term] || [];
-    for (const syn of synonyms) {
-      if (name.includes(syn)) score += 4;
-      if (catName.includes(syn)) score += 3;
-      if (tags.some(t => t.includes(syn))) score += 3;
-    }
-  }
-
-  if (listing.is_featured) score += 2;
-  return score;
-}
-
-function getListingCategory(
-  category:
-    | { name: string; slug: string; parent_id: string | null }
-    | { name: string; slug: string; parent_id: string | null }[]
-    | null
-) {
-  if (!category) return null;
-  return Array.isArray(category) ? category[0] ?? null : category;
+function synonymsFor(terms: string[]): string[] {
+  return Array.from(new Set(terms.flatMap((term) => SYNONYMS[term] || [])));
 }
 
 function highlightMatch(text: string, query: string) {
@@ -112,47 +81,42 @@ export function GlobalSearch() {
   const router = useRouter();
   const [open, setOpen] = useState(false);
   const [query, setQuery] = useState('');
-  const [listings, setListings] = useState<SearchListing[]>([]);
-  const [loaded, setLoaded] = useState(false);
+  const [results, setResults] = useState<SearchResult[]>([]);
+  const [searching, setSearching] = useState(false);
+  const [searchedQuery, setSearchedQuery] = useState('');
   const inputRef = useRef<HTMLInputElement>(null);
 
-  const loadListings = useCallback(async () => {
-    if (loaded) return;
-    try {
-      const supabase = getSupabase();
-      const [catRes, listRes] = await Promise.all([
-        supabase
-          .from('categories')
-          .select('id')
-          .is('parent_id', null)
-          .in('slug', [...CORE_DISCOVER_CATEGORY_SLUGS]),
-        supabase
-          .from('listings')
-          .select('id, name, neighborhood, is_featured, description, tags, categories!inner(name, slug, parent_id)')
-          .order('is_featured', { ascending: false })
-          .order('name'),
-      ]);
+  // Ranking, category filtering and the limit all run server-side.
+  useEffect(() => {
+    const trimmed = query.trim();
+    const terms = trimmed.toLowerCase().split(/\s+/).filter(t => t.length >= 2);
+    if (trimmed.length < 2 || !terms.length) {
+      setResults([]);
+      setSearching(false);
+      setSearchedQuery('');
+      return;
+    }
 
-      const allowedParentIds = new Set((catRes.data ?? []).map((category) => category.id));
-      const allowedSlugs = new Set<string>(CORE_DISCOVER_CATEGORY_SLUGS as readonly string[]);
-      const filteredListings = ((listRes.data ?? []) as SearchListing[]).filter((listing) => {
-        const category = getListingCategory(listing.categories);
-        if (!category) return false;
-        if (category.parent_id && allowedParentIds.has(category.parent_id)) return true;
-        return allowedSlugs.has(category.slug);
+    let cancelled = false;
+    setSearching(true);
+    const timer = setTimeout(async () => {
+      const { data } = await getSupabase().rpc('search_listings', {
+        search_query: trimmed,
+        result_limit: RESULT_LIMIT,
+        synonyms: synonymsFor(terms),
+        root_category_slugs: [...CORE_DISCOVER_CATEGORY_SLUGS],
       });
+      if (cancelled) return;
+      setResults((data ?? []) as SearchResult[]);
+      setSearchedQuery(trimmed);
+      setSearching(false);
+    }, SEARCH_DEBOUNCE_MS);
 
-      setListings(filteredListings);
-    } finally {
-      setLoaded(true);
-    }
-  }, [loaded]);
-
-  useEffect(() => {
-    if (open && !loaded) {
-      loadListings();
-    }
-  }, [open, loaded, loadListings]);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [query]);
 
   useEffect(() => {
     if (open) {
@@ -171,19 +135,6 @@ export function GlobalSearch() {
     };
   }, [open]);
 
-  const results = useMemo(() => {
-    if (query.length < 2) return [];
-    const terms = query.toLowerCase().split(/\s+/).filter(t => t.length >= 2);
-    if (!terms.length) return [];
-
-    return listings
-      .map((listing) => ({ listing, score: scoreResult(listing, terms) }))
-      .filter(r => r.score > 0)
-      .sort((a, b) => b.score - a.score)
-      .slice(0, 8)
-      .map(r => r.listing);
-  }, [query, listings]);
-
   const handleClose = () => {
     setOpen(false);
     setQuery('');
@@ -238,7 +189,7 @@ export function GlobalSearch() {
         </div>
 
         <div className="flex-1 overflow-y-auto px-5 py-4">
-          {!loaded && query.length >= 2 && (
+          {searching && results.length === 0 && query.length >= 2 && (
             <div className="flex flex-col items-center justify-center py-16 gap-3">
               <Loader2 size={28} className="text-ocean-400 animate-spin" />
               <p className="text-[14px] text-muted-foreground">Searching...</p>
@@ -268,7 +219,7 @@ export function GlobalSearch() {
             </div>
           )}
 
-          {query.length >= 2 && loaded && results.length === 0 && (
+          {query.length >= 2 && !searching && searchedQuery && results.length === 0 && (
             <div className="flex flex-col items-center text-center py-12 gap-4">
               <div className="w-16 h-16 rounded-2xl bg-cream-200 flex items-center justify-center">
                 <Search size={28} className="text-muted-foreground" />
@@ -306,12 +257,11 @@ export function GlobalSearch() {
               </div>
               <div className="space-y-2">
                 {results.map((listing, i) => {
-                  const category = getListingCategory(listing.categories);
-                  const CatIcon = getCategoryIcon(category?.name ?? '');
+                  const CatIcon = getCategoryIcon(listing.category_name);
                   return (
                     <Link
-                      key={listing.id}
-                      href={`/discover/listing/${listing.id}`}
+                      key={listing.listing_id}
+                      href={`/discover/listing/${listing.listing_id}`}
                       onClick={handleClose}
                       className="flex items-center gap-3.5 p-3.5 rounded-xl bg-white border border-cream-200 hover:border-ocean-200 hover:shadow-md transition-all group"
                       style={{ animation: `fade-in 0.3s ease-out ${i * 0.04}s forwards`, opacity: 0 }}
@@ -333,7 +283,7 @@ export function GlobalSearch() {
                         </p>
                         <div className="flex items-center gap-2 mt-0.5 flex-wrap">
                           <span className="text-[13px] font-medium text-ocean-500 bg-ocean-50 px-2 py-0.5 rounded-full">
-                            {category?.name ?? 'Category'}
+                            {listing.category_name || 'Category'}
                           </span>
                           {listing.neighborhood && (
                             <span className="text-[13px] text-muted-foreground flex items-center gap-1">
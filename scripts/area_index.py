@@ -0,0 +1,184 @@
+"""
+Coordinate-based area assignment for the import/generator/geocoding scripts.
+
+`AreaIndex` answers "which Calvia area is this point in" in O(log n) using a
+2-d tree over area centroids (from the `areas` table). Optional GeoJSON
+polygons (`properties.slug` per feature) take precedence over the nearest
+centroid. Points further than `max_km` from every centroid and outside all
+polygons resolve to None so callers can treat them as out of scope.
+
+Address token matching stays in the callers and is only used when a row has
+no coordinates.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+
+EARTH_RADIUS_KM = 6371.0
+DEFAULT_MAX_KM = 4.0
+
+
+@dataclass(frozen=True)
+class AreaPoint:
+    slug: str
+    name: str
+    latitude: float
+    longitude: float
+
+
+@dataclass
+class _Node:
+    point: AreaPoint
+    xy: tuple[float, float]
+    axis: int
+    left: "_Node | None" = None
+    right: "_Node | None" = None
+
+
+@dataclass(frozen=True)
+class _Polygon:
+    slug: str
+    rings: list[list[tuple[float, float]]]
+    bbox: tuple[float, float, float, float]
+
+
+def has_coordinates(latitude: float | None, longitude: float | None) -> bool:
+    # The areas/businesses tables default missing coordinates to 0.
+    return latitude is not None and longitude is not None and not (latitude == 0 and longitude == 0)
+
+
+def point_in_ring(lon: float, lat: float, ring: list[tuple[float, float]]) -> bool:
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i]
+        xj, yj = ring[j]
+        if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class AreaIndex:
+    def __init__(self, points: Iterable[AreaPoint], max_km: float = DEFAULT_MAX_KM) -> None:
+        usable = [p for p in points if has_coordinates(p.latitude, p.longitude)]
+        self.max_km = max_km
+        self.by_slug = {p.slug: p for p in usable}
+        # Equirectangular projection around the centroid is accurate to metres at Calvia's scale.
+        self._ref_lat = math.radians(sum(p.latitude for p in usable) / len(usable)) if usable else 0.0
+        self._root = self._build([(p, self._project(p.latitude, p.longitude)) for p in usable], 0)
+        self._polygons: list[_Polygon] = []
+
+    def _project(self, latitude: float, longitude: float) -> tuple[float, float]:
+        return (
+            math.radians(longitude) * math.cos(self._ref_lat) * EARTH_RADIUS_KM,
+            math.radians(latitude) * EARTH_RADIUS_KM,
+        )
+
+    def _build(self, items: list[tuple[AreaPoint, tuple[float, float]]], depth: int) -> _Node | None:
+        if not items:
+            return None
+        axis = depth % 2
+        items.sort(key=lambda item: item[1][axis])
+        mid = len(items) // 2
+        node = _Node(point=items[mid][0], xy=items[mid][1], axis=axis)
+        node.left = self._build(items[:mid], depth + 1)
+        node.right = self._build(items[mid + 1 :], depth + 1)
+        return node
+
+    def load_polygons(self, path: Path) -> None:
+        """Load GeoJSON Polygon/MultiPolygon features keyed by `properties.slug`."""
+        data = json.loads(path.read_text(encoding="utf-8"))
+        for feature in data.get("features", []):
+            slug = (feature.get("properties") or {}).get("slug")
+            geometry = feature.get("geometry") or {}
+            if not slug:
+                continue
+            if geometry.get("type") == "Polygon":
+                polygons = [geometry["coordinates"]]
+            elif geometry.get("type") == "MultiPolygon":
+                polygons = geometry["coordinates"]
+            else:
+                continue
+            for coords in polygons:
+                rings = [[(float(x), float(y)) for x, y, *_ in ring] for ring in coords]
+                outer = rings[0]
+                bbox = (
+                    min(x for x, _ in outer),
+                    min(y for _, y in outer),
+                    max(x for x, _ in outer),
+                    max(y for _, y in outer),
+                )
+                self._polygons.append(_Polygon(slug=slug, rings=rings, bbox=bbox))
+
+    def _polygon_slug(self, latitude: float, longitude: float) -> str | None:
+        for polygon in self._polygons:
+            min_x, min_y, max_x, max_y = polygon.bbox
+            if not (min_x <= longitude <= max_x and min_y <= latitude <= max_y):
+                continue
+            outer, *holes = polygon.rings
+            if point_in_ring(longitude, latitude, outer) and not any(
+                point_in_ring(longitude, latitude, hole) for hole in holes
+            ):
+                return polygon.slug
+        return None
+
+    def nearest(self, latitude: float, longitude: float) -> tuple[AreaPoint, float] | None:
+        """Nearest area centroid and its distance in km."""
+        if self._root is None:
+            return None
+        target = self._project(latitude, longitude)
+        best: list[tuple[float, AreaPoint | None]] = [(math.inf, None)]
+
+        def visit(node: _Node | None) -> None:
+            if node is None:
+                return
+            dx = node.xy[0] - target[0]
+            dy = node.xy[1] - target[1]
+            dist_sq = dx * dx + dy * dy
+            if dist_sq < best[0][0]:
+                best[0] = (dist_sq, node.point)
+            diff = target[node.axis] - node.xy[node.axis]
+            near, far = (node.left, node.right) if diff < 0 else (node.right, node.left)
+            visit(near)
+            if diff * diff < best[0][0]:
+                visit(far)
+
+        visit(self._root)
+        dist_sq, point = best[0]
+        if point is None:
+            return None
+        return point, math.sqrt(dist_sq)
+
+    def resolve(self, latitude: float | None, longitude: float | None) -> AreaPoint | None:
+        """Area containing the point, or None when it has no coordinates or is outside every area."""
+        if not has_coordinates(latitude, longitude):
+            return None
+        assert latitude is not None and longitude is not None
+        slug = self._polygon_slug(latitude, longitude)
+        if slug and slug in self.by_slug:
+            return self.by_slug[slug]
+        match = self.nearest(latitude, longitude)
+        if match is None or match[1] > self.max_km:
+            return None
+        return match[0]
+
+
+def load_area_points(path: Path) -> list[AreaPoint]:
+    """Read area centroids from a JSON list of {slug, name, latitude, longitude} (an `areas` export)."""
+    data = json.loads(path.read_text(encoding="utf-8"))
+    return [
+        AreaPoint(
+            slug=item["slug"],
+            name=item["name"],
+            latitude=float(item.get("latitude") or 0),
+            longitude=float(item.get("longitude") or 0),
+        )
+        for item in data
+    ]
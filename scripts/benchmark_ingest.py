@@ -0,0 +1,761 @@
+#!/usr/bin/env python3
+"""
+Benchmark the ingest scripts against synthetic Calvia datasets.
+
+Timed stages per scale:
+- zip:  parse, evaluate, write-report, load + apply (import_zip_businesses)
+- json: parse, build (generate_businesses_migration)
+- sync: read, upsert (sync_businesses_to_listings)
+- digest: read, build, upsert (build_daily_digests), with as many deals
+  and events as rows spread over a year
+
+DB stages run inside a throwaway schema on a local Postgres that is dropped
+afterwards. Without --db-url only the in-memory stages are timed.
+Results are written as JSON so runs can be compared with --baseline.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import uuid
+import zipfile
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable
+from zoneinfo import ZoneInfo
+
+import psycopg
+from psycopg.rows import dict_row
+
+import build_daily_digests as digests
+import generate_businesses_migration as generator
+import import_zip_businesses as importer
+import sync_businesses_to_listings as sync
+
+
+BENCH_SCHEMA_PREFIX = "calvia_bench"
+SHEET_ROWS = 500
+DIGEST_START = date(2026, 3, 1)
+DIGEST_SPAN_DAYS = 365
+DIGEST_DAYS = 14
+
+BENCH_DDL = """
+CREATE TABLE categories (
+  id uuid PRIMARY KEY,
+  name text NOT NULL,
+  slug text UNIQUE NOT NULL,
+  description text DEFAULT '',
+  icon_name text DEFAULT 'folder',
+  sort_order integer DEFAULT 0,
+  display_order integer DEFAULT 0,
+  parent_id uuid,
+  created_at timestamptz DEFAULT now()
+);
+
+CREATE TABLE areas (
+  id uuid PRIMARY KEY,
+  name text UNIQUE NOT NULL,
+  slug text UNIQUE NOT NULL,
+  latitude double precision DEFAULT 0,
+  longitude double precision DEFAULT 0
+);
+
+CREATE TABLE businesses (
+  id uuid PRIMARY KEY,
+  name text NOT NULL,
+  slug text UNIQUE NOT NULL,
+  description text NOT NULL DEFAULT '',
+  category_id uuid NOT NULL REFERENCES categories(id),
+  area_id uuid NOT NULL REFERENCES areas(id),
+  phone text NOT NULL DEFAULT '',
+  email text NOT NULL DEFAULT '',
+  website text NOT NULL DEFAULT '',
+  address text NOT NULL DEFAULT '',
+  latitude double precision DEFAULT 0,
+  longitude double precision DEFAULT 0,
+  is_placeholder boolean DEFAULT true,
+  rating numeric,
+  notes text,
+  social_links jsonb DEFAULT '{}'::jsonb,
+  image_url text DEFAULT '',
+  view_count integer DEFAULT 0,
+  location_confidence text NOT NULL DEFAULT 'approximate',
+  needs_geocoding boolean NOT NULL DEFAULT false,
+  created_at timestamptz DEFAULT now()
+);
+
+CREATE TABLE listings (
+  id uuid PRIMARY KEY,
+  category_id uuid NOT NULL REFERENCES categories(id),
+  name text NOT NULL,
+  description text DEFAULT '',
+  image_url text DEFAULT '',
+  contact_phone text DEFAULT '',
+  contact_email text DEFAULT '',
+  website_url text DEFAULT '',
+  address text DEFAULT '',
+  neighborhood text,
+  social_media jsonb DEFAULT '{}'::jsonb,
+  tags text[] DEFAULT '{}',
+  is_featured boolean DEFAULT false,
+  created_at timestamptz DEFAULT now()
+);
+
+CREATE TABLE business_listing_map (
+  business_id uuid PRIMARY KEY REFERENCES businesses(id) ON DELETE CASCADE,
+  listing_id uuid UNIQUE NOT NULL REFERENCES listings(id) ON DELETE CASCADE,
+  created_at timestamptz DEFAULT now(),
+  updated_at timestamptz DEFAULT now()
+);
+
+CREATE TABLE category_listing_stats (
+  category_id uuid NOT NULL REFERENCES categories(id) ON DELETE CASCADE,
+  neighborhood text NOT NULL DEFAULT '',
+  listing_count integer NOT NULL DEFAULT 0,
+  updated_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (category_id, neighborhood)
+);
+
+-- Search projection without the trigram indexes; the sync refreshes it per batch.
+CREATE TABLE listing_search_index (
+  listing_id uuid PRIMARY KEY REFERENCES listings(id) ON DELETE CASCADE,
+  name text NOT NULL,
+  description text NOT NULL DEFAULT '',
+  tags text[] NOT NULL DEFAULT '{}',
+  neighborhood text NOT NULL DEFAULT '',
+  is_featured boolean NOT NULL DEFAULT false,
+  category_id uuid,
+  category_name text NOT NULL DEFAULT '',
+  category_slug text NOT NULL DEFAULT '',
+  category_parent_id uuid,
+  search_vector tsvector NOT NULL,
+  search_text text NOT NULL DEFAULT '',
+  refreshed_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION refresh_listing_search_index(listing_ids uuid[])
+RETURNS integer AS $$
+DECLARE
+  written integer;
+BEGIN
+  INSERT INTO listing_search_index (
+    listing_id,
+    name,
+    description,
+    tags,
+    neighborhood,
+    is_featured,
+    category_id,
+    category_name,
+    category_slug,
+    category_parent_id,
+    search_vector,
+    search_text,
+    refreshed_at
+  )
+  SELECT
+    l.id,
+    l.name,
+    COALESCE(l.description, ''),
+    COALESCE(l.tags, '{}'),
+    COALESCE(l.neighborhood, ''),
+    COALESCE(l.is_featured, false),
+    c.id,
+    COALESCE(c.name, ''),
+    COALESCE(c.slug, ''),
+    c.parent_id,
+    setweight(to_tsvector('simple', COALESCE(l.name, '')), 'A')
+      || setweight(to_tsvector('simple', COALESCE(c.name, '') || ' ' || array_to_string(COALESCE(l.tags, '{}'), ' ')), 'B')
+      || setweight(to_tsvector('simple', COALESCE(l.neighborhood, '')), 'C')
+      || setweight(to_tsvector('simple', COALESCE(l.description, '')), 'D'),
+    lower(concat_ws(' ', l.name, c.name, l.neighborhood, array_to_string(COALESCE(l.tags, '{}'), ' '))),
+    now()
+  FROM listings l
+  LEFT JOIN categories c ON c.id = l.category_id
+  WHERE l.id = ANY(listing_ids)
+  ON CONFLICT (listing_id) DO UPDATE SET
+    name = EXCLUDED.name,
+    description = EXCLUDED.description,
+    tags = EXCLUDED.tags,
+    neighborhood = EXCLUDED.neighborhood,
+    is_featured = EXCLUDED.is_featured,
+    category_id = EXCLUDED.category_id,
+    category_name = EXCLUDED.category_name,
+    category_slug = EXCLUDED.category_slug,
+    category_parent_id = EXCLUDED.category_parent_id,
+    search_vector = EXCLUDED.search_vector,
+    search_text = EXCLUDED.search_text,
+    refreshed_at = EXCLUDED.refreshed_at
+  WHERE (
+    listing_search_index.name,
+    listing_search_index.description,
+    listing_search_index.tags,
+    listing_search_index.neighborhood,
+    listing_search_index.is_featured,
+    listing_search_index.category_id,
+    listing_search_index.category_name,
+    listing_search_index.category_slug,
+    listing_search_index.category_parent_id
+  ) IS DISTINCT FROM (
+    EXCLUDED.name,
+    EXCLUDED.description,
+    EXCLUDED.tags,
+    EXCLUDED.neighborhood,
+    EXCLUDED.is_featured,
+    EXCLUDED.category_id,
+    EXCLUDED.category_name,
+    EXCLUDED.category_slug,
+    EXCLUDED.category_parent_id
+  );
+
+  GET DIAGNOSTICS written = ROW_COUNT;
+  RETURN written;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TABLE deals (
+  id uuid PRIMARY KEY,
+  listing_id uuid,
+  title text NOT NULL,
+  discount_text text DEFAULT '',
+  valid_until timestamptz,
+  is_active boolean DEFAULT true,
+  deal_date date,
+  is_premium_only boolean DEFAULT false,
+  created_at timestamptz DEFAULT now()
+);
+CREATE INDEX deals_deal_date_idx ON deals(deal_date) WHERE deal_date IS NOT NULL;
+
+CREATE TABLE events (
+  id uuid PRIMARY KEY,
+  title text NOT NULL,
+  location text DEFAULT '',
+  event_date timestamptz NOT NULL,
+  is_featured boolean DEFAULT false
+);
+CREATE INDEX events_date_idx ON events(event_date);
+
+CREATE TABLE daily_digests (
+  id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+  digest_date date UNIQUE NOT NULL,
+  news_items jsonb DEFAULT '[]',
+  featured_events jsonb DEFAULT '[]',
+  premium_deals jsonb DEFAULT '[]'
+);
+"""
+
+STREET_NAMES = [
+    "Carrer Major",
+    "Avinguda del Mar",
+    "Passeig des Born",
+    "Carrer de Sa Porrassa",
+    "Avinguda Rei Jaume I",
+    "Carrer Gran Via",
+    "Carrer des Pins",
+    "Ctra. Andratx",
+]
+
+NAME_WORDS = [
+    "Sol",
+    "Mar",
+    "Blau",
+    "Pins",
+    "Costa",
+    "Illa",
+    "Port",
+    "Brisa",
+    "Roca",
+    "Olivera",
+    "Marina",
+    "Llevant",
+]
+
+OUT_OF_SCOPE_TOWNS = ["Pollenca", "Manacor", "Inca"]
+
+
+@dataclass
+class Dataset:
+    categories: list[importer.Category]
+    areas: list[importer.Area]
+    existing: list[dict[str, Any]]
+    zip_path: Path
+    zip_rows: int
+    json_path: Path
+    json_rows: int
+    digest_inputs: digests.DigestInputs
+
+
+@dataclass
+class StageResult:
+    seconds: float
+    rows: int
+
+    def as_dict(self) -> dict[str, float | int]:
+        rate = self.rows / self.seconds if self.seconds > 0 else 0.0
+        return {"seconds": round(self.seconds, 6), "rows": self.rows, "rows_per_sec": round(rate, 1)}
+
+
+@dataclass
+class ScaleResult:
+    rows: int
+    stages: dict[str, StageResult] = field(default_factory=dict)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"rows": self.rows, "stages": {k: v.as_dict() for k, v in self.stages.items()}}
+
+
+def timed(result: ScaleResult, stage: str, fn: Callable[[], Any], rows: Callable[[Any], int]) -> Any:
+    started = time.perf_counter()
+    value = fn()
+    elapsed = time.perf_counter() - started
+    result.stages[stage] = StageResult(seconds=elapsed, rows=rows(value))
+    print(f"  {stage:<20} {elapsed:9.3f}s")
+    return value
+
+
+def bench_id(key: str) -> str:
+    return str(uuid.uuid5(importer.NAMESPACE_UUID, f"benchmark:{key}"))
+
+
+def build_categories() -> list[importer.Category]:
+    out: list[importer.Category] = []
+    for key, parent_id in sync.PARENT_BY_KEY.items():
+        out.append(importer.Category(parent_id, key.replace("_", "-"), sync.titleize_slug(key), None, 0))
+    parent_ids = list(sync.PARENT_BY_KEY.values())
+    for order, slug in enumerate(sorted(set(importer.CATEGORY_ALIAS_TO_SLUG.values()))):
+        out.append(importer.Category(bench_id(f"category:{slug}"), slug, sync.titleize_slug(slug), None, order))
+    for order, slug in enumerate(sorted(set(sync.SLUG_MAP.values()) - {c.slug for c in out})):
+        parent_id = parent_ids[order % len(parent_ids)]
+        out.append(importer.Category(bench_id(f"subcategory:{slug}"), slug, sync.titleize_slug(slug), parent_id, order))
+    return out
+
+
+def build_areas(rng: random.Random) -> list[importer.Area]:
+    return [
+        importer.Area(
+            id=bench_id(f"area:{slug}"),
+            slug=slug,
+            name=sync.titleize_slug(slug),
+            latitude=39.52 + rng.uniform(-0.06, 0.06),
+            longitude=2.52 + rng.uniform(-0.08, 0.08),
+        )
+        for slug in sorted(importer.ALLOWED_AREA_SLUGS)
+    ]
+
+
+def area_tokens() -> dict[str, str]:
+    tokens: dict[str, str] = {}
+    for token, slug in importer.AREA_TOKEN_TO_SLUG:
+        if slug in importer.ALLOWED_AREA_SLUGS:
+            tokens.setdefault(slug, token)
+    return tokens
+
+
+def fake_name(rng: random.Random, idx: int) -> str:
+    return f"{rng.choice(NAME_WORDS)} {rng.choice(NAME_WORDS)} {idx}"
+
+
+def fake_address(rng: random.Random, town: str) -> str:
+    return f"{rng.choice(STREET_NAMES)}, {rng.randint(1, 120)}, 07{rng.randint(100, 199)} {town.title()}"
+
+
+def build_existing(
+    rng: random.Random,
+    count: int,
+    categories: list[importer.Category],
+    areas: list[importer.Area],
+) -> list[dict[str, Any]]:
+    tokens = area_tokens()
+    leaf = [c for c in categories if c.slug in set(importer.CATEGORY_ALIAS_TO_SLUG.values())]
+    rows: list[dict[str, Any]] = []
+    for idx in range(count):
+        area = rng.choice(areas)
+        name = fake_name(rng, idx)
+        rows.append(
+            {
+                "id": bench_id(f"existing:{idx}"),
+                "slug": f"{importer.slugify(name)}-{idx}",
+                "name": name,
+                "address": fake_address(rng, tokens.get(area.slug, area.slug)),
+                "website": f"https://{importer.slugify(name)}.example" if idx % 3 else "",
+                "area_id": area.id,
+                "category_id": rng.choice(leaf).id,
+            }
+        )
+    return rows
+
+
+def build_zip_rows(rng: random.Random, count: int, existing: list[dict[str, Any]]) -> list[dict[str, str]]:
+    tokens = list(area_tokens().values())
+    aliases = sorted(importer.CATEGORY_ALIAS_TO_SLUG)
+    ambiguous = sorted(importer.AMBIGUOUS_CATEGORY_KEYS)
+    rows: list[dict[str, str]] = []
+    for idx in range(count):
+        roll = rng.random()
+        name = fake_name(rng, 1_000_000 + idx)
+        category = rng.choice(aliases)
+        address = fake_address(rng, rng.choice(tokens))
+        website = f"www.{importer.slugify(name)}.example" if rng.random() < 0.7 else ""
+        if roll < 0.03:
+            name = f"{name} (Repeat)"
+        elif roll < 0.06:
+            category = rng.choice(ambiguous)
+        elif roll < 0.08:
+            category = "Florist"
+        elif roll < 0.11:
+            address = fake_address(rng, rng.choice(OUT_OF_SCOPE_TOWNS))
+        elif roll < 0.13:
+            address = ""
+        elif roll < 0.20 and existing:
+            match = rng.choice(existing)
+            name, address = match["name"], match["address"]
+        elif roll < 0.24 and rows:
+            rows.append(dict(rows[-1]))
+            continue
+        rows.append(
+            {
+                "Name": name,
+                "Category": category.title(),
+                "Address": address,
+                "Contact": f"+34 971 {rng.randint(100, 999)} {rng.randint(100, 999)} info@{importer.slugify(name)}.example",
+                "Rating/Reviews": f"{rng.uniform(3.0, 5.0):.1f} ({rng.randint(1, 900)} reviews)",
+                "Website": website,
+                "Notes": "" if rng.random() < 0.5 else f"Synthetic benchmark row {idx}",
+            }
+        )
+    return rows
+
+
+def write_zip(path: Path, rows: list[dict[str, str]]) -> None:
+    columns = sorted(importer.REQUIRED_BUSINESS_COLUMNS)
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for sheet, start in enumerate(range(0, len(rows), SHEET_ROWS)):
+            buf = io.StringIO()
+            writer = csv.DictWriter(buf, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows[start : start + SHEET_ROWS])
+            zf.writestr(f"calvia_sheet_{sheet:04d}.csv", buf.getvalue())
+        # Excluded sheets should be skipped by the importer without being parsed.
+        zf.writestr("calvia_beaches.csv", "Name,Notes\nPlatja,Sand\n")
+
+
+def build_json_items(rng: random.Random, count: int) -> list[dict[str, Any]]:
+    categories = sorted(generator.CATEGORY_ID_MAP)
+    towns = [needle.title() for needle, _ in generator.NEIGHBORHOOD_MATCHES]
+    items: list[dict[str, Any]] = []
+    for idx in range(count):
+        roll = rng.random()
+        category = rng.choice(categories)
+        if roll < 0.05:
+            category = "Pets - Veterinary Clinic"
+        elif roll < 0.08:
+            category = "Shopping - Florist"
+        name = fake_name(rng, idx)
+        items.append(
+            {
+                "id": idx + 1,
+                "name": name,
+                "category": category,
+                "description": f"Synthetic {category} entry in Calvia.",
+                "address": fake_address(rng, rng.choice(towns)),
+                "phone": f"+34 971 {rng.randint(100, 999)} {rng.randint(100, 999)}",
+                "website": f"https://www.{importer.slugify(name)}.example",
+                "instagram": f"@{importer.slugify(name).replace('-', '_')}" if roll > 0.6 else None,
+            }
+        )
+    return items
+
+
+def build_digest_inputs(rng: random.Random, count: int) -> digests.DigestInputs:
+    span_start = datetime.combine(DIGEST_START, datetime.min.time(), tzinfo=ZoneInfo(digests.DEFAULT_TIMEZONE))
+    dated: list[digests.DigestDeal] = []
+    standing: list[digests.DigestDeal] = []
+    for idx in range(count):
+        day = DIGEST_START + timedelta(days=rng.randrange(DIGEST_SPAN_DAYS))
+        premium = rng.random() < 0.2
+        deal = digests.DigestDeal(
+            id=bench_id(f"deal:{idx}"),
+            title=f"{rng.choice(NAME_WORDS)} deal {idx}",
+            discount_text=f"{rng.choice((10, 15, 20, 25, 35))}% OFF",
+            deal_date=None if rng.random() < 0.05 else day,
+            is_premium_only=premium,
+            listing_id=None,
+            valid_until=span_start + timedelta(days=rng.randrange(30, DIGEST_SPAN_DAYS + 60)),
+        )
+        if deal.deal_date is not None:
+            dated.append(deal)
+        elif premium:
+            standing.append(deal)
+    events = [
+        digests.DigestEvent(
+            id=bench_id(f"event:{idx}"),
+            title=f"{rng.choice(NAME_WORDS)} event {idx}",
+            location=rng.choice(STREET_NAMES),
+            event_date=span_start + timedelta(minutes=rng.randrange(DIGEST_SPAN_DAYS * 24 * 60)),
+            is_featured=rng.random() < 0.1,
+        )
+        for idx in range(count)
+    ]
+    # Same order as the builder's queries return them.
+    dated.sort(key=lambda d: (d.deal_date, d.id))
+    events.sort(key=lambda e: (e.event_date, e.id))
+    return digests.DigestInputs(dated_deals=dated, standing_deals=standing, events=events)
+
+
+def build_dataset(workdir: Path, rows: int, seed: int) -> Dataset:
+    rng = random.Random(seed + rows)
+    categories = build_categories()
+    areas = build_areas(rng)
+    existing = build_existing(rng, max(rows // 4, 1), categories, areas)
+
+    zip_path = workdir / f"calvia_bench_{rows}.zip"
+    write_zip(zip_path, build_zip_rows(rng, rows, existing))
+
+    json_path = workdir / f"calvia_bench_{rows}.json"
+    json_path.write_text(json.dumps(build_json_items(rng, rows), ensure_ascii=False), encoding="utf-8")
+
+    return Dataset(
+        categories=categories,
+        areas=areas,
+        existing=existing,
+        zip_path=zip_path,
+        zip_rows=rows,
+        json_path=json_path,
+        json_rows=rows,
+        digest_inputs=build_digest_inputs(rng, rows),
+    )
+
+
+def reset_schema(conn: psycopg.Connection, schema: str) -> None:
+    conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    conn.execute(f"CREATE SCHEMA {schema}")
+    conn.execute(f"SET search_path TO {schema}")
+    conn.execute(BENCH_DDL)
+    conn.commit()
+
+
+def seed_schema(conn: psycopg.Connection, dataset: Dataset) -> None:
+    with conn.cursor() as cur:
+        with cur.copy("COPY categories (id, slug, name, parent_id, display_order, sort_order) FROM STDIN") as copy:
+            for c in dataset.categories:
+                copy.write_row((c.id, c.slug, c.name, c.parent_id, c.display_order, c.display_order))
+        with cur.copy("COPY areas (id, slug, name, latitude, longitude) FROM STDIN") as copy:
+            for a in dataset.areas:
+                copy.write_row((a.id, a.slug, a.name, a.latitude, a.longitude))
+        with cur.copy(
+            "COPY businesses (id, slug, name, address, website, area_id, category_id, is_placeholder) FROM STDIN"
+        ) as copy:
+            for r in dataset.existing:
+                copy.write_row(
+                    (r["id"], r["slug"], r["name"], r["address"], r["website"], r["area_id"], r["category_id"], False)
+                )
+        inputs = dataset.digest_inputs
+        with cur.copy(
+            "COPY deals (id, title, discount_text, deal_date, is_premium_only, listing_id, valid_until) FROM STDIN"
+        ) as copy:
+            for d in inputs.dated_deals + inputs.standing_deals:
+                copy.write_row(
+                    (d.id, d.title, d.discount_text, d.deal_date, d.is_premium_only, d.listing_id, d.valid_until)
+                )
+        with cur.copy("COPY events (id, title, location, event_date, is_featured) FROM STDIN") as copy:
+            for e in inputs.events:
+                copy.write_row((e.id, e.title, e.location, e.event_date, e.is_featured))
+    conn.commit()
+
+
+def bench_zip(result: ScaleResult, dataset: Dataset, reports_dir: Path, conn: psycopg.Connection | None) -> None:
+    if conn is not None:
+        categories_by_slug, areas_by_slug, existing_rows = timed(
+            result,
+            "zip.load",
+            lambda: (importer.load_categories(conn), importer.load_areas(conn), importer.read_existing_businesses(conn)),
+            lambda v: len(v[2]),
+        )
+    else:
+        categories_by_slug = {}
+        for c in dataset.categories:
+            categories_by_slug.setdefault(c.slug, []).append(c)
+        areas_by_slug = {a.slug: a for a in dataset.areas}
+        existing_rows = dataset.existing
+
+    source_rows = timed(
+        result,
+        "zip.parse",
+        lambda: list(importer.iter_zip_business_rows(dataset.zip_path)),
+        len,
+    )
+    evaluated = timed(
+        result,
+        "zip.evaluate",
+        lambda: importer.evaluate_rows(
+            source_rows, categories_by_slug, areas_by_slug, importer.existing_business_keys(existing_rows)
+        ),
+        len,
+    )
+    report = timed(
+        result,
+        "zip.write_report",
+        lambda: importer.write_reports(evaluated, reports_dir),
+        lambda r: sum(r.counts.values()),
+    )
+    insert_rows = report.insert_rows
+
+    if conn is not None:
+        def apply() -> tuple[int, int]:
+            applied = importer.apply_inserts(conn, insert_rows)
+            conn.commit()
+            return applied
+
+        timed(result, "zip.apply", apply, lambda v: v[0] + v[1])
+
+
+def bench_json(result: ScaleResult, dataset: Dataset) -> None:
+    data = timed(
+        result,
+        "json.parse",
+        lambda: json.loads(dataset.json_path.read_text(encoding="utf-8")),
+        len,
+    )
+    timed(result, "json.build", lambda: generator.build_value_rows(data), lambda v: len(v[0]))
+
+
+def bench_sync(result: ScaleResult, conn: psycopg.Connection) -> None:
+    categories_by_slug, businesses = timed(
+        result,
+        "sync.read",
+        lambda: (sync.load_categories(conn), sync.read_businesses(conn)),
+        lambda v: len(v[1]),
+    )
+    def upsert() -> tuple[int, int]:
+        synced = sync.sync_businesses(conn, categories_by_slug, businesses)
+        conn.commit()
+        return synced
+
+    timed(result, "sync.upsert", upsert, lambda v: v[0])
+
+
+def bench_digest(result: ScaleResult, dataset: Dataset, conn: psycopg.Connection | None) -> None:
+    options = digests.DigestOptions(start=DIGEST_START + timedelta(days=DIGEST_SPAN_DAYS // 2), days=DIGEST_DAYS)
+    if conn is not None:
+        inputs = timed(
+            result,
+            "digest.read",
+            lambda: digests.read_digest_inputs(conn, options),
+            lambda v: len(v.dated_deals) + len(v.events),
+        )
+    else:
+        inputs = dataset.digest_inputs
+    built = timed(result, "digest.build", lambda: digests.build_digests(inputs, options), len)
+
+    if conn is not None:
+        def upsert() -> int:
+            changed = digests.upsert_digests(conn, built)
+            conn.commit()
+            return changed
+
+        timed(result, "digest.upsert", upsert, lambda v: v)
+
+
+def run_scale(rows: int, seed: int, db_url: str, schema: str) -> ScaleResult:
+    result = ScaleResult(rows=rows)
+    print(f"Scale rows={rows}")
+    with tempfile.TemporaryDirectory(prefix="calvia-bench-") as tmp:
+        workdir = Path(tmp)
+        dataset = build_dataset(workdir, rows, seed)
+        reports_dir = workdir / "reports"
+
+        if not db_url:
+            bench_zip(result, dataset, reports_dir, None)
+            bench_json(result, dataset)
+            bench_digest(result, dataset, None)
+            return result
+
+        with psycopg.connect(db_url, row_factory=dict_row) as conn:
+            try:
+                reset_schema(conn, schema)
+                seed_schema(conn, dataset)
+                bench_zip(result, dataset, reports_dir, conn)
+                bench_json(result, dataset)
+                bench_sync(result, conn)
+                bench_digest(result, dataset, conn)
+            finally:
+                conn.rollback()
+                conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+                conn.commit()
+    return result
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any]) -> None:
+    base_by_rows = {s["rows"]: s["stages"] for s in baseline.get("scales", [])}
+    print("Comparison against baseline (seconds, +slower / -faster):")
+    for scale in current["scales"]:
+        base = base_by_rows.get(scale["rows"])
+        if not base:
+            continue
+        for stage, stats in scale["stages"].items():
+            prev = base.get(stage)
+            if not prev or not prev["seconds"]:
+                continue
+            delta = (stats["seconds"] - prev["seconds"]) / prev["seconds"] * 100
+            print(f"  rows={scale['rows']:<8} {stage:<20} {prev['seconds']:9.3f}s -> {stats['seconds']:9.3f}s ({delta:+.1f}%)")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark Calvia ingest scripts on synthetic data")
+    parser.add_argument(
+        "--db-url",
+        default=os.environ.get("CALVIA_BENCH_DB_URL", ""),
+        help="Local throwaway Postgres for DB stages (never point this at Supabase)",
+    )
+    parser.add_argument("--scales", default="1000,10000,100000", help="Comma-separated row counts")
+    parser.add_argument("--seed", type=int, default=20260220)
+    parser.add_argument(
+        "--output",
+        default=str(Path(__file__).resolve().parents[1] / "reports" / "benchmarks" / "ingest.json"),
+        help="Where to write JSON results",
+    )
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    if not scales:
+        raise SystemExit("No scales given.")
+    if not args.db_url:
+        print("No --db-url (or CALVIA_BENCH_DB_URL): skipping load/apply/sync and digest read/upsert stages.")
+
+    schema = f"{BENCH_SCHEMA_PREFIX}_{os.getpid()}"
+    results = [run_scale(rows, args.seed, args.db_url, schema) for rows in scales]
+    payload = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "db": bool(args.db_url),
+        "scales": [r.as_dict() for r in results],
+    }
+
+    out_path = Path(args.output).expanduser().resolve()
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(payload, indent=2) + "\n", encoding="utf-8")
+    print(f"Wrote results: {out_path}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).expanduser().read_text(encoding="utf-8"))
+        compare(payload, baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
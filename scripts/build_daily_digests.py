@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Precompute `daily_digests` rows from `deals` and `events`.
+
+Digests used to be seeded by hand (20260209121011_seed_daily_deals_and_digest_data.sql).
+This script builds `--days` digests starting at `--start` (default: today in
+`--timezone`) from three bulk queries, whatever the number of days:
+
+- deals dated inside the range (a range scan on `deals_deal_date_idx`)
+- standing premium-only deals without a date, still valid at the range start
+- events starting between the first day and `--event-window-days` after
+  the last (a range scan on `events_date_idx`)
+
+For each day, `premium_deals` lists that day's dated deals first (premium-only
+before the rest), then standing premium deals still valid that day, up to
+`--max-deals`. `featured_events` lists events starting within the window
+from that day, featured events first, then by start time, up to
+`--max-events`. All days are upserted in one statement in the same
+transaction as the reads; rows whose payload did not change are not
+rewritten. `news_items` and the weather columns have no source table, so
+they keep their current value (empty for new days).
+"""
+
+from __future__ import annotations
+
+import argparse
+import heapq
+import json
+import os
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Any
+from zoneinfo import ZoneInfo
+
+import psycopg
+
+from db_connection import open_pool, run_with_retry
+from stage_profiler import add_profile_argument, session, stage
+
+
+DEFAULT_DAYS = 7
+DEFAULT_EVENT_WINDOW_DAYS = 7
+DEFAULT_MAX_DEALS = 3
+DEFAULT_MAX_EVENTS = 3
+DEFAULT_TIMEZONE = "Europe/Madrid"
+
+DATED_DEALS_SQL = """
+SELECT id::text AS id, title, discount_text, deal_date, COALESCE(is_premium_only, false) AS is_premium_only,
+       listing_id::text AS listing_id, valid_until
+FROM deals
+WHERE deal_date BETWEEN %s AND %s
+  AND is_active
+ORDER BY deal_date, created_at, id
+"""
+
+STANDING_DEALS_SQL = """
+SELECT id::text AS id, title, discount_text, deal_date, true AS is_premium_only,
+       listing_id::text AS listing_id, valid_until
+FROM deals
+WHERE deal_date IS NULL
+  AND is_premium_only
+  AND is_active
+  AND (valid_until IS NULL OR valid_until >= %s)
+ORDER BY created_at, id
+"""
+
+EVENTS_SQL = """
+SELECT id::text AS id, title, location, event_date, COALESCE(is_featured, false) AS is_featured
+FROM events
+WHERE event_date >= %s AND event_date < %s
+ORDER BY event_date, id
+"""
+
+UPSERT_SQL = """
+INSERT INTO daily_digests AS d (digest_date, featured_events, premium_deals)
+SELECT v.digest_date, v.featured_events, v.premium_deals
+FROM unnest(%s::date[], %s::jsonb[], %s::jsonb[]) AS v(digest_date, featured_events, premium_deals)
+ON CONFLICT (digest_date) DO UPDATE SET
+  featured_events = EXCLUDED.featured_events,
+  premium_deals = EXCLUDED.premium_deals
+WHERE (d.featured_events, d.premium_deals) IS DISTINCT FROM (EXCLUDED.featured_events, EXCLUDED.premium_deals)
+"""
+
+
+@dataclass(frozen=True)
+class DigestDeal:
+    id: str
+    title: str
+    discount_text: str | None
+    deal_date: date | None
+    is_premium_only: bool
+    listing_id: str | None
+    valid_until: datetime | None
+
+
+@dataclass(frozen=True)
+class DigestEvent:
+    id: str
+    title: str
+    location: str | None
+    event_date: datetime
+    is_featured: bool
+
+
+@dataclass
+class DigestInputs:
+    dated_deals: list[DigestDeal]
+    standing_deals: list[DigestDeal]
+    events: list[DigestEvent]
+
+
+@dataclass
+class Digest:
+    digest_date: date
+    featured_events: list[dict[str, Any]]
+    premium_deals: list[dict[str, Any]]
+
+
+@dataclass(frozen=True)
+class DigestOptions:
+    start: date
+    days: int = DEFAULT_DAYS
+    event_window_days: int = DEFAULT_EVENT_WINDOW_DAYS
+    max_deals: int = DEFAULT_MAX_DEALS
+    max_events: int = DEFAULT_MAX_EVENTS
+    timezone: str = DEFAULT_TIMEZONE
+
+    @property
+    def dates(self) -> list[date]:
+        return [self.start + timedelta(days=n) for n in range(self.days)]
+
+    def day_start(self, day: date) -> datetime:
+        return datetime.combine(day, time.min, tzinfo=ZoneInfo(self.timezone))
+
+
+@stage("read_digest_inputs", rows=lambda result, *_: len(result.dated_deals) + len(result.events))
+def read_digest_inputs(conn: psycopg.Connection, options: DigestOptions) -> DigestInputs:
+    dates = options.dates
+    range_start = options.day_start(dates[0])
+    events_end = options.day_start(dates[-1] + timedelta(days=options.event_window_days))
+    return DigestInputs(
+        dated_deals=[DigestDeal(**r) for r in conn.execute(DATED_DEALS_SQL, (dates[0], dates[-1])).fetchall()],
+        standing_deals=[DigestDeal(**r) for r in conn.execute(STANDING_DEALS_SQL, (range_start,)).fetchall()],
+        events=[DigestEvent(**r) for r in conn.execute(EVENTS_SQL, (range_start, events_end)).fetchall()],
+    )
+
+
+def deal_payload(deal: DigestDeal, deal_of_the_day: bool) -> dict[str, Any]:
+    return {
+        "id": deal.id,
+        "title": deal.title,
+        "discount": deal.discount_text or "",
+        "listing_id": deal.listing_id,
+        "premium_only": deal.is_premium_only,
+        "deal_of_the_day": deal_of_the_day,
+    }
+
+
+def event_payload(event: DigestEvent, tz: ZoneInfo) -> dict[str, Any]:
+    local = event.event_date.astimezone(tz)
+    return {
+        "id": event.id,
+        "title": event.title,
+        "date": f"{local:%a %d %b, %H:%M}",
+        "starts_at": local.isoformat(),
+        "location": event.location or "",
+    }
+
+
+def valid_on(deal: DigestDeal, day_start: datetime) -> bool:
+    return deal.valid_until is None or deal.valid_until >= day_start
+
+
+@stage("build_digests", rows=lambda result, *_: len(result))
+def build_digests(inputs: DigestInputs, options: DigestOptions) -> list[Digest]:
+    tz = ZoneInfo(options.timezone)
+    dated_by_day: dict[date, list[DigestDeal]] = {}
+    for deal in inputs.dated_deals:
+        dated_by_day.setdefault(deal.deal_date, []).append(deal)
+    # Events arrive sorted by start, so each day's window is a slice found by bisection.
+    starts = [e.event_date for e in inputs.events]
+
+    digests: list[Digest] = []
+    for day in options.dates:
+        day_start = options.day_start(day)
+        dated = sorted(
+            (d for d in dated_by_day.get(day, []) if valid_on(d, day_start)),
+            key=lambda d: not d.is_premium_only,
+        )
+        deals = [deal_payload(d, True) for d in dated[: options.max_deals]]
+        for deal in inputs.standing_deals:
+            if len(deals) >= options.max_deals:
+                break
+            if valid_on(deal, day_start):
+                deals.append(deal_payload(deal, False))
+
+        lo = bisect_left(starts, day_start)
+        hi = bisect_left(starts, options.day_start(day + timedelta(days=options.event_window_days)))
+        picked = heapq.nsmallest(
+            options.max_events,
+            range(lo, hi),
+            key=lambda i: (not inputs.events[i].is_featured, i),
+        )
+        events = [event_payload(inputs.events[i], tz) for i in picked]
+        digests.append(Digest(day, events, deals))
+    return digests
+
+
+@stage("upsert_digests", rows=lambda result, *_: result)
+def upsert_digests(conn: psycopg.Connection, digests: list[Digest]) -> int:
+    """Upsert every digest in one statement; returns the number of rows inserted or changed."""
+    if not digests:
+        return 0
+    cur = conn.execute(
+        UPSERT_SQL,
+        (
+            [d.digest_date for d in digests],
+            [json.dumps(d.featured_events, ensure_ascii=False) for d in digests],
+            [json.dumps(d.premium_deals, ensure_ascii=False) for d in digests],
+        ),
+    )
+    return cur.rowcount
+
+
+def refresh_digests(conn: psycopg.Connection, options: DigestOptions, apply: bool) -> tuple[list[Digest], int]:
+    digests = build_digests(read_digest_inputs(conn, options), options)
+    return digests, upsert_digests(conn, digests) if apply else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Build daily_digests rows from deals and events")
+    parser.add_argument("--db-url", default=os.environ.get("CALVIA_DB_URL", ""))
+    parser.add_argument("--start", type=date.fromisoformat, help="First digest date, YYYY-MM-DD (default: today)")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="Number of days to build, starting at --start")
+    parser.add_argument(
+        "--event-window-days",
+        type=int,
+        default=DEFAULT_EVENT_WINDOW_DAYS,
+        help="A digest lists events starting within this many days of its date",
+    )
+    parser.add_argument("--max-deals", type=int, default=DEFAULT_MAX_DEALS)
+    parser.add_argument("--max-events", type=int, default=DEFAULT_MAX_EVENTS)
+    parser.add_argument("--timezone", default=DEFAULT_TIMEZONE, help="Time zone that defines a digest day")
+    parser.add_argument("--dry-run", action="store_true", help="Print the digests as JSON instead of writing them")
+    add_profile_argument(parser, "build_daily_digests")
+    args = parser.parse_args()
+
+    if not args.db_url:
+        raise SystemExit("Missing --db-url (or CALVIA_DB_URL).")
+    if args.days < 1:
+        raise SystemExit("--days must be at least 1.")
+
+    options = DigestOptions(
+        start=args.start or datetime.now(ZoneInfo(args.timezone)).date(),
+        days=args.days,
+        event_window_days=args.event_window_days,
+        max_deals=args.max_deals,
+        max_events=args.max_events,
+        timezone=args.timezone,
+    )
+    with session(args.profile), open_pool(args.db_url) as pool:
+        digests, changed = run_with_retry(
+            pool, lambda conn: refresh_digests(conn, options, not args.dry_run), label="build_daily_digests"
+        )
+
+    if args.dry_run:
+        payload = [
+            {
+                "digest_date": d.digest_date.isoformat(),
+                "featured_events": d.featured_events,
+                "premium_deals": d.premium_deals,
+            }
+            for d in digests
+        ]
+        print(json.dumps(payload, indent=2, ensure_ascii=False))
+        return 0
+    print(
+        f"Built {len(digests)} digests from {options.start.isoformat()}; "
+        f"{changed} inserted or changed, {len(digests) - changed} unchanged."
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Long-running change data capture consumer between `businesses` and `listings`.
+
+Triggers from 20260220000900_create_sync_outbox.sql enqueue changed row ids
+in `sync_outbox` and NOTIFY `calvia_sync_outbox`. This consumer wakes on the
+notification (or every `--poll-interval` seconds; Supabase pooler URLs
+cannot LISTEN, so they only poll), claims up to `--batch-size` events with
+`FOR UPDATE SKIP LOCKED` and applies them in the same transaction that
+deletes them, so a crash re-delivers the batch.
+
+- business changed -> listing upserted with the batch sync's own SQL
+- listing changed  -> mirrored columns copied back to its mapped business
+- conflict: when a business and its listing both changed, the later outbox
+  event wins (last writer wins) and the other side is overwritten. A listing
+  whose edit is still queued (newer, or claimed by another consumer) is never
+  overwritten, here or by the batch sync, so the copy back to its business
+  always reads the edited row
+- deletes are logged, never propagated; listings without a business mapping
+  (app-native listings) are ignored
+
+Writes are tagged with `calvia.cdc_origin` so they do not re-enqueue.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+import psycopg
+
+from db_connection import connection_kwargs, is_pooler_url, open_pool, run_with_retry
+from stage_profiler import add_profile_argument, session, stage
+from sync_businesses_to_listings import (
+    BUSINESSES_SQL,
+    CDC_ORIGIN_SQL,
+    CategoryRow,
+    load_categories,
+    merge_categories,
+    new_categories,
+    sync_businesses,
+)
+
+
+NOTIFY_CHANNEL = "calvia_sync_outbox"
+DEFAULT_CDC_BATCH_SIZE = 200
+DEFAULT_POLL_INTERVAL = 5.0
+
+CLAIM_SQL = """
+DELETE FROM sync_outbox
+WHERE id IN (
+  SELECT id
+  FROM sync_outbox
+  ORDER BY id
+  LIMIT %s
+  FOR UPDATE SKIP LOCKED
+)
+RETURNING id, source_table, row_id::text AS row_id, op, changed_at
+"""
+
+MAPPING_SQL = """
+SELECT business_id::text AS business_id, listing_id::text AS listing_id
+FROM business_listing_map
+WHERE business_id = ANY(%s::uuid[]) OR listing_id = ANY(%s::uuid[])
+"""
+
+LISTINGS_TO_BUSINESSES_SQL = """
+UPDATE businesses AS b
+SET name = l.name,
+    description = COALESCE(l.description, ''),
+    image_url = COALESCE(l.image_url, ''),
+    phone = COALESCE(l.contact_phone, ''),
+    email = COALESCE(l.contact_email, ''),
+    website = COALESCE(l.website_url, ''),
+    address = COALESCE(l.address, ''),
+    social_links = COALESCE(l.social_media, '{}'::jsonb)
+FROM business_listing_map m
+JOIN listings l ON l.id = m.listing_id
+WHERE m.listing_id = ANY(%s::uuid[])
+  AND b.id = m.business_id
+  AND (b.name, b.description, b.image_url, b.phone, b.email, b.website, b.address, b.social_links)
+      IS DISTINCT FROM (
+        l.name,
+        COALESCE(l.description, ''),
+        COALESCE(l.image_url, ''),
+        COALESCE(l.contact_phone, ''),
+        COALESCE(l.contact_email, ''),
+        COALESCE(l.website_url, ''),
+        COALESCE(l.address, ''),
+        COALESCE(l.social_media, '{}'::jsonb)
+      )
+"""
+
+
+@dataclass(frozen=True)
+class OutboxEvent:
+    id: int
+    source_table: str
+    row_id: str
+    op: str
+    changed_at: datetime
+
+
+@dataclass
+class ChangePlan:
+    business_ids: list[str] = field(default_factory=list)
+    listing_ids: list[str] = field(default_factory=list)
+    deletes: list[OutboxEvent] = field(default_factory=list)
+    superseded: int = 0
+    unmapped: int = 0
+
+
+@dataclass
+class BatchResult:
+    events: int = 0
+    to_listings: int = 0
+    to_businesses: int = 0
+    lag_seconds: float = 0.0
+    # Auto-created categories; cached by the caller once the batch has committed.
+    new_categories: dict[str, list[CategoryRow]] = field(default_factory=dict)
+
+
+def plan_changes(events: list[OutboxEvent], listing_to_business: dict[str, str]) -> ChangePlan:
+    """Collapse events to the last one per business/listing pair; later outbox ids win."""
+    latest: dict[str, OutboxEvent] = {}
+    plan = ChangePlan()
+    for event in sorted(events, key=lambda e: e.id):
+        if event.source_table == "businesses":
+            pair = event.row_id
+        else:
+            business_id = listing_to_business.get(event.row_id)
+            if business_id is None:
+                plan.unmapped += 1
+                continue
+            pair = business_id
+        if pair in latest:
+            plan.superseded += 1
+        latest[pair] = event
+
+    for event in latest.values():
+        if event.op == "DELETE":
+            plan.deletes.append(event)
+        elif event.source_table == "businesses":
+            plan.business_ids.append(event.row_id)
+        else:
+            plan.listing_ids.append(event.row_id)
+    return plan
+
+
+def claim_events(conn: psycopg.Connection, batch_size: int) -> list[OutboxEvent]:
+    rows = conn.execute(CLAIM_SQL, (batch_size,)).fetchall()
+    return [
+        OutboxEvent(
+            id=r["id"],
+            source_table=r["source_table"],
+            row_id=r["row_id"],
+            op=r["op"],
+            changed_at=r["changed_at"],
+        )
+        for r in rows
+    ]
+
+
+def load_listing_mapping(conn: psycopg.Connection, events: list[OutboxEvent]) -> dict[str, str]:
+    business_ids = [e.row_id for e in events if e.source_table == "businesses"]
+    listing_ids = [e.row_id for e in events if e.source_table == "listings"]
+    rows = conn.execute(MAPPING_SQL, (business_ids, listing_ids)).fetchall()
+    return {r["listing_id"]: r["business_id"] for r in rows}
+
+
+@stage("cdc_batch", rows=lambda result, *_: result.events)
+def process_batch(
+    conn: psycopg.Connection,
+    categories_by_slug: dict[str, list[CategoryRow]],
+    batch_size: int,
+    listing_stats: bool = True,
+) -> BatchResult:
+    conn.execute(CDC_ORIGIN_SQL, ("cdc_consumer",))
+    events = claim_events(conn, batch_size)
+    if not events:
+        return BatchResult()
+
+    plan = plan_changes(events, load_listing_mapping(conn, events))
+    result = BatchResult(events=len(events))
+    # Listing edits first: a business change for the same pair was superseded in plan_changes.
+    if plan.listing_ids:
+        result.to_businesses = conn.execute(LISTINGS_TO_BUSINESSES_SQL, (plan.listing_ids,)).rowcount
+    if plan.business_ids:
+        businesses = conn.execute(
+            BUSINESSES_SQL + "WHERE b.id = ANY(%s::uuid[])\nORDER BY b.id", (plan.business_ids,)
+        ).fetchall()
+        batch_categories = {slug: list(rows) for slug, rows in categories_by_slug.items()}
+        result.to_listings, _ = sync_businesses(
+            conn,
+            batch_categories,
+            businesses,
+            listing_stats=listing_stats,
+        )
+        result.new_categories = new_categories(categories_by_slug, batch_categories)
+    for event in plan.deletes:
+        print(f"Not propagating delete of {event.source_table} {event.row_id} (outbox id {event.id})")
+    oldest = min(e.changed_at for e in events)
+    result.lag_seconds = (datetime.now(timezone.utc) - oldest).total_seconds()
+    return result
+
+
+def wait_for_changes(listen_conn: psycopg.Connection | None, timeout: float) -> None:
+    if listen_conn is None:
+        time.sleep(timeout)
+        return
+    for _ in listen_conn.notifies(timeout=timeout, stop_after=1):
+        pass
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Apply businesses <-> listings changes from sync_outbox")
+    parser.add_argument("--db-url", default=os.environ.get("CALVIA_DB_URL", ""))
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_CDC_BATCH_SIZE, help="Outbox events per transaction")
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help="Seconds to wait for a notification before polling anyway",
+    )
+    parser.add_argument("--once", action="store_true", help="Drain the outbox and exit")
+    parser.add_argument(
+        "--listing-stats",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Maintain category_listing_stats for listings written by the consumer",
+    )
+    add_profile_argument(parser, "cdc_consumer")
+    args = parser.parse_args()
+
+    if not args.db_url:
+        raise SystemExit("Missing --db-url (or CALVIA_DB_URL).")
+
+    listen_conn: psycopg.Connection | None = None
+    if not args.once and not is_pooler_url(args.db_url):
+        listen_conn = psycopg.connect(args.db_url, autocommit=True, **connection_kwargs(args.db_url))
+        listen_conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+
+    try:
+        with session(args.profile), open_pool(args.db_url) as pool:
+            categories_by_slug = run_with_retry(pool, load_categories, label="load_categories")
+            while True:
+                result = run_with_retry(
+                    pool,
+                    lambda conn: process_batch(
+                        conn, categories_by_slug, args.batch_size, args.listing_stats
+                    ),
+                    label="cdc_batch",
+                )
+                merge_categories(categories_by_slug, result.new_categories)
+                if result.events:
+                    print(
+                        f"Applied {result.events} outbox events: "
+                        f"{result.to_listings} -> listings, {result.to_businesses} -> businesses "
+                        f"(lag {result.lag_seconds:.1f}s)"
+                    )
+                if result.events >= args.batch_size:
+                    continue
+                if args.once:
+                    return 0
+                wait_for_changes(listen_conn, args.poll_interval)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        if listen_conn is not None:
+            listen_conn.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
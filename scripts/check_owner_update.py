@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Check that a business owner can still update their own business.
+
+Every write to `businesses` fires `enqueue_sync_outbox()`, which inserts into
+the RLS-protected `sync_outbox`; an owner update only succeeds when that
+trigger runs as SECURITY DEFINER
+(20260220001300_enqueue_sync_outbox_as_definer.sql).
+
+The check picks one owned business (or `--business-id`), switches to the
+`authenticated` role with that owner's JWT claims, as PostgREST does, changes
+a mirrored column and verifies exactly one row was updated and one outbox
+event was queued. The transaction is always rolled back, so nothing is
+written. The connecting role must be able to `SET ROLE authenticated`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+
+import psycopg
+
+from db_connection import connection_kwargs
+
+
+OWNED_BUSINESS_SQL = """
+SELECT id::text AS id, owner_id::text AS owner_id
+FROM businesses
+WHERE owner_id IS NOT NULL AND (%s::uuid IS NULL OR id = %s::uuid)
+LIMIT 1
+"""
+
+CLAIMS_SQL = """
+SELECT set_config('request.jwt.claim.sub', %s, true), set_config('request.jwt.claims', %s, true)
+"""
+
+# A mirrored column must change, or the trigger returns before enqueueing.
+OWNER_UPDATE_SQL = "UPDATE businesses SET description = COALESCE(description, '') || ' ' WHERE id = %s::uuid"
+
+QUEUED_SQL = "SELECT count(*) AS queued FROM sync_outbox WHERE source_table = 'businesses' AND row_id = %s::uuid"
+
+
+def check_owner_update(conn: psycopg.Connection, business_id: str | None) -> str:
+    """Run the owner update and return a failure message, or '' when it passed."""
+    target = conn.execute(OWNED_BUSINESS_SQL, (business_id, business_id)).fetchone()
+    if target is None:
+        return "No owned business to check; pass --business-id of one with owner_id set."
+    before = conn.execute(QUEUED_SQL, (target["id"],)).fetchone()["queued"]
+    claims = json.dumps({"sub": target["owner_id"], "role": "authenticated"})
+    conn.execute(CLAIMS_SQL, (target["owner_id"], claims))
+    conn.execute("SET LOCAL ROLE authenticated")
+    try:
+        updated = conn.execute(OWNER_UPDATE_SQL, (target["id"],)).rowcount
+    except psycopg.Error as exc:
+        return f"Owner update of business {target['id']} failed: {exc}"
+    conn.execute("RESET ROLE")
+    if updated != 1:
+        return f"Owner update of business {target['id']} matched {updated} rows."
+    queued = conn.execute(QUEUED_SQL, (target["id"],)).fetchone()["queued"] - before
+    if queued != 1:
+        return f"Owner update of business {target['id']} queued {queued} outbox events."
+    print(f"Owner {target['owner_id']} updated business {target['id']}; 1 outbox event queued (rolled back).")
+    return ""
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Verify an owner can update their business (always rolled back)")
+    parser.add_argument("--db-url", default=os.environ.get("CALVIA_DB_URL", ""))
+    parser.add_argument("--business-id", help="Owned business to update (default: any owned business)")
+    args = parser.parse_args()
+
+    if not args.db_url:
+        raise SystemExit("Missing --db-url (or CALVIA_DB_URL).")
+
+    with psycopg.connect(args.db_url, **connection_kwargs(args.db_url)) as conn:
+        try:
+            failure = check_owner_update(conn, args.business_id)
+        finally:
+            conn.rollback()
+    if failure:
+        raise SystemExit(failure)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
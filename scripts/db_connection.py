@@ -0,0 +1,248 @@
+"""
+Pooled, retrying Postgres connections for the import/sync/migration scripts.
+
+- Supabase pooler URLs (PgBouncer transaction mode) get prepared statements
+  disabled, which the sync previously did by hand.
+- `run_with_retry` runs one unit of work in its own transaction and replays
+  it on a fresh pooled connection after transient disconnects/conflicts.
+- `run_batches` splits work at batch boundaries so a dropped connection only
+  replays the current batch instead of restarting from row zero.
+- Connections use `CountingCursor` so `--profile` can report round trips.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import sys
+import time
+from typing import Any, Awaitable, Callable, Sequence, TypeVar
+from urllib.parse import urlparse
+
+import psycopg
+from psycopg import errors
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+
+from stage_profiler import note_round_trip
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+DEFAULT_ATTEMPTS = 5
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 15.0
+DEFAULT_BATCH_SIZE = 500
+
+POOLER_HOST_SUFFIX = ".pooler.supabase.com"
+POOLER_PORTS = {6543}
+
+# Errors after which the same unit of work can safely be replayed.
+TRANSIENT_ERRORS: tuple[type[BaseException], ...] = (
+    psycopg.OperationalError,
+    psycopg.InterfaceError,
+    errors.SerializationFailure,
+    errors.DeadlockDetected,
+)
+
+
+class CountingCursor(psycopg.Cursor):
+    """Cursor that reports each statement it sends to the active profiler."""
+
+    def execute(self, query: Any, params: Any = None, **kwargs: Any) -> Any:
+        note_round_trip()
+        return super().execute(query, params, **kwargs)
+
+    def executemany(self, query: Any, params_seq: Any, **kwargs: Any) -> None:
+        note_round_trip()
+        return super().executemany(query, params_seq, **kwargs)
+
+    def copy(self, statement: Any, params: Any = None, **kwargs: Any) -> Any:
+        note_round_trip()
+        return super().copy(statement, params, **kwargs)
+
+
+class CountingAsyncCursor(psycopg.AsyncCursor):
+    """Async counterpart of `CountingCursor`."""
+
+    async def execute(self, query: Any, params: Any = None, **kwargs: Any) -> Any:
+        note_round_trip()
+        return await super().execute(query, params, **kwargs)
+
+    async def executemany(self, query: Any, params_seq: Any, **kwargs: Any) -> None:
+        note_round_trip()
+        return await super().executemany(query, params_seq, **kwargs)
+
+
+def is_pooler_url(db_url: str) -> bool:
+    parsed = urlparse(db_url)
+    host = (parsed.hostname or "").lower()
+    return host.endswith(POOLER_HOST_SUFFIX) or parsed.port in POOLER_PORTS
+
+
+def connection_kwargs(
+    db_url: str,
+    *,
+    row_factory: Any = dict_row,
+    cursor_factory: Any = CountingCursor,
+) -> dict[str, Any]:
+    kwargs: dict[str, Any] = {
+        "row_factory": row_factory,
+        "cursor_factory": cursor_factory,
+        # Detect half-open pooler connections instead of hanging on them.
+        "keepalives": 1,
+        "keepalives_idle": 30,
+        "keepalives_interval": 10,
+        "keepalives_count": 3,
+    }
+    if is_pooler_url(db_url):
+        # Supabase pooler (PgBouncer transaction mode) can reject prepared statements.
+        kwargs["prepare_threshold"] = None
+    return kwargs
+
+
+def open_pool(
+    db_url: str,
+    *,
+    row_factory: Any = dict_row,
+    min_size: int = 1,
+    max_size: int = 2,
+    timeout: float = 30.0,
+) -> ConnectionPool:
+    """Open a small pool; callers use it as a context manager so it closes on exit."""
+    return ConnectionPool(
+        db_url,
+        kwargs=connection_kwargs(db_url, row_factory=row_factory),
+        min_size=min_size,
+        max_size=max_size,
+        timeout=timeout,
+        check=ConnectionPool.check_connection,
+        open=True,
+    )
+
+
+def open_async_pool(
+    db_url: str,
+    *,
+    row_factory: Any = dict_row,
+    min_size: int = 1,
+    max_size: int = 4,
+    timeout: float = 30.0,
+) -> AsyncConnectionPool:
+    """Async counterpart of `open_pool`; open it with `async with`."""
+    return AsyncConnectionPool(
+        db_url,
+        kwargs=connection_kwargs(db_url, row_factory=row_factory, cursor_factory=CountingAsyncCursor),
+        min_size=min_size,
+        max_size=max_size,
+        timeout=timeout,
+        check=AsyncConnectionPool.check_connection,
+        open=False,
+    )
+
+
+def backoff_delay(attempt: int, base_delay: float = DEFAULT_BASE_DELAY, max_delay: float = DEFAULT_MAX_DELAY) -> float:
+    """Exponential backoff with full jitter for the given 1-based attempt."""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1))))
+
+
+def report_retry(label: str, exc: BaseException, attempt: int, attempts: int, delay: float) -> None:
+    what = f" {label}" if label else ""
+    print(
+        f"RETRY{what} after {type(exc).__name__}: {exc} "
+        f"(attempt {attempt}/{attempts}, sleeping {delay:.1f}s)",
+        file=sys.stderr,
+    )
+
+
+def run_with_retry(
+    pool: ConnectionPool,
+    fn: Callable[[psycopg.Connection], R],
+    *,
+    attempts: int = DEFAULT_ATTEMPTS,
+    base_delay: float = DEFAULT_BASE_DELAY,
+    label: str = "",
+) -> R:
+    """
+    Run `fn(conn)` and commit, retrying transient failures on a fresh connection.
+
+    `fn` must be safe to replay: everything it did in a failed attempt is
+    rolled back before the next one.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            with pool.connection() as conn:
+                result = fn(conn)
+                conn.commit()
+                return result
+        except TRANSIENT_ERRORS as exc:
+            if attempt >= attempts:
+                raise
+            delay = backoff_delay(attempt, base_delay)
+            report_retry(label, exc, attempt, attempts, delay)
+            time.sleep(delay)
+
+
+async def run_with_retry_async(
+    pool: AsyncConnectionPool,
+    fn: Callable[[psycopg.AsyncConnection], Awaitable[R]],
+    *,
+    attempts: int = DEFAULT_ATTEMPTS,
+    base_delay: float = DEFAULT_BASE_DELAY,
+    label: str = "",
+) -> R:
+    """Async counterpart of `run_with_retry`."""
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            async with pool.connection() as conn:
+                result = await fn(conn)
+                await conn.commit()
+                return result
+        except TRANSIENT_ERRORS as exc:
+            if attempt >= attempts:
+                raise
+            delay = backoff_delay(attempt, base_delay)
+            report_retry(label, exc, attempt, attempts, delay)
+            await asyncio.sleep(delay)
+
+
+def iter_batches(items: Sequence[T], batch_size: int) -> list[Sequence[T]]:
+    if batch_size <= 0:
+        return [items] if items else []
+    return [items[start : start + batch_size] for start in range(0, len(items), batch_size)]
+
+
+def run_batches(
+    pool: ConnectionPool,
+    items: Sequence[T],
+    fn: Callable[[psycopg.Connection, Sequence[T]], R],
+    *,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    attempts: int = DEFAULT_ATTEMPTS,
+    label: str = "batch",
+    on_commit: Callable[[R], None] | None = None,
+) -> list[R]:
+    """
+    Apply `fn` to each batch in its own retried transaction and return the per-batch results.
+
+    `on_commit` sees each result once its transaction has committed, before
+    the next batch starts; use it for caches that must not hold uncommitted rows.
+    """
+    batches = iter_batches(items, batch_size)
+    results: list[R] = []
+    for idx, batch in enumerate(batches, start=1):
+        result = run_with_retry(
+            pool,
+            lambda conn, batch=batch: fn(conn, batch),
+            attempts=attempts,
+            label=f"{label} {idx}/{len(batches)}",
+        )
+        if on_commit is not None:
+            on_commit(result)
+        results.append(result)
+    return results
@@ -0,0 +1,142 @@
+"""
+Compact set of dedupe keys for import_zip_businesses.evaluate_rows (`--compact-keys`).
+
+A Python set of string tuples costs a tuple object plus a hash-table slot per
+key, which adds up to gigabytes for hundreds of thousands of businesses.
+`FingerprintSet` keeps a 64-bit fingerprint (`hash(key)`) and a reference
+per key in sorted `array` columns, 12 bytes per key. The caller already
+holds the data the keys came from, so the full key is rebuilt with
+`key_of(ref)` only when a fingerprint matches, and membership stays exact.
+Fingerprints are only compared within one process, so hash randomization
+does not matter.
+
+`add()` supports the same `in`/`add` protocol as a set, so callers can pass
+either. With a `new_ref` callable, a key added after `build()` is recorded
+as fingerprint -> `new_ref()`. That callable must return where the key can
+be rebuilt, for example the row just appended. Keys added without
+`new_ref`, or whose fingerprint is already taken by a different key, are
+stored as they are.
+
+`PackedRecords` is the matching store for the data the keys come from: a
+read-only sequence of string records packed into one UTF-8 buffer plus an
+`array` of 32-bit end offsets, so 4 bytes per field on top of the text
+itself (the buffer is limited to 4 GiB). Records are rebuilt on access,
+which only happens on a fingerprint hit.
+"""
+
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from typing import Callable, Generic, Hashable, Iterable, Sequence, TypeVar
+
+
+K = TypeVar("K", bound=Hashable)
+R = TypeVar("R")
+
+
+class FingerprintSet(Generic[K]):
+    def __init__(self, key_of: Callable[[int], K], new_ref: Callable[[], int] | None = None) -> None:
+        self._key_of = key_of
+        self._new_ref = new_ref
+        self._fingerprints = array("q")
+        self._refs = array("i")
+        self._added: dict[int, int] = {}
+        self._exact: set[K] = set()
+
+    def build(self, keys: Iterable[tuple[K, int]]) -> FingerprintSet[K]:
+        """Replace the base entries with (key, ref) pairs; keys need not be unique."""
+        pairs = sorted((hash(key), ref) for key, ref in keys)
+        self._fingerprints = array("q", (fp for fp, _ in pairs))
+        self._refs = array("i", (ref for _, ref in pairs))
+        return self
+
+    def _in_base(self, fingerprint: int, key: K) -> bool:
+        fingerprints = self._fingerprints
+        i = bisect_left(fingerprints, fingerprint)
+        while i < len(fingerprints) and fingerprints[i] == fingerprint:
+            if self._key_of(self._refs[i]) == key:
+                return True
+            i += 1
+        return False
+
+    def _contains(self, fingerprint: int, key: K) -> bool:
+        ref = self._added.get(fingerprint)
+        if ref is not None and self._key_of(ref) == key:
+            return True
+        if self._in_base(fingerprint, key):
+            return True
+        return bool(self._exact) and key in self._exact
+
+    def __contains__(self, key: K) -> bool:
+        return self._contains(hash(key), key)
+
+    def add(self, key: K) -> None:
+        fingerprint = hash(key)
+        if self._contains(fingerprint, key):
+            return
+        if self._new_ref is None or fingerprint in self._added:
+            self._exact.add(key)
+        else:
+            self._added[fingerprint] = self._new_ref()
+
+
+class PackedRecords(Sequence[R]):
+    def __init__(
+        self,
+        make: Callable[..., R],
+        width: int,
+        records: Iterable[Sequence[str]] = (),
+        shared: Iterable[int] = (),
+    ) -> None:
+        """
+        `records` are `width` strings each; item i is rebuilt as `make(*fields)`.
+        Fields at the `shared` positions take few distinct values (area ids, for
+        example) and are stored once, referenced by index.
+        """
+        self._make = make
+        self._width = width
+        self._shared = frozenset(shared)
+        self._values: list[str] = []
+        value_ids: dict[str, int] = {}
+        data = bytearray()
+        self._ends = array("I")
+        self._value_refs = array("I")
+        for fields in records:
+            if len(fields) != width:
+                raise ValueError(f"Expected {width} fields, got {len(fields)}")
+            for position, value in enumerate(fields):
+                if position in self._shared:
+                    ref = value_ids.setdefault(value, len(self._values))
+                    if ref == len(self._values):
+                        self._values.append(value)
+                    self._value_refs.append(ref)
+                else:
+                    data += value.encode("utf-8")
+                    self._ends.append(len(data))
+        # bytes() drops the bytearray's growth headroom.
+        self._data = bytes(data)
+
+    def __len__(self) -> int:
+        return len(self._ends) // (self._width - len(self._shared))
+
+    def __getitem__(self, index: int) -> R:  # type: ignore[override]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        packed = self._width - len(self._shared)
+        end_at = index * packed
+        value_at = index * len(self._shared)
+        start = self._ends[end_at - 1] if end_at else 0
+        fields = []
+        for position in range(self._width):
+            if position in self._shared:
+                fields.append(self._values[self._value_refs[value_at]])
+                value_at += 1
+            else:
+                end = self._ends[end_at]
+                fields.append(self._data[start:end].decode("utf-8"))
+                start = end
+                end_at += 1
+        return self._make(*fields)
@@ -13,8 +13,13 @@ import json
 import uuid
 from pathlib import Path
 
+from area_index import AreaIndex, load_area_points
+from deterministic_ids import Uuid5Factory
+from stage_profiler import add_profile_argument, session, stage, timed_stage
+
 
 NAMESPACE_UUID = uuid.UUID("11111111-1111-1111-1111-111111111111")
+listing_uuid5 = Uuid5Factory(NAMESPACE_UUID)
 
 
 CATEGORY_ID_MAP: dict[str, str] = {
@@ -97,6 +102,15 @@ def infer_neighborhood(address: str | None) -> str:
     return "Calvia"
 
 
+def resolve_neighborhood(item: dict, area_index: AreaIndex | None) -> str:
+    """Nearest area for items with coordinates; address matching otherwise."""
+    if area_index is not None:
+        area = area_index.resolve(item.get("latitude"), item.get("longitude"))
+        if area is not None:
+            return area.name
+    return infer_neighborhood(item.get("address"))
+
+
 def instagram_to_social(instagram: str | None) -> dict:
     if not instagram:
         return {}
@@ -110,32 +124,8 @@ def instagram_to_social(instagram: str | None) -> dict:
     return {"instagram": val}
 
 
-def main() -> int:
-    ap = argparse.ArgumentParser()
-    ap.add_argument(
-        "--input",
-        default=str(Path(__file__).resolve().parents[1] / "calvia_businesses.json"),
-        help="Path to calvia_businesses.json",
-    )
-    ap.add_argument(
-        "--output",
-        default=str(
-            Path(__file__).resolve().parents[1]
-            / "supabase"
-            / "migrations"
-            / "20260214040200_import_calvia_businesses.sql"
-        ),
-        help="Path to output migration .sql file",
-    )
-    args = ap.parse_args()
-
-    in_path = Path(args.input).resolve()
-    out_path = Path(args.output).resolve()
-
-    data = json.loads(in_path.read_text(encoding="utf-8"))
-    if not isinstance(data, list):
-        raise SystemExit("Input JSON must be a list of objects")
-
+@stage("build_value_rows", rows=lambda result, *_: len(result[0]))
+def build_value_rows(data: list[dict], area_index: AreaIndex | None = None) -> tuple[list[str], int, int]:
     rows: list[str] = []
     skipped = 0
     unknown = 0
@@ -157,13 +147,13 @@ def main() -> int:
             unknown += 1
             continue
 
-        listing_id = uuid.uuid5(NAMESPACE_UUID, f"calvia_businesses:{src_id}:{name}")
+        listing_id = listing_uuid5(f"calvia_businesses:{src_id}:{name}")
 
         description = str(item.get("description") or "")
         phone = str(item.get("phone") or "")
         website = str(item.get("website") or "")
         address = str(item.get("address") or "")
-        neighborhood = infer_neighborhood(address)
+        neighborhood = resolve_neighborhood(item, area_index)
         social = instagram_to_social(item.get("instagram"))
         tags = TAG_MAP.get(category_id, [])
 
@@ -171,7 +161,7 @@ def main() -> int:
             "("
             + ", ".join(
                 [
-                    sql_quote(str(listing_id)),
+                    sql_quote(listing_id),
                     sql_quote(category_id),
                     sql_quote(name),
                     sql_quote(description),
@@ -187,6 +177,18 @@ def main() -> int:
             + ")"
         )
 
+    return rows, skipped, unknown
+
+
+def write_migration(in_path: Path, out_path: Path, area_index: AreaIndex | None = None) -> None:
+    with timed_stage("load_json") as loaded:
+        data = json.loads(in_path.read_text(encoding="utf-8"))
+        loaded.rows = len(data) if isinstance(data, list) else 0
+    if not isinstance(data, list):
+        raise SystemExit("Input JSON must be a list of objects")
+
+    rows, skipped, unknown = build_value_rows(data, area_index)
+
     header = f"""/*
   # Import calvia_businesses.json into listings
 
@@ -221,6 +223,40 @@ VALUES
     out_path.parent.mkdir(parents=True, exist_ok=True)
     out_path.write_text(header + body + footer, encoding="utf-8")
     print(f"Wrote {out_path} (rows={len(rows)}, skipped_pets={skipped}, unknown={unknown})")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--input",
+        default=str(Path(__file__).resolve().parents[1] / "calvia_businesses.json"),
+        help="Path to calvia_businesses.json",
+    )
+    ap.add_argument(
+        "--output",
+        default=str(
+            Path(__file__).resolve().parents[1]
+            / "supabase"
+            / "migrations"
+            / "20260214040200_import_calvia_businesses.sql"
+        ),
+        help="Path to output migration .sql file",
+    )
+    ap.add_argument(
+        "--areas",
+        help="Optional JSON export of the areas table (slug, name, latitude, longitude) "
+        "used for items that carry latitude/longitude",
+    )
+    add_profile_argument(ap, "generate_businesses_migration")
+    args = ap.parse_args()
+
+    in_path = Path(args.input).resolve()
+    out_path = Path(args.output).resolve()
+
+    area_index = AreaIndex(load_area_points(Path(args.areas).resolve())) if args.areas else None
+
+    with session(args.profile):
+        write_migration(in_path, out_path, area_index)
     return 0
 
 
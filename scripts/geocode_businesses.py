@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Offline batch geocoding for `businesses` rows flagged `needs_geocoding`.
+
+Imports store area-centroid coordinates with `location_confidence='area'`.
+This stage resolves addresses against a local gazetteer of Calvia streets on
+worker processes (no network) and writes improved coordinates back in
+committed chunks.
+
+Gazetteer: CSV with header
+  street,house_number,postcode,latitude,longitude
+`house_number` may be empty for street-level centroids.
+
+Match levels:
+- street + house number (+ postcode when given) -> 'exact', geocoding done
+- street (+ postcode) centroid                   -> 'approximate', stays flagged
+  so a richer gazetteer can upgrade it later
+Exact matches also move `area_id` to the area containing the point
+(area_index.py). Rows are never downgraded and unmatched rows are left
+untouched.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+import re
+from dataclasses import dataclass
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Any, Iterator
+
+import psycopg
+
+from db_connection import DEFAULT_BATCH_SIZE, open_pool, run_batches, run_with_retry
+from import_zip_businesses import Area, build_area_index, load_areas, normalize_text
+from stage_profiler import add_profile_argument, session, stage
+
+
+CONFIDENCE_RANK = {"area": 0, "approximate": 1, "exact": 2}
+
+STREET_TYPE_ALIASES = {
+    "c": "carrer",
+    "c/": "carrer",
+    "calle": "carrer",
+    "carrer": "carrer",
+    "av": "avinguda",
+    "avda": "avinguda",
+    "avenida": "avinguda",
+    "avinguda": "avinguda",
+    "pg": "passeig",
+    "paseo": "passeig",
+    "passeig": "passeig",
+    "ctra": "carretera",
+    "carretera": "carretera",
+    "pl": "placa",
+    "plaza": "placa",
+    "placa": "placa",
+    "cami": "cami",
+    "camino": "cami",
+    "urb": "urbanitzacio",
+    "urbanizacion": "urbanitzacio",
+    "urbanitzacio": "urbanitzacio",
+}
+
+POSTCODE_RE = re.compile(r"\b(07\d{3})\b")
+HOUSE_NUMBER_RE = re.compile(r"^(?:n[o.º]*\s*)?(\d{1,4})[a-z]?$")
+TRAILING_NUMBER_RE = re.compile(r"^(.*?)[\s,]+(?:n[o.º]*\s*)?(\d{1,4})[a-z]?$")
+
+
+@dataclass(frozen=True)
+class ParsedAddress:
+    street_key: str
+    house_number: str
+    postcode: str
+
+
+@dataclass(frozen=True)
+class Geocode:
+    business_id: str
+    latitude: float
+    longitude: float
+    confidence: str
+    area_id: str | None = None
+
+
+def street_key(street: str) -> str:
+    """Normalize a street name so 'Avda. Rei Jaume I' and 'Avinguda Rei Jaume I' collide."""
+    tokens = re.sub(r"[^a-z0-9/ ]+", " ", normalize_text(street)).split()
+    if not tokens:
+        return ""
+    street_type = STREET_TYPE_ALIASES.get(tokens[0])
+    rest = tokens[1:] if street_type else tokens
+    rest = [t for t in rest if t not in {"de", "del", "d", "des", "la", "el", "sa", "es", "s/n"}]
+    return " ".join(([street_type] if street_type else []) + rest)
+
+
+def parse_address(address: str) -> ParsedAddress | None:
+    parts = [p.strip() for p in (address or "").split(",") if p.strip()]
+    if not parts:
+        return None
+    postcode_match = POSTCODE_RE.search(address)
+    postcode = postcode_match.group(1) if postcode_match else ""
+
+    street = parts[0]
+    house_number = ""
+    trailing = TRAILING_NUMBER_RE.match(normalize_text(street))
+    if trailing:
+        street, house_number = trailing.group(1), trailing.group(2)
+    elif len(parts) > 1:
+        number_match = HOUSE_NUMBER_RE.match(normalize_text(parts[1]))
+        if number_match:
+            house_number = number_match.group(1)
+
+    key = street_key(street)
+    if not key:
+        return None
+    return ParsedAddress(street_key=key, house_number=house_number, postcode=postcode)
+
+
+class Gazetteer:
+    def __init__(self) -> None:
+        self.exact: dict[tuple[str, str, str], tuple[float, float]] = {}
+        self.exact_any_postcode: dict[tuple[str, str], tuple[float, float] | None] = {}
+        self.streets: dict[tuple[str, str], list[tuple[float, float]]] = {}
+        self.streets_any_postcode: dict[str, list[tuple[float, float]]] = {}
+
+    @classmethod
+    def load(cls, path: Path) -> "Gazetteer":
+        gazetteer = cls()
+        with path.open(newline="", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                key = street_key(row.get("street") or "")
+                if not key:
+                    continue
+                try:
+                    point = (float(row["latitude"]), float(row["longitude"]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+                gazetteer.add(key, (row.get("house_number") or "").strip(), (row.get("postcode") or "").strip(), point)
+        return gazetteer
+
+    def add(self, key: str, house_number: str, postcode: str, point: tuple[float, float]) -> None:
+        if house_number:
+            self.exact[(key, house_number, postcode)] = point
+            # Same street+number in two postcodes is ambiguous without a postcode.
+            previous = self.exact_any_postcode.get((key, house_number), point)
+            self.exact_any_postcode[(key, house_number)] = point if previous == point else None
+        self.streets.setdefault((key, postcode), []).append(point)
+        self.streets_any_postcode.setdefault(key, []).append(point)
+
+    def lookup(self, parsed: ParsedAddress) -> tuple[tuple[float, float], str] | None:
+        if parsed.house_number:
+            point = (
+                self.exact.get((parsed.street_key, parsed.house_number, parsed.postcode))
+                if parsed.postcode
+                else self.exact_any_postcode.get((parsed.street_key, parsed.house_number))
+            )
+            if point:
+                return point, "exact"
+        points = (
+            self.streets.get((parsed.street_key, parsed.postcode))
+            if parsed.postcode
+            else self.streets_any_postcode.get(parsed.street_key)
+        )
+        if points:
+            return centroid(points), "approximate"
+        return None
+
+
+def centroid(points: list[tuple[float, float]]) -> tuple[float, float]:
+    return (sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points))
+
+
+_worker_gazetteer: Gazetteer | None = None
+
+
+def init_worker(gazetteer_path: str) -> None:
+    global _worker_gazetteer
+    _worker_gazetteer = Gazetteer.load(Path(gazetteer_path))
+
+
+def geocode_chunk(rows: list[tuple[str, str, str]]) -> list[Geocode]:
+    """Worker entry point: rows are (business_id, address, current_confidence)."""
+    assert _worker_gazetteer is not None
+    out: list[Geocode] = []
+    for business_id, address, current in rows:
+        parsed = parse_address(address)
+        if parsed is None:
+            continue
+        match = _worker_gazetteer.lookup(parsed)
+        if match is None:
+            continue
+        (latitude, longitude), confidence = match
+        if CONFIDENCE_RANK[confidence] <= CONFIDENCE_RANK.get(current, 0):
+            continue
+        out.append(Geocode(business_id, latitude, longitude, confidence))
+    return out
+
+
+@stage("read_geocoding_page")
+def read_geocoding_page(conn: psycopg.Connection, after_id: str | None, limit: int) -> list[tuple[str, str, str]]:
+    rows = conn.execute(
+        """
+        SELECT id::text AS id, address, location_confidence
+        FROM businesses
+        WHERE needs_geocoding
+          AND address <> ''
+          AND (%s::uuid IS NULL OR id > %s::uuid)
+        ORDER BY id
+        LIMIT %s
+        """,
+        (after_id, after_id, limit),
+    ).fetchall()
+    return [(r["id"], r["address"], r["location_confidence"]) for r in rows]
+
+
+@stage("write_geocodes")
+def write_geocodes(conn: psycopg.Connection, geocodes: list[Geocode]) -> list[Geocode]:
+    conn.execute(
+        """
+        UPDATE businesses AS b
+        SET latitude = v.latitude,
+            longitude = v.longitude,
+            location_confidence = v.confidence,
+            needs_geocoding = v.confidence <> 'exact',
+            area_id = COALESCE(v.area_id, b.area_id)
+        FROM unnest(%s::uuid[], %s::float8[], %s::float8[], %s::text[], %s::uuid[])
+          AS v(id, latitude, longitude, confidence, area_id)
+        WHERE b.id = v.id
+          AND b.needs_geocoding
+        """,
+        (
+            [g.business_id for g in geocodes],
+            [g.latitude for g in geocodes],
+            [g.longitude for g in geocodes],
+            [g.confidence for g in geocodes],
+            [g.area_id for g in geocodes],
+        ),
+    )
+    return geocodes
+
+
+def assign_areas(geocodes: list[Geocode], areas_by_slug: dict[str, Area]) -> list[Geocode]:
+    """Re-derive area_id from exact coordinates; street centroids are too coarse to move a business."""
+    area_index = build_area_index(areas_by_slug)
+    out: list[Geocode] = []
+    for g in geocodes:
+        area = area_index.resolve(g.latitude, g.longitude) if g.confidence == "exact" else None
+        area_id = areas_by_slug[area.slug].id if area else None
+        out.append(Geocode(g.business_id, g.latitude, g.longitude, g.confidence, area_id))
+    return out
+
+
+def iter_pages(pool: Any, page_size: int) -> Iterator[list[tuple[str, str, str]]]:
+    after_id: str | None = None
+    while True:
+        rows = run_with_retry(
+            pool,
+            lambda conn, after_id=after_id: read_geocoding_page(conn, after_id, page_size),
+            label="read_geocoding_page",
+        )
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1][0]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Geocode needs_geocoding businesses from a local gazetteer")
+    parser.add_argument("--db-url", default=os.environ.get("CALVIA_DB_URL", ""))
+    parser.add_argument("--gazetteer", required=True, help="CSV of Calvia streets (see module docstring)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--page-size", type=int, default=5000, help="needs_geocoding rows read per query")
+    parser.add_argument("--chunk-size", type=int, default=250, help="Addresses per worker task")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Updates per committed chunk")
+    parser.add_argument("--dry-run", action="store_true", help="Resolve and report without writing")
+    add_profile_argument(parser, "geocode_businesses")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    if not args.db_url:
+        raise SystemExit("Missing --db-url (or CALVIA_DB_URL).")
+    gazetteer_path = Path(args.gazetteer).expanduser().resolve()
+    if not gazetteer_path.exists():
+        raise SystemExit(f"Gazetteer not found: {gazetteer_path}")
+
+    scanned = 0
+    counts = {"exact": 0, "approximate": 0}
+    with session(args.profile), open_pool(args.db_url) as pool, Pool(
+        processes=max(1, args.workers),
+        initializer=init_worker,
+        initargs=(str(gazetteer_path),),
+    ) as workers:
+        areas_by_slug = run_with_retry(pool, load_areas, label="load_areas")
+        for page in iter_pages(pool, args.page_size):
+            scanned += len(page)
+            chunks = [page[i : i + args.chunk_size] for i in range(0, len(page), args.chunk_size)]
+            geocodes = [g for chunk in workers.imap(geocode_chunk, chunks) for g in chunk]
+            geocodes = assign_areas(geocodes, areas_by_slug)
+            for g in geocodes:
+                counts[g.confidence] += 1
+            if geocodes and not args.dry_run:
+                run_batches(pool, geocodes, write_geocodes, batch_size=args.batch_size, label="geocode")
+
+    verb = "Would update" if args.dry_run else "Updated"
+    print(
+        f"Scanned {scanned} needs_geocoding businesses. "
+        f"{verb}: exact={counts['exact']}, approximate={counts['approximate']}, "
+        f"unmatched={scanned - counts['exact'] - counts['approximate']}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,297 @@
+"""
+Diff mode for import_zip_businesses.py (`--diff`).
+
+Each applied run stores a fingerprint index next to its reports: one entry
+per source row keyed by a 64-bit hash of normalized name/address/website,
+holding a hash of the row's content and the business it produced. The next
+run classifies its rows against that index:
+
+- unchanged: same key and content -> skipped, never evaluated
+- modified:  same key, new content, known business -> targeted UPDATE of
+             contacts, rating, notes, category, area and coordinates
+- added:     new key, or a previous row without a business -> evaluated
+- removed:   key missing from this ZIP -> reported only, never deleted
+
+Only rows that ended as INSERT or SKIP_DUPLICATE are recorded, so HOLD rows
+are re-evaluated every run (a category or area may have been added since).
+Likewise a modified row whose category or area no longer resolves gets only
+its contact fields updated and keeps its old fingerprint, so it is retried
+instead of being recorded as applied.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Sequence
+
+import psycopg
+
+from area_index import AreaIndex, has_coordinates
+from import_zip_businesses import (
+    ALLOWED_AREA_SLUGS,
+    AMBIGUOUS_CATEGORY_KEYS,
+    CATEGORY_ALIAS_TO_SLUG,
+    Area,
+    Category,
+    EvaluatedRow,
+    SourceRow,
+    build_notes,
+    extract_email,
+    extract_phone,
+    normalize_category_key,
+    normalize_for_key,
+    normalize_website,
+    parse_rating,
+    pick_category,
+    resolve_row_area_slug,
+    website_for_storage,
+)
+from report_writers import open_report_writer
+from stage_profiler import stage
+
+
+INDEX_VERSION = 1
+RECORDED_ACTIONS = frozenset({"INSERT", "SKIP_DUPLICATE"})
+CONTENT_FIELDS = (
+    "name",
+    "category_raw",
+    "address",
+    "contact",
+    "rating_reviews",
+    "website",
+    "notes",
+    "latitude",
+    "longitude",
+)
+
+
+@dataclass(frozen=True)
+class IndexEntry:
+    fingerprint: str
+    business_id: str
+    name: str
+
+
+@dataclass
+class FingerprintIndex:
+    run_id: str = ""
+    zip_sha256: str = ""
+    entries: dict[str, IndexEntry] = field(default_factory=dict)
+
+
+@dataclass
+class ModifiedRow:
+    source: SourceRow
+    entry: IndexEntry
+    category: Category | None = None
+    area: Area | None = None
+
+    @property
+    def placed(self) -> bool:
+        return self.category is not None and self.area is not None
+
+
+@dataclass
+class ImportDiff:
+    added: list[SourceRow] = field(default_factory=list)
+    modified: list[ModifiedRow] = field(default_factory=list)
+    unchanged: list[tuple[SourceRow, IndexEntry]] = field(default_factory=list)
+    removed: list[tuple[str, IndexEntry]] = field(default_factory=list)
+
+    def counts(self) -> dict[str, int]:
+        return {
+            "added": len(self.added),
+            "modified": len(self.modified),
+            "unchanged": len(self.unchanged),
+            "removed": len(self.removed),
+        }
+
+
+def _hash64(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def row_key(src: SourceRow) -> str:
+    return _hash64(
+        "\x1f".join((normalize_for_key(src.name), normalize_for_key(src.address), normalize_website(src.website)))
+    )
+
+
+def content_fingerprint(src: SourceRow) -> str:
+    # Row position is excluded so re-sorted sheets do not look modified.
+    return _hash64("\x1f".join(str(getattr(src, name)) for name in CONTENT_FIELDS))
+
+
+def load_index(path: Path) -> FingerprintIndex:
+    if not path.exists():
+        return FingerprintIndex()
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    if payload.get("version") != INDEX_VERSION:
+        raise SystemExit(f"Unsupported fingerprint index version in {path}; delete it to start over.")
+    return FingerprintIndex(
+        run_id=payload["run_id"],
+        zip_sha256=payload["zip_sha256"],
+        entries={key: IndexEntry(*value) for key, value in payload["rows"].items()},
+    )
+
+
+def write_index(path: Path, index: FingerprintIndex) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "version": INDEX_VERSION,
+        "run_id": index.run_id,
+        "zip_sha256": index.zip_sha256,
+        "rows": {
+            key: [entry.fingerprint, entry.business_id, entry.name] for key, entry in index.entries.items()
+        },
+    }
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps(payload, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    tmp_path.replace(path)
+
+
+@stage("diff_rows", rows=lambda _result, rows, *_: len(rows))
+def diff_rows(source_rows: Sequence[SourceRow], previous: FingerprintIndex) -> ImportDiff:
+    diff = ImportDiff()
+    seen: set[str] = set()
+    for src in source_rows:
+        key = row_key(src)
+        seen.add(key)
+        entry = previous.entries.get(key)
+        if entry is None:
+            diff.added.append(src)
+        elif entry.fingerprint == content_fingerprint(src):
+            diff.unchanged.append((src, entry))
+        elif entry.business_id:
+            diff.modified.append(ModifiedRow(src, entry))
+        else:
+            diff.added.append(src)
+    diff.removed = [(key, entry) for key, entry in previous.entries.items() if key not in seen]
+    return diff
+
+
+def next_index(
+    run_id: str,
+    zip_sha256: str,
+    diff: ImportDiff,
+    evaluated: Iterable[EvaluatedRow],
+) -> FingerprintIndex:
+    """Index for this run: carried-over entries plus every evaluated row with a final outcome."""
+    index = FingerprintIndex(run_id=run_id, zip_sha256=zip_sha256)
+    for src, entry in diff.unchanged:
+        index.entries.setdefault(row_key(src), entry)
+    for row in diff.modified:
+        # Unplaced rows were only partly applied; the old fingerprint flags them again next run.
+        fingerprint = content_fingerprint(row.source) if row.placed else row.entry.fingerprint
+        index.entries.setdefault(
+            row_key(row.source), IndexEntry(fingerprint, row.entry.business_id, row.source.name)
+        )
+    for row in evaluated:
+        if row.action not in RECORDED_ACTIONS:
+            continue
+        index.entries.setdefault(
+            row_key(row.source),
+            IndexEntry(content_fingerprint(row.source), row.business_id, row.source.name),
+        )
+    return index
+
+
+def write_removed_report(reports_dir: Path, removed: list[tuple[str, IndexEntry]], fmt: str = "csv") -> None:
+    writer = open_report_writer(reports_dir / "zip_import_removed", ["row_key", "name", "business_id"], fmt)
+    try:
+        for key, entry in removed:
+            writer.write((key, entry.name, entry.business_id))
+    finally:
+        writer.close()
+    print(f"Wrote report: {writer.path}")
+
+
+@stage("place_modified", rows=lambda _result, rows, *_: len(rows))
+def place_modified(
+    rows: Sequence[ModifiedRow],
+    categories_by_slug: dict[str, list[Category]],
+    areas_by_slug: dict[str, Area],
+    area_index: AreaIndex,
+) -> None:
+    """Resolve category and area for modified rows the way evaluate_rows does; unresolved rows stay unplaced."""
+    for row in rows:
+        src = row.source
+        category_key = normalize_category_key(src.category_raw)
+        mapped_slug = CATEGORY_ALIAS_TO_SLUG.get(category_key)
+        if category_key in AMBIGUOUS_CATEGORY_KEYS or not mapped_slug:
+            continue
+        area_slug = resolve_row_area_slug(src, area_index)
+        if area_slug not in ALLOWED_AREA_SLUGS:
+            continue
+        category = pick_category(categories_by_slug, mapped_slug)
+        area = areas_by_slug.get(area_slug)
+        if category and area:
+            row.category, row.area = category, area
+
+
+def source_coordinate(row: ModifiedRow, value: float | None) -> float | None:
+    """`value` when the row is placed and has source coordinates, else None (keep the stored one)."""
+    if row.placed and has_coordinates(row.source.latitude, row.source.longitude):
+        return value
+    return None
+
+
+@stage("apply_updates", rows=lambda result, *_: result)
+def apply_updates(conn: psycopg.Connection, rows: Sequence[ModifiedRow]) -> int:
+    """
+    Refresh source-derived columns of already imported businesses; returns rows
+    updated. Category, area and coordinates change only for placed rows, and
+    geocoded ('exact') coordinates are never overwritten.
+    """
+    if not rows:
+        return 0
+    cur = conn.execute(
+        """
+        UPDATE businesses AS b
+        SET phone = v.phone,
+            email = v.email,
+            website = v.website,
+            rating = v.rating,
+            notes = v.notes,
+            description = COALESCE(NULLIF(v.source_notes, ''), b.description),
+            category_id = COALESCE(v.category_id, b.category_id),
+            area_id = COALESCE(v.area_id, b.area_id),
+            latitude = CASE WHEN v.move THEN v.latitude ELSE b.latitude END,
+            longitude = CASE WHEN v.move THEN v.longitude ELSE b.longitude END,
+            location_confidence = CASE WHEN v.move THEN 'approximate' ELSE b.location_confidence END,
+            needs_geocoding = CASE WHEN v.move THEN false ELSE b.needs_geocoding END
+        FROM (
+          SELECT u.*, b2.location_confidence IS DISTINCT FROM 'exact' AND u.latitude IS NOT NULL AS move
+          FROM unnest(
+            %s::uuid[], %s::text[], %s::text[], %s::text[], %s::numeric[], %s::text[], %s::text[],
+            %s::uuid[], %s::uuid[], %s::float8[], %s::float8[]
+          ) AS u(id, phone, email, website, rating, notes, source_notes, category_id, area_id, latitude, longitude)
+          JOIN businesses b2 ON b2.id = u.id
+        ) AS v
+        WHERE b.id = v.id
+          AND (b.phone, b.email, b.website, b.rating, b.notes, b.category_id, b.area_id, b.latitude, b.longitude)
+              IS DISTINCT FROM (
+                v.phone, v.email, v.website, v.rating, v.notes,
+                COALESCE(v.category_id, b.category_id), COALESCE(v.area_id, b.area_id),
+                CASE WHEN v.move THEN v.latitude ELSE b.latitude END,
+                CASE WHEN v.move THEN v.longitude ELSE b.longitude END
+              )
+        """,
+        (
+            [row.entry.business_id for row in rows],
+            [extract_phone(row.source.contact) for row in rows],
+            [extract_email(row.source.contact) for row in rows],
+            [website_for_storage(row.source.website) for row in rows],
+            [parse_rating(row.source.rating_reviews) for row in rows],
+            [build_notes(row.source) for row in rows],
+            [row.source.notes.strip() for row in rows],
+            [row.category.id if row.category else None for row in rows],
+            [row.area.id if row.area else None for row in rows],
+            [source_coordinate(row, row.source.latitude) for row in rows],
+            [source_coordinate(row, row.source.longitude) for row in rows],
+        ),
+    )
+    return cur.rowcount
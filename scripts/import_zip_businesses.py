@@ -6,29 +6,44 @@ Design goals:
 - deterministic IDs/slugs
 - conservative dedupe
 - Calvia-focused area filtering
-- dry-run report before apply
+- dry-run report before apply (offline from a taxonomy snapshot with --snapshot)
+- checkpointed, resumable apply
 """
 
 from __future__ import annotations
 
 import argparse
 import csv
+import hashlib
 import io
+import json
 import os
 import re
 import unicodedata
 import uuid
 import zipfile
-from dataclasses import dataclass
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass, fields, replace
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Sequence
 from urllib.parse import urlparse
 
 import psycopg
-from psycopg.rows import dict_row
+
+from psycopg_pool import ConnectionPool
+
+from area_index import AreaIndex, AreaPoint, has_coordinates
+from db_connection import DEFAULT_BATCH_SIZE, open_pool, run_batches, run_with_retry
+from deterministic_ids import Uuid5Factory
+from fingerprint_set import FingerprintSet, PackedRecords
+from job_locks import add_lock_argument, lock_categories, metrics as lock_metrics
+from report_writers import REPORT_FORMATS, open_report_writer
+from stage_profiler import add_profile_argument, session, stage
 
 
 NAMESPACE_UUID = uuid.UUID("11111111-1111-1111-1111-111111111111")
+business_uuid5 = Uuid5Factory(NAMESPACE_UUID)
 
 REQUIRED_BUSINESS_COLUMNS = {
     "Name",
@@ -176,6 +191,8 @@ class SourceRow:
     rating_reviews: str
     website: str
     notes: str
+    latitude: float | None = None
+    longitude: float | None = None
 
 
 @dataclass
@@ -272,6 +289,7 @@ def normalize_category_key(value: str) -> str:
     return v
 
 
+@stage("load_categories", rows=lambda result, *_: sum(len(v) for v in result.values()))
 def load_categories(conn: psycopg.Connection) -> dict[str, list[Category]]:
     rows = conn.execute(
         """
@@ -309,6 +327,7 @@ def pick_category(categories_by_slug: dict[str, list[Category]], slug: str) -> C
     return sorted(candidates, key=lambda c: (c.display_order, c.name))[0]
 
 
+@stage("load_areas")
 def load_areas(conn: psycopg.Connection) -> dict[str, Area]:
     rows = conn.execute(
         """
@@ -329,6 +348,20 @@ def load_areas(conn: psycopg.Connection) -> dict[str, Area]:
     }
 
 
+def build_area_index(areas_by_slug: dict[str, Area], polygons_path: Path | None = None) -> AreaIndex:
+    index = AreaIndex(AreaPoint(a.slug, a.name, a.latitude, a.longitude) for a in areas_by_slug.values())
+    if polygons_path:
+        index.load_polygons(polygons_path)
+    return index
+
+
+def parse_coordinate(value: str | None) -> float | None:
+    try:
+        return float((value or "").strip().replace(",", "."))
+    except ValueError:
+        return None
+
+
 def resolve_area_slug(address: str) -> str | None:
     text = normalize_text(address)
     if not text:
@@ -339,6 +372,24 @@ def resolve_area_slug(address: str) -> str | None:
     return None
 
 
+def resolve_row_area_slug(src: SourceRow, area_index: AreaIndex) -> str | None:
+    """
+    Spatial lookup for rows with coordinates, then address tokens. A located
+    row that neither resolves is out of scope, unless no area has usable
+    coordinates (centroids default to 0/0), in which case the index proves nothing.
+    """
+    located = has_coordinates(src.latitude, src.longitude)
+    if located:
+        area = area_index.resolve(src.latitude, src.longitude)
+        if area:
+            return area.slug
+    slug = resolve_area_slug(src.address)
+    if slug is None and located and area_index.by_slug:
+        return "out-of-scope"
+    return slug
+
+
+@stage("iter_zip_business_rows")
 def iter_zip_business_rows(zip_path: Path) -> Iterable[SourceRow]:
     with zipfile.ZipFile(zip_path) as zf:
         for member in sorted(zf.namelist()):
@@ -363,9 +414,12 @@ def iter_zip_business_rows(zip_path: Path) -> Iterable[SourceRow]:
                     rating_reviews=(row.get("Rating/Reviews") or "").strip(),
                     website=(row.get("Website") or "").strip(),
                     notes=(row.get("Notes") or "").strip(),
+                    latitude=parse_coordinate(row.get("Latitude")),
+                    longitude=parse_coordinate(row.get("Longitude")),
                 )
 
 
+@stage("read_existing_businesses")
 def read_existing_businesses(conn: psycopg.Connection) -> list[dict]:
     return conn.execute(
         """
@@ -381,51 +435,192 @@ def read_existing_businesses(conn: psycopg.Connection) -> list[dict]:
     ).fetchall()
 
 
+@dataclass(frozen=True, slots=True)
+class BusinessKey:
+    """Normalized dedupe keys of one existing business; all evaluate_rows needs from it."""
+
+    name: str
+    address: str
+    area_id: str
+    website: str
+    slug: str
+
+
+def business_key_fields(r: dict) -> tuple[str, str, str, str, str]:
+    """BusinessKey fields, in declaration order, of one `read_existing_businesses` row."""
+    return (
+        normalize_for_key(r["name"]),
+        normalize_for_key(r.get("address") or ""),
+        r.get("area_id") or "",
+        normalize_website(r.get("website") or ""),
+        normalize_text(r["slug"]) if r.get("slug") else "",
+    )
+
+
+def existing_business_keys(existing_rows: Iterable[dict], compact: bool = False) -> Sequence[BusinessKey]:
+    """With `compact`, keys are packed (`--compact-keys`) and rebuilt only when read."""
+    if compact:
+        return pack_business_keys(business_key_fields(r) for r in existing_rows)
+    return [BusinessKey(*business_key_fields(r)) for r in existing_rows]
+
+
+def pack_business_keys(rows: Iterable[Sequence[str]]) -> PackedRecords[BusinessKey]:
+    # Position 2 is area_id: one of a few dozen areas.
+    return PackedRecords(BusinessKey, len(fields(BusinessKey)), rows, shared=(2,))
+
+
 def build_description(source: SourceRow, category: Category, area: Area) -> str:
     if source.notes:
         return source.notes
     return f"{category.name} in {area.name}, Calvia."
 
 
-def choose_business_slug(base_name: str, area_slug: str, business_id: str, used: set[str]) -> str:
+def build_notes(source: SourceRow) -> str:
+    notes_parts = [
+        source.notes.strip(),
+        f"Imported from {source.source_file}:{source.source_row}",
+    ]
+    if source.rating_reviews.strip():
+        notes_parts.append(f"Source rating/reviews: {source.rating_reviews.strip()}")
+    return " | ".join(part for part in notes_parts if part)
+
+
+def slug_candidates(base_name: str, area_slug: str, business_id: str) -> tuple[str, str, str]:
+    """Slugs to try in order: name, name+area, name+id prefix."""
     base = slugify(base_name) or "business"
+    return base, f"{base}-{area_slug}", f"{base}-{business_id.split('-')[0]}"
+
+
+def choose_business_slug(base_name: str, area_slug: str, business_id: str, used: set[str]) -> str:
+    """Provisional slug for reports/plans; --apply reserves the final one (reserve_slugs)."""
+    base, with_area, fallback = slug_candidates(base_name, area_slug, business_id)
     if base not in used:
         used.add(base)
         return base
 
-    with_area = f"{base}-{area_slug}"
     if with_area not in used:
         used.add(with_area)
         return with_area
 
-    fallback = f"{base}-{business_id.split('-')[0]}"
     used.add(fallback)
     return fallback
 
 
+RESERVE_SLUGS_SQL = """
+SELECT business_id::text AS business_id, slug
+FROM reserve_business_slugs(%s::uuid[], %s::text[], %s::text[], %s::text[])
+"""
+
+
+@stage("reserve_slugs", rows=lambda result, *_: len(result))
+def reserve_slugs(conn: psycopg.Connection, rows: Sequence[EvaluatedRow]) -> list[EvaluatedRow]:
+    """Reserve final slugs for a batch in one round trip (migration 20260220000800)."""
+    if not rows:
+        return []
+    candidates = [
+        slug_candidates(row.source.name, row.area.slug if row.area else "", row.business_id) for row in rows
+    ]
+    reserved = {
+        r["business_id"]: r["slug"]
+        for r in conn.execute(
+            RESERVE_SLUGS_SQL,
+            (
+                [row.business_id for row in rows],
+                [c[0] for c in candidates],
+                [c[1] for c in candidates],
+                [c[2] for c in candidates],
+            ),
+        ).fetchall()
+    }
+    return [replace(row, business_slug=reserved[row.business_id]) for row in rows]
+
+
+def compact_key_sets(
+    existing_keys: Sequence[BusinessKey],
+    evaluated: list[EvaluatedRow],
+) -> tuple[FingerprintSet, FingerprintSet, FingerprintSet, FingerprintSet, FingerprintSet]:
+    """
+    evaluate_rows' dedupe sets as FingerprintSets. Refs below len(existing_keys)
+    point into `existing_keys`; the rest point at INSERT rows in `evaluated`.
+    """
+    base = len(existing_keys)
+
+    def key_at(ref: int) -> BusinessKey:
+        if ref < base:
+            return existing_keys[ref]
+        row = evaluated[ref - base]
+        return BusinessKey(
+            name=normalize_for_key(row.source.name),
+            address=normalize_for_key(row.source.address),
+            area_id=row.area.id,
+            website=normalize_website(row.source.website),
+            slug=row.business_slug,
+        )
+
+    def zip_key_at(ref: int) -> tuple[str, str, str, str, str]:
+        key = key_at(ref)
+        return (key.name, key.address, key.website, evaluated[ref - base].category.id, key.area_id)
+
+    def name_addr(ref: int) -> tuple[str, str]:
+        key = key_at(ref)
+        return (key.name, key.address)
+
+    def name_area(ref: int) -> tuple[str, str]:
+        key = key_at(ref)
+        return (key.name, key.area_id)
+
+    def name_area_web(ref: int) -> tuple[str, str, str]:
+        key = key_at(ref)
+        return (key.name, key.area_id, key.website)
+
+    def last_row() -> int:
+        return base + len(evaluated) - 1
+
+    # Each pass rebuilds every key once; with packed keys nothing else is kept per business.
+    return (
+        FingerprintSet(name_addr, last_row).build(((k.name, k.address), i) for i, k in enumerate(existing_keys)),
+        FingerprintSet(name_area, last_row).build(((k.name, k.area_id), i) for i, k in enumerate(existing_keys)),
+        FingerprintSet(name_area_web, last_row).build(
+            ((k.name, k.area_id, k.website), i) for i, k in enumerate(existing_keys)
+        ),
+        FingerprintSet(zip_key_at, last_row),
+        # Chosen slugs are added before their row exists, so they are kept exactly.
+        FingerprintSet(lambda ref: key_at(ref).slug).build((k.slug, i) for i, k in enumerate(existing_keys) if k.slug),
+    )
+
+
+@stage("evaluate_rows")
 def evaluate_rows(
     source_rows: Iterable[SourceRow],
     categories_by_slug: dict[str, list[Category]],
     areas_by_slug: dict[str, Area],
-    existing_rows: list[dict],
+    existing_keys: Sequence[BusinessKey],
+    area_index: AreaIndex | None = None,
+    compact_keys: bool = False,
 ) -> list[EvaluatedRow]:
-    existing_name_addr = {
-        (normalize_for_key(r["name"]), normalize_for_key(r.get("address") or ""))
-        for r in existing_rows
-    }
-    existing_name_area_web: set[tuple[str, str, str]] = set()
-    existing_name_area: set[tuple[str, str]] = set()
-    used_slugs = {normalize_text(r["slug"]) for r in existing_rows if r.get("slug")}
-
-    for row in existing_rows:
-        name_key = normalize_for_key(row["name"])
-        area_id = row.get("area_id") or ""
-        website_key = normalize_website(row.get("website") or "")
-        existing_name_area.add((name_key, area_id))
-        existing_name_area_web.add((name_key, area_id, website_key))
-
-    seen_zip_keys: set[tuple[str, str, str, str, str]] = set()
+    if area_index is None:
+        area_index = build_area_index(areas_by_slug)
+
     evaluated: list[EvaluatedRow] = []
+    if compact_keys:
+        (
+            existing_name_addr,
+            existing_name_area,
+            existing_name_area_web,
+            seen_zip_keys,
+            used_slugs,
+        ) = compact_key_sets(existing_keys, evaluated)
+    else:
+        existing_name_addr = {(k.name, k.address) for k in existing_keys}
+        existing_name_area_web = set()
+        existing_name_area = set()
+        used_slugs = {k.slug for k in existing_keys if k.slug}
+
+        for key in existing_keys:
+            existing_name_area.add((key.name, key.area_id))
+            existing_name_area_web.add((key.name, key.area_id, key.website))
+
+        seen_zip_keys = set()
 
     for src in source_rows:
         if not src.name:
@@ -469,7 +664,7 @@ def evaluate_rows(
             )
             continue
 
-        area_slug = resolve_area_slug(src.address)
+        area_slug = resolve_row_area_slug(src, area_index)
         if not area_slug:
             evaluated.append(
                 EvaluatedRow(
@@ -567,14 +762,8 @@ def evaluate_rows(
                 )
             )
             continue
-        seen_zip_keys.add(zip_key)
 
-        business_id = str(
-            uuid.uuid5(
-                NAMESPACE_UUID,
-                f"zip-business:{name_key}:{addr_key}:{website_key}:{category.id}:{area.id}",
-            )
-        )
+        business_id = business_uuid5(f"zip-business:{name_key}:{addr_key}:{website_key}:{category.id}:{area.id}")
         business_slug = choose_business_slug(src.name, area.slug, business_id, used_slugs)
 
         evaluated.append(
@@ -589,6 +778,8 @@ def evaluate_rows(
             )
         )
 
+        # Added after the append: compact sets record the new row as the key's source.
+        seen_zip_keys.add(zip_key)
         existing_name_addr.add((name_key, addr_key))
         existing_name_area.add((name_key, area.id))
         existing_name_area_web.add((name_key, area.id, website_key))
@@ -596,30 +787,53 @@ def evaluate_rows(
     return evaluated
 
 
-def write_report(path: Path, rows: list[EvaluatedRow]) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS)
-        writer.writeheader()
+def report_values(row: EvaluatedRow) -> tuple[object, ...]:
+    """One report line in REPORT_COLUMNS order."""
+    return (
+        row.source.source_file,
+        row.source.source_row,
+        row.source.name,
+        row.source.category_raw,
+        row.source.address,
+        row.source.website,
+        row.category.slug if row.category else "",
+        row.area.slug if row.area else "",
+        row.action,
+        row.reason,
+        row.business_id,
+        row.business_slug,
+    )
+
+
+@dataclass
+class ReportSummary:
+    counts: dict[str, int]
+    insert_rows: list[EvaluatedRow]
+    paths: list[Path]
+
+
+@stage("write_reports", rows=lambda _result, rows, *_: len(rows))
+def write_reports(rows: Iterable[EvaluatedRow], reports_dir: Path, fmt: str = "csv") -> ReportSummary:
+    """Write candidate/skipped reports and count actions in a single pass over `rows`."""
+    counts: dict[str, int] = {}
+    insert_rows: list[EvaluatedRow] = []
+    with ExitStack() as stack:
+        int_columns = frozenset({"source_row"})
+        candidates = open_report_writer(reports_dir / "zip_import_candidates", REPORT_COLUMNS, fmt, int_columns)
+        stack.callback(candidates.close)
+        skipped = open_report_writer(reports_dir / "zip_import_skipped_or_hold", REPORT_COLUMNS, fmt, int_columns)
+        stack.callback(skipped.close)
         for row in rows:
-            writer.writerow(
-                {
-                    "source_file": row.source.source_file,
-                    "source_row": row.source.source_row,
-                    "name": row.source.name,
-                    "category_raw": row.source.category_raw,
-                    "address": row.source.address,
-                    "website": row.source.website,
-                    "category_slug": row.category.slug if row.category else "",
-                    "area_slug": row.area.slug if row.area else "",
-                    "action": row.action,
-                    "reason": row.reason,
-                    "business_id": row.business_id,
-                    "business_slug": row.business_slug,
-                }
-            )
+            counts[row.action] = counts.get(row.action, 0) + 1
+            if row.action == "INSERT":
+                insert_rows.append(row)
+                candidates.write(report_values(row))
+            else:
+                skipped.write(report_values(row))
+    return ReportSummary(counts=counts, insert_rows=insert_rows, paths=[candidates.path, skipped.path])
 
 
+@stage("apply_inserts", rows=lambda result, *_: sum(result))
 def apply_inserts(conn: psycopg.Connection, rows: list[EvaluatedRow]) -> tuple[int, int]:
     inserted = 0
     conflicts = 0
@@ -633,13 +847,13 @@ def apply_inserts(conn: psycopg.Connection, rows: list[EvaluatedRow]) -> tuple[i
         email = extract_email(src.contact)
         rating = parse_rating(src.rating_reviews)
         website = website_for_storage(src.website)
-        notes_parts = [
-            src.notes.strip(),
-            f"Imported from {src.source_file}:{src.source_row}",
-        ]
-        if src.rating_reviews.strip():
-            notes_parts.append(f"Source rating/reviews: {src.rating_reviews.strip()}")
-        notes = " | ".join(part for part in notes_parts if part)
+        notes = build_notes(src)
+        # Source coordinates beat the area centroid but still are not a verified address.
+        has_source_coordinates = has_coordinates(src.latitude, src.longitude)
+        if has_source_coordinates:
+            latitude, longitude, location_confidence = src.latitude, src.longitude, "approximate"
+        else:
+            latitude, longitude, location_confidence = row.area.latitude, row.area.longitude, "area"
 
         with conn.cursor() as cur:
             cur.execute(
@@ -666,7 +880,7 @@ def apply_inserts(conn: psycopg.Connection, rows: list[EvaluatedRow]) -> tuple[i
                 )
                 VALUES (
                   %s, %s, %s, %s, %s::uuid, %s::uuid, %s, %s, %s, %s,
-                  %s, %s, false, %s, %s, '{}'::jsonb, 'area', true
+                  %s, %s, false, %s, %s, '{}'::jsonb, %s, %s
                 )
                 ON CONFLICT (slug) DO NOTHING
                 RETURNING id
@@ -682,24 +896,174 @@ def apply_inserts(conn: psycopg.Connection, rows: list[EvaluatedRow]) -> tuple[i
                     email,
                     website,
                     src.address,
-                    row.area.latitude,
-                    row.area.longitude,
+                    latitude,
+                    longitude,
                     rating,
                     notes,
+                    location_confidence,
+                    not has_source_coordinates,
                 ),
             )
             if cur.fetchone():
                 inserted += 1
             else:
                 conflicts += 1
-    conn.commit()
     return inserted, conflicts
 
 
-def print_summary(rows: list[EvaluatedRow]) -> None:
-    counts: dict[str, int] = {}
-    for row in rows:
-        counts[row.action] = counts.get(row.action, 0) + 1
+@dataclass
+class ImportPlan:
+    run_id: str
+    zip_sha256: str
+    rows: list[EvaluatedRow]
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_plan(path: Path, plan: ImportPlan) -> None:
+    """Persist the evaluated INSERT rows so --resume never has to re-evaluate."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "run_id": plan.run_id,
+        "zip_sha256": plan.zip_sha256,
+        "rows": [
+            {
+                "source": asdict(row.source),
+                "category": asdict(row.category) if row.category else None,
+                "area": asdict(row.area) if row.area else None,
+                "business_id": row.business_id,
+                "business_slug": row.business_slug,
+            }
+            for row in plan.rows
+        ],
+    }
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+    tmp_path.replace(path)
+
+
+def read_plan(path: Path) -> ImportPlan:
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    rows = [
+        EvaluatedRow(
+            source=SourceRow(**item["source"]),
+            action="INSERT",
+            reason="Ready for import",
+            category=Category(**item["category"]),
+            area=Area(**item["area"]),
+            business_id=item["business_id"],
+            business_slug=item["business_slug"],
+        )
+        for item in payload["rows"]
+    ]
+    return ImportPlan(run_id=payload["run_id"], zip_sha256=payload["zip_sha256"], rows=rows)
+
+
+def ensure_checkpoint_table(conn: psycopg.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS public.zip_import_checkpoints (
+          run_id text PRIMARY KEY,
+          zip_sha256 text NOT NULL,
+          last_source_file text,
+          last_source_row integer,
+          rows_done integer NOT NULL DEFAULT 0,
+          rows_total integer NOT NULL DEFAULT 0,
+          completed_at timestamptz,
+          updated_at timestamptz NOT NULL DEFAULT now()
+        );
+        """
+    )
+
+
+def start_checkpoint(conn: psycopg.Connection, plan: ImportPlan) -> None:
+    conn.execute(
+        """
+        INSERT INTO public.zip_import_checkpoints (run_id, zip_sha256, rows_total)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (run_id) DO NOTHING
+        """,
+        (plan.run_id, plan.zip_sha256, len(plan.rows)),
+    )
+
+
+def save_checkpoint(conn: psycopg.Connection, run_id: str, last: SourceRow, batch_rows: int) -> None:
+    conn.execute(
+        """
+        UPDATE public.zip_import_checkpoints
+        SET last_source_file = %s,
+            last_source_row = %s,
+            rows_done = rows_done + %s,
+            completed_at = CASE WHEN rows_done + %s >= rows_total THEN now() END,
+            updated_at = now()
+        WHERE run_id = %s
+        """,
+        (last.source_file, last.source_row, batch_rows, batch_rows, run_id),
+    )
+
+
+def load_checkpoint(conn: psycopg.Connection, run_id: str) -> tuple[str, int] | None:
+    row = conn.execute(
+        """
+        SELECT last_source_file, last_source_row
+        FROM public.zip_import_checkpoints
+        WHERE run_id = %s
+        """,
+        (run_id,),
+    ).fetchone()
+    if not row or row["last_source_file"] is None:
+        return None
+    return row["last_source_file"], int(row["last_source_row"])
+
+
+def rows_already_done(plan: ImportPlan, checkpoint: tuple[str, int] | None) -> int:
+    if checkpoint is None:
+        return 0
+    for idx, row in enumerate(plan.rows):
+        if (row.source.source_file, row.source.source_row) == checkpoint:
+            return idx + 1
+    raise SystemExit(f"Checkpoint {checkpoint[0]}:{checkpoint[1]} not found in plan {plan.run_id}")
+
+
+def apply_with_checkpoints(
+    pool: ConnectionPool,
+    plan: ImportPlan,
+    start: int,
+    batch_size: int,
+    lock_mode: str = "wait",
+) -> tuple[int, int]:
+    """Insert plan rows from `start`, committing each batch together with its checkpoint."""
+
+    def apply_batch(conn: psycopg.Connection, batch: list[EvaluatedRow]) -> tuple[int, int]:
+        if lock_mode == "wait":
+            # Same per-category locks as the sync (job_locks.py), held until this batch commits.
+            lock_categories(conn, {row.category.slug for row in batch})
+        # Reservations commit or roll back with the inserts they were made for.
+        result = apply_inserts(conn, reserve_slugs(conn, batch))
+        save_checkpoint(conn, plan.run_id, batch[-1].source, len(batch))
+        return result
+
+    results = run_batches(pool, plan.rows[start:], apply_batch, batch_size=batch_size, label="apply")
+    return sum(r[0] for r in results), sum(r[1] for r in results)
+
+
+def promote_pending_index(pending_path: Path, index_path: Path, run_id: str) -> None:
+    """Make a completed run's fingerprint index the baseline for the next --diff."""
+    if not pending_path.exists():
+        return
+    if json.loads(pending_path.read_text(encoding="utf-8")).get("run_id") != run_id:
+        return
+    pending_path.replace(index_path)
+    print(f"Updated fingerprint index: {index_path}")
+
+
+def print_summary(counts: dict[str, int]) -> None:
     print("Summary:")
     for key in sorted(counts):
         print(f"  {key}: {counts[key]}")
@@ -725,40 +1089,167 @@ def parse_args() -> argparse.Namespace:
     mode = parser.add_mutually_exclusive_group()
     mode.add_argument("--apply", action="store_true", help="Apply INSERTs to DB")
     mode.add_argument("--dry-run", action="store_true", help="Dry-run only (default)")
+    mode.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted --apply from its last committed batch (uses the saved plan)",
+    )
+    mode.add_argument(
+        "--export-snapshot",
+        metavar="PATH",
+        help="Write categories, areas and existing-business dedupe keys to PATH for offline dry runs, then exit",
+    )
+    parser.add_argument(
+        "--snapshot",
+        metavar="PATH",
+        help="Read categories/areas/dedupe keys from a --export-snapshot file; dry runs then need no --db-url, "
+        "--apply checks it against the live database first",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Rows per --apply transaction and checkpoint; a dropped connection only replays the current batch",
+    )
+    parser.add_argument(
+        "--area-polygons",
+        help="Optional GeoJSON of area polygons (properties.slug) for rows with Latitude/Longitude",
+    )
+    parser.add_argument(
+        "--diff",
+        action="store_true",
+        help="Compare against the last applied run's fingerprint index: skip unchanged rows, UPDATE modified ones",
+    )
+    parser.add_argument(
+        "--compact-keys",
+        action="store_true",
+        help="Hold dedupe keys as 64-bit fingerprints (far less memory for large businesses tables; same results)",
+    )
+    parser.add_argument(
+        "--report-format",
+        choices=REPORT_FORMATS,
+        default="csv",
+        help="Dry-run report format; parquet/arrow need pyarrow",
+    )
+    # Checkpoints record the last row of a batch, so busy categories cannot be skipped here.
+    add_lock_argument(parser, modes=("wait", "off"))
+    add_profile_argument(parser, "import_zip_businesses")
     return parser.parse_args()
 
 
 def main() -> int:
     args = parse_args()
-    if not args.db_url:
-        raise SystemExit("Missing --db-url (or CALVIA_DB_URL)")
+    offline = bool(args.snapshot) and not (args.apply or args.resume or args.export_snapshot)
+    if not args.db_url and not offline:
+        raise SystemExit("Missing --db-url (or CALVIA_DB_URL); dry runs can use --snapshot instead")
+
+    if args.export_snapshot:
+        # Imported lazily: the snapshot module builds on this module's loaders.
+        from taxonomy_snapshot import read_snapshot, write_snapshot
+
+        snapshot_path = Path(args.export_snapshot).expanduser().resolve()
+        with session(args.profile), open_pool(args.db_url) as pool:
+            snapshot = run_with_retry(pool, read_snapshot, label="read_snapshot")
+        write_snapshot(snapshot_path, snapshot)
+        print(
+            f"Wrote taxonomy snapshot: {snapshot_path} ({sum(len(v) for v in snapshot.categories_by_slug.values())} "
+            f"categories, {len(snapshot.areas_by_slug)} areas, {len(snapshot.existing_keys)} businesses)"
+        )
+        return 0
 
     zip_path = Path(args.zip_path).expanduser().resolve()
     if not zip_path.exists():
         raise SystemExit(f"ZIP not found: {zip_path}")
 
     reports_dir = Path(args.reports_dir).expanduser().resolve()
-    candidate_report = reports_dir / "zip_import_candidates.csv"
-    skipped_report = reports_dir / "zip_import_skipped_or_hold.csv"
-
-    with psycopg.connect(args.db_url, row_factory=dict_row) as conn:
-        categories_by_slug = load_categories(conn)
-        areas_by_slug = load_areas(conn)
-        existing_rows = read_existing_businesses(conn)
+    plan_path = reports_dir / "zip_import_plan.json"
+    index_path = reports_dir / "zip_import_fingerprints.json"
+    pending_index_path = reports_dir / "zip_import_fingerprints.pending.json"
+
+    with session(args.profile), ExitStack() as stack:
+        # Offline dry runs never open a pool, so they make no round trips at all.
+        pool = None if offline else stack.enter_context(open_pool(args.db_url))
+        if args.resume:
+            if not plan_path.exists():
+                raise SystemExit(f"No saved plan to resume: {plan_path}")
+            plan = read_plan(plan_path)
+            if file_sha256(zip_path) != plan.zip_sha256:
+                raise SystemExit(f"ZIP does not match saved plan {plan.run_id}; run --apply again instead.")
+            run_with_retry(pool, ensure_checkpoint_table, label="ensure_checkpoint_table")
+            checkpoint = run_with_retry(pool, lambda conn: load_checkpoint(conn, plan.run_id), label="load_checkpoint")
+            start = rows_already_done(plan, checkpoint)
+            print(f"Resuming {plan.run_id}: {start}/{len(plan.rows)} rows already committed")
+            inserted, conflicts = apply_with_checkpoints(pool, plan, start, args.batch_size, args.lock_categories)
+            print(f"Applied: inserted={inserted}, slug_conflicts_skipped={conflicts}")
+            if args.lock_categories == "wait":
+                print(lock_metrics.summary())
+            promote_pending_index(pending_index_path, index_path, plan.run_id)
+            return 0
+
+        if args.snapshot:
+            from taxonomy_snapshot import check_snapshot_fresh, load_snapshot
+
+            snapshot = load_snapshot(Path(args.snapshot).expanduser().resolve(), args.compact_keys)
+            if args.apply:
+                run_with_retry(pool, lambda conn: check_snapshot_fresh(conn, snapshot), label="check_snapshot")
+            print(f"Using taxonomy snapshot from {snapshot.created_at}")
+            categories_by_slug = snapshot.categories_by_slug
+            areas_by_slug = snapshot.areas_by_slug
+            existing_keys = snapshot.existing_keys
+        else:
+            categories_by_slug = run_with_retry(pool, load_categories, label="load_categories")
+            areas_by_slug = run_with_retry(pool, load_areas, label="load_areas")
+            existing_keys = existing_business_keys(
+                run_with_retry(pool, read_existing_businesses, label="read_existing_businesses"), args.compact_keys
+            )
         source_rows = list(iter_zip_business_rows(zip_path))
-        evaluated = evaluate_rows(source_rows, categories_by_slug, areas_by_slug, existing_rows)
+        diff = None
+        if args.diff:
+            # Imported lazily: the diff engine builds on this module's helpers.
+            from import_diff import diff_rows, load_index, write_removed_report
+
+            diff = diff_rows(source_rows, load_index(index_path))
+            print("Diff against last applied run:")
+            for key, count in diff.counts().items():
+                print(f"  {key}: {count}")
+            write_removed_report(reports_dir, diff.removed, args.report_format)
+            source_rows = diff.added
+        polygons_path = Path(args.area_polygons).expanduser().resolve() if args.area_polygons else None
+        area_index = build_area_index(areas_by_slug, polygons_path)
+        evaluated = evaluate_rows(
+            source_rows, categories_by_slug, areas_by_slug, existing_keys, area_index, args.compact_keys
+        )
 
-        insert_rows = [r for r in evaluated if r.action == "INSERT"]
-        other_rows = [r for r in evaluated if r.action != "INSERT"]
-        write_report(candidate_report, insert_rows)
-        write_report(skipped_report, other_rows)
-        print(f"Wrote report: {candidate_report}")
-        print(f"Wrote report: {skipped_report}")
-        print_summary(evaluated)
+        report = write_reports(evaluated, reports_dir, args.report_format)
+        insert_rows = report.insert_rows
+        for report_path in report.paths:
+            print(f"Wrote report: {report_path}")
+        print_summary(report.counts)
 
         if args.apply:
-            inserted, conflicts = apply_inserts(conn, insert_rows)
+            zip_sha256 = file_sha256(zip_path)
+            run_id = f"{zip_sha256[:16]}-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}"
+            plan = ImportPlan(run_id=run_id, zip_sha256=zip_sha256, rows=insert_rows)
+            write_plan(plan_path, plan)
+            run_with_retry(pool, ensure_checkpoint_table, label="ensure_checkpoint_table")
+            run_with_retry(pool, lambda conn: start_checkpoint(conn, plan), label="start_checkpoint")
+            print(f"Wrote plan: {plan_path} (run {run_id})")
+            if diff is not None:
+                from import_diff import apply_updates, next_index, place_modified, write_index
+
+                place_modified(diff.modified, categories_by_slug, areas_by_slug, area_index)
+                # Updates are idempotent, so they run before the checkpointed inserts.
+                updated = sum(
+                    run_batches(pool, diff.modified, apply_updates, batch_size=args.batch_size, label="update")
+                )
+                unplaced = sum(not row.placed for row in diff.modified)
+                print(f"Updated modified businesses: {updated} ({unplaced} kept their category/area, retried next run)")
+                write_index(pending_index_path, next_index(run_id, zip_sha256, diff, evaluated))
+            inserted, conflicts = apply_with_checkpoints(pool, plan, 0, args.batch_size, args.lock_categories)
             print(f"Applied: inserted={inserted}, slug_conflicts_skipped={conflicts}")
+            if args.lock_categories == "wait":
+                print(lock_metrics.summary())
+            promote_pending_index(pending_index_path, index_path, run_id)
         else:
             print("Dry run complete. Use --apply to import INSERT rows.")
 
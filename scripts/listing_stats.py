@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Incremental maintenance of `category_listing_stats`.
+
+Triggers on `listings` apply the count delta of every insert, update and
+delete (20260220001200_maintain_category_listing_stats_on_listings.sql).
+A sync batch instead defers them with `DEFER_LISTING_STATS_SQL`, reads the
+(category_id, neighborhood) of the listings it is about to upsert, writes
+them, and applies `new - old` per key once in the same transaction. Counts
+never need a full recount of `listings`; `--rebuild` is only a repair tool
+for when the triggers were disabled.
+See 20260220000700_create_category_listing_stats.sql.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+from collections import Counter
+from typing import Any, Iterable
+
+import psycopg
+
+from db_connection import open_pool, run_with_retry
+from stage_profiler import add_profile_argument, session, stage
+
+
+StatsKey = tuple[str, str]
+
+LISTING_KEYS_SQL = """
+SELECT category_id::text AS category_id, COALESCE(neighborhood, '') AS neighborhood
+FROM listings
+WHERE id = ANY(%s::uuid[])
+"""
+
+APPLY_DELTA_SQL = """
+INSERT INTO category_listing_stats AS s (category_id, neighborhood, listing_count)
+SELECT d.category_id, d.neighborhood, d.delta
+FROM unnest(%s::uuid[], %s::text[], %s::integer[]) AS d(category_id, neighborhood, delta)
+ON CONFLICT (category_id, neighborhood) DO UPDATE SET
+  listing_count = GREATEST(s.listing_count + EXCLUDED.listing_count, 0),
+  updated_at = now()
+"""
+
+DEFER_LISTING_STATS_SQL = "SET LOCAL calvia.defer_listing_stats = 'on'"
+
+REBUILD_SQL = """
+DELETE FROM category_listing_stats;
+INSERT INTO category_listing_stats (category_id, neighborhood, listing_count)
+SELECT category_id, COALESCE(neighborhood, ''), COUNT(*)
+FROM listings
+GROUP BY category_id, COALESCE(neighborhood, '')
+"""
+
+
+def keys_from_rows(rows: Iterable[dict[str, Any]]) -> Counter[StatsKey]:
+    return Counter((str(r["category_id"]), r["neighborhood"] or "") for r in rows)
+
+
+def stats_delta(old: Counter[StatsKey], new: Counter[StatsKey]) -> dict[StatsKey, int]:
+    """Per-key `new - old`, dropping keys whose count did not move."""
+    delta: dict[StatsKey, int] = {}
+    for key in old.keys() | new.keys():
+        change = new[key] - old[key]
+        if change:
+            delta[key] = change
+    return delta
+
+
+def delta_params(delta: dict[StatsKey, int]) -> tuple[list[str], list[str], list[int]]:
+    keys = sorted(delta)
+    return [k[0] for k in keys], [k[1] for k in keys], [delta[k] for k in keys]
+
+
+def read_listing_keys(conn: psycopg.Connection, listing_ids: list[str]) -> Counter[StatsKey]:
+    if not listing_ids:
+        return Counter()
+    return keys_from_rows(conn.execute(LISTING_KEYS_SQL, (list(listing_ids),)).fetchall())
+
+
+def apply_stats_delta(conn: psycopg.Connection, delta: dict[StatsKey, int]) -> int:
+    """Apply a delta in the caller's transaction; returns the number of keys touched."""
+    if not delta:
+        return 0
+    conn.execute(APPLY_DELTA_SQL, delta_params(delta))
+    return len(delta)
+
+
+@stage("rebuild_listing_stats")
+def rebuild_stats(conn: psycopg.Connection) -> None:
+    conn.execute(REBUILD_SQL)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Maintain category_listing_stats")
+    parser.add_argument("--db-url", default=os.environ.get("CALVIA_DB_URL", ""))
+    parser.add_argument("--rebuild", action="store_true", help="Recount every category/neighborhood")
+    add_profile_argument(parser, "listing_stats")
+    args = parser.parse_args()
+
+    if not args.db_url:
+        raise SystemExit("Missing --db-url (or CALVIA_DB_URL).")
+    if not args.rebuild:
+        raise SystemExit("Nothing to do: the sync maintains these counts; pass --rebuild to recount.")
+
+    with session(args.profile), open_pool(args.db_url) as pool:
+        run_with_retry(pool, rebuild_stats, label="rebuild_listing_stats")
+    print("Rebuilt category_listing_stats.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
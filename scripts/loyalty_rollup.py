@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Incremental maintenance of loyalty totals from `store_visits`.
+
+Each batch reads up to `--batch-size` visits past the (created_at, id)
+watermark in `loyalty_rollup_state`, adds their visit counts and points to
+`user_visit_totals` and `listing_visit_totals`, refreshes
+`profiles.loyalty_points` / `loyalty_tier` for the users it touched and
+advances the watermark, all in one transaction. A crash re-applies nothing
+and loses nothing. The state row is locked for the batch, so two runs never
+fold in the same visit twice.
+
+`created_at` is stamped by a trigger when the inserting transaction starts
+(20260220001400_server_assigned_store_visit_created_at.sql), so clients
+cannot place a visit behind the watermark, but a visit may commit after a
+later-stamped one. Batches only read visits older than `--settle-seconds`
+to leave such transactions time to commit. Visits that are deleted, or
+verified only after the watermark passed them, are picked up by
+`--rebuild`, which recounts everything from scratch.
+See 20260220001000_create_loyalty_rollups.sql.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Iterable
+
+import psycopg
+
+from db_connection import DEFAULT_BATCH_SIZE, open_pool, run_with_retry
+from stage_profiler import add_profile_argument, session, stage
+
+
+# 20260220001000_create_loyalty_rollups.sql seeds the watermark with the same margin.
+DEFAULT_SETTLE_SECONDS = 60.0
+EMPTY_WATERMARK_ID = "00000000-0000-0000-0000-000000000000"
+
+LOCK_STATE_SQL = """
+SELECT last_created_at, last_visit_id::text AS last_visit_id
+FROM loyalty_rollup_state
+WHERE id
+FOR UPDATE
+"""
+
+VISITS_SQL = """
+SELECT
+  id::text AS id,
+  user_id::text AS user_id,
+  listing_id::text AS listing_id,
+  COALESCE(points_earned, 0) AS points_earned,
+  created_at,
+  verified_at IS NOT NULL AS verified
+FROM store_visits
+WHERE (created_at, id) > (%s, %s::uuid)
+  AND created_at < now() - make_interval(secs => %s)
+ORDER BY created_at, id
+LIMIT %s
+"""
+
+APPLY_USER_TOTALS_SQL = """
+INSERT INTO user_visit_totals AS t (user_id, visit_count, points, last_visit_at)
+SELECT d.id, d.visits, d.points, d.last_visit_at
+FROM unnest(%s::uuid[], %s::integer[], %s::integer[], %s::timestamptz[]) AS d(id, visits, points, last_visit_at)
+ON CONFLICT (user_id) DO UPDATE SET
+  visit_count = t.visit_count + EXCLUDED.visit_count,
+  points = t.points + EXCLUDED.points,
+  last_visit_at = GREATEST(t.last_visit_at, EXCLUDED.last_visit_at),
+  updated_at = now()
+"""
+
+APPLY_LISTING_TOTALS_SQL = """
+INSERT INTO listing_visit_totals AS t (listing_id, visit_count, points, last_visit_at)
+SELECT d.id, d.visits, d.points, d.last_visit_at
+FROM unnest(%s::uuid[], %s::integer[], %s::integer[], %s::timestamptz[]) AS d(id, visits, points, last_visit_at)
+ON CONFLICT (listing_id) DO UPDATE SET
+  visit_count = t.visit_count + EXCLUDED.visit_count,
+  points = t.points + EXCLUDED.points,
+  last_visit_at = GREATEST(t.last_visit_at, EXCLUDED.last_visit_at),
+  updated_at = now()
+"""
+
+# Tier thresholds match TIERS in components/loyalty-tier-card.tsx.
+SYNC_PROFILES_SQL = """
+UPDATE profiles AS p
+SET loyalty_points = t.points, loyalty_tier = t.tier
+FROM (
+  SELECT
+    user_id,
+    points,
+    CASE WHEN points >= 1500 THEN 'Platinum' WHEN points >= 500 THEN 'Gold' ELSE 'Silver' END AS tier
+  FROM user_visit_totals
+  WHERE user_id = ANY(%s::uuid[])
+) t
+WHERE p.id = t.user_id
+  AND (p.loyalty_points, p.loyalty_tier) IS DISTINCT FROM (t.points, t.tier)
+"""
+
+ADVANCE_STATE_SQL = """
+UPDATE loyalty_rollup_state
+SET last_created_at = %s, last_visit_id = %s::uuid, updated_at = now()
+WHERE id
+"""
+
+REBUILD_WATERMARK_SQL = """
+SELECT created_at, id::text AS id
+FROM store_visits
+WHERE created_at < now() - make_interval(secs => %s)
+ORDER BY created_at DESC, id DESC
+LIMIT 1
+"""
+
+# Run in order within one transaction; bound to the watermark chosen for the rebuild.
+REBUILD_SQL = (
+    "DELETE FROM user_visit_totals",
+    "DELETE FROM listing_visit_totals",
+    """
+INSERT INTO user_visit_totals (user_id, visit_count, points, last_visit_at)
+SELECT user_id, COUNT(*), COALESCE(SUM(points_earned), 0), MAX(created_at)
+FROM store_visits
+WHERE verified_at IS NOT NULL AND (created_at, id) <= (%(created_at)s, %(id)s::uuid)
+GROUP BY user_id
+""",
+    """
+INSERT INTO listing_visit_totals (listing_id, visit_count, points, last_visit_at)
+SELECT listing_id, COUNT(*), COALESCE(SUM(points_earned), 0), MAX(created_at)
+FROM store_visits
+WHERE verified_at IS NOT NULL AND listing_id IS NOT NULL AND (created_at, id) <= (%(created_at)s, %(id)s::uuid)
+GROUP BY listing_id
+""",
+    """
+UPDATE profiles AS p
+SET loyalty_points = t.points, loyalty_tier = t.tier
+FROM (
+  SELECT
+    pr.id AS user_id,
+    COALESCE(u.points, 0) AS points,
+    CASE WHEN COALESCE(u.points, 0) >= 1500 THEN 'Platinum'
+         WHEN COALESCE(u.points, 0) >= 500 THEN 'Gold'
+         ELSE 'Silver' END AS tier
+  FROM profiles pr
+  LEFT JOIN user_visit_totals u ON u.user_id = pr.id
+) t
+WHERE p.id = t.user_id
+  AND (p.loyalty_points, p.loyalty_tier) IS DISTINCT FROM (t.points, t.tier)
+""",
+    """
+UPDATE loyalty_rollup_state
+SET last_created_at = %(created_at)s, last_visit_id = %(id)s::uuid, updated_at = now()
+WHERE id
+""",
+)
+
+
+@dataclass
+class VisitTotals:
+    visits: int = 0
+    points: int = 0
+    last_visit_at: datetime | None = None
+
+    def add(self, points: int, at: datetime) -> None:
+        self.visits += 1
+        self.points += points
+        if self.last_visit_at is None or at > self.last_visit_at:
+            self.last_visit_at = at
+
+
+@dataclass
+class BatchResult:
+    visits: int = 0
+    users: int = 0
+    listings: int = 0
+    watermark: datetime | None = None
+
+
+def totals_by(rows: Iterable[dict[str, Any]], column: str) -> dict[str, VisitTotals]:
+    """Per-`column` totals of the verified visits in `rows`; rows where `column` is NULL are skipped."""
+    totals: dict[str, VisitTotals] = {}
+    for row in rows:
+        key = row[column]
+        if key is None or not row["verified"]:
+            continue
+        totals.setdefault(key, VisitTotals()).add(int(row["points_earned"]), row["created_at"])
+    return totals
+
+
+def totals_params(totals: dict[str, VisitTotals]) -> tuple[list[str], list[int], list[int], list[datetime | None]]:
+    keys = sorted(totals)
+    return (
+        keys,
+        [totals[k].visits for k in keys],
+        [totals[k].points for k in keys],
+        [totals[k].last_visit_at for k in keys],
+    )
+
+
+def lock_state(conn: psycopg.Connection) -> dict[str, Any]:
+    state = conn.execute(LOCK_STATE_SQL).fetchone()
+    if state is None:
+        raise SystemExit("loyalty_rollup_state is empty; apply 20260220001000_create_loyalty_rollups.sql first.")
+    return state
+
+
+@stage("rollup_batch", rows=lambda result, *_: result.visits)
+def rollup_batch(conn: psycopg.Connection, batch_size: int, settle_seconds: float) -> BatchResult:
+    state = lock_state(conn)
+    rows = conn.execute(
+        VISITS_SQL, (state["last_created_at"], state["last_visit_id"], settle_seconds, batch_size)
+    ).fetchall()
+    if not rows:
+        return BatchResult()
+
+    users = totals_by(rows, "user_id")
+    listings = totals_by(rows, "listing_id")
+    if users:
+        conn.execute(APPLY_USER_TOTALS_SQL, totals_params(users))
+        conn.execute(SYNC_PROFILES_SQL, (sorted(users),))
+    if listings:
+        conn.execute(APPLY_LISTING_TOTALS_SQL, totals_params(listings))
+    last = rows[-1]
+    conn.execute(ADVANCE_STATE_SQL, (last["created_at"], last["id"]))
+    return BatchResult(len(rows), len(users), len(listings), last["created_at"])
+
+
+@stage("rebuild_loyalty_totals")
+def rebuild_totals(conn: psycopg.Connection, settle_seconds: float) -> datetime | None:
+    # The watermark and the recount must see the same visits.
+    conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+    lock_state(conn)
+    last = conn.execute(REBUILD_WATERMARK_SQL, (settle_seconds,)).fetchone()
+    watermark = last or {"created_at": "-infinity", "id": EMPTY_WATERMARK_ID}
+    for sql in REBUILD_SQL:
+        conn.execute(sql, watermark)
+    return last["created_at"] if last else None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Maintain per-user and per-listing loyalty totals from store_visits")
+    parser.add_argument("--db-url", default=os.environ.get("CALVIA_DB_URL", ""))
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Visits folded in per transaction")
+    parser.add_argument("--max-batches", type=int, help="Stop after this many batches (default: until caught up)")
+    parser.add_argument(
+        "--settle-seconds",
+        type=float,
+        default=DEFAULT_SETTLE_SECONDS,
+        help="Leave visits younger than this for the next run so late commits are not skipped",
+    )
+    parser.add_argument("--rebuild", action="store_true", help="Recount every total from the full visit history")
+    add_profile_argument(parser, "loyalty_rollup")
+    args = parser.parse_args()
+
+    if not args.db_url:
+        raise SystemExit("Missing --db-url (or CALVIA_DB_URL).")
+
+    with session(args.profile), open_pool(args.db_url) as pool:
+        if args.rebuild:
+            watermark = run_with_retry(
+                pool, lambda conn: rebuild_totals(conn, args.settle_seconds), label="rebuild_loyalty_totals"
+            )
+            print(f"Rebuilt loyalty totals up to {watermark.isoformat() if watermark else 'before the first visit'}.")
+            return 0
+
+        total = BatchResult()
+        batches = 0
+        while args.max_batches is None or batches < args.max_batches:
+            result = run_with_retry(
+                pool,
+                lambda conn: rollup_batch(conn, args.batch_size, args.settle_seconds),
+                label="rollup_batch",
+            )
+            batches += 1
+            total.visits += result.visits
+            total.users += result.users
+            total.listings += result.listings
+            total.watermark = result.watermark or total.watermark
+            if result.visits < args.batch_size:
+                break
+
+    watermark = total.watermark.isoformat() if total.watermark else "unchanged"
+    print(
+        f"Folded in {total.visits} visits in {batches} batches "
+        f"({total.users} user and {total.listings} listing updates); watermark {watermark}."
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
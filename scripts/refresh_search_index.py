@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Refresh the denormalized `listing_search_index` projection.
+
+Triggers on `listings` and `categories` keep the projection current for
+every write path (20260220001100_keep_listing_search_index_current.sql).
+Bulk writers defer those triggers with `DEFER_SEARCH_INDEX_SQL` and call
+`refresh_search_index` once per batch in the same transaction instead.
+
+This script is a repair tool: `--all` rebuilds every listing (e.g. after the
+triggers were disabled) and `--since` refreshes listings whose business
+mapping changed after a timestamp. Unchanged rows are not rewritten; see
+20260220000600_create_listing_search_index.sql.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+
+import psycopg
+
+from db_connection import DEFAULT_BATCH_SIZE, open_pool, run_batches, run_with_retry
+from stage_profiler import add_profile_argument, session, stage
+
+
+REFRESH_SEARCH_INDEX_SQL = "SELECT refresh_listing_search_index(%s::uuid[]) AS written"
+
+DEFER_SEARCH_INDEX_SQL = "SET LOCAL calvia.defer_search_index = 'on'"
+
+ALL_LISTING_IDS_SQL = "SELECT id FROM listings ORDER BY id"
+
+CHANGED_LISTING_IDS_SQL = """
+SELECT DISTINCT m.listing_id AS id
+FROM business_listing_map m
+WHERE m.updated_at >= %s::timestamptz
+ORDER BY m.listing_id
+"""
+
+
+def refresh_search_index(conn: psycopg.Connection, listing_ids: list[str]) -> int:
+    """Refresh the projection for `listing_ids` in the caller's transaction; returns rows written."""
+    if not listing_ids:
+        return 0
+    row = conn.execute(REFRESH_SEARCH_INDEX_SQL, (list(listing_ids),)).fetchone()
+    return int(row["written"] or 0)
+
+
+@stage("read_listing_ids")
+def read_listing_ids(conn: psycopg.Connection, since: str | None) -> list[str]:
+    if since:
+        rows = conn.execute(CHANGED_LISTING_IDS_SQL, (since,)).fetchall()
+    else:
+        rows = conn.execute(ALL_LISTING_IDS_SQL).fetchall()
+    return [str(r["id"]) for r in rows]
+
+
+@stage("refresh_search_index_batch", rows=lambda result, *_: result)
+def refresh_batch(conn: psycopg.Connection, batch: list[str]) -> int:
+    return refresh_search_index(conn, batch)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Refresh the listing_search_index projection")
+    parser.add_argument("--db-url", default=os.environ.get("CALVIA_DB_URL", ""))
+    scope = parser.add_mutually_exclusive_group(required=True)
+    scope.add_argument("--all", action="store_true", help="Refresh every listing")
+    scope.add_argument("--since", help="Refresh listings whose business mapping changed at/after this timestamp")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Listings per transaction")
+    add_profile_argument(parser, "refresh_search_index")
+    args = parser.parse_args()
+
+    if not args.db_url:
+        raise SystemExit("Missing --db-url (or CALVIA_DB_URL).")
+
+    with session(args.profile), open_pool(args.db_url) as pool:
+        listing_ids = run_with_retry(
+            pool,
+            lambda conn: read_listing_ids(conn, args.since),
+            label="read_listing_ids",
+        )
+        written = sum(
+            run_batches(pool, listing_ids, refresh_batch, batch_size=args.batch_size, label="refresh_search_index")
+        )
+    print(f"Search index: {len(listing_ids)} listings checked, {written} rows written.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
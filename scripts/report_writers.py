@@ -0,0 +1,103 @@
+"""
+Row-at-a-time report writers for import dry-runs.
+
+`csv` needs nothing beyond the standard library. `parquet` and `arrow`
+(Arrow IPC file) need pyarrow, which is only imported when one of those
+formats is requested; rows are buffered per column and flushed as record
+batches every `batch_rows`, so memory stays flat for million-row reports.
+"""
+
+from __future__ import annotations
+
+import csv
+from pathlib import Path
+from typing import Any, Sequence
+
+
+REPORT_FORMATS = ("csv", "parquet", "arrow")
+DEFAULT_BATCH_ROWS = 50_000
+
+
+class CsvReportWriter:
+    def __init__(self, path: Path, columns: Sequence[str]) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._file = path.open("w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, values: Sequence[Any]) -> None:
+        self._writer.writerow(values)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ArrowReportWriter:
+    """Parquet or Arrow IPC output; `int_columns` are typed int64, everything else string."""
+
+    def __init__(
+        self,
+        path: Path,
+        columns: Sequence[str],
+        fmt: str = "parquet",
+        int_columns: frozenset[str] = frozenset(),
+        batch_rows: int = DEFAULT_BATCH_ROWS,
+    ) -> None:
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise SystemExit(f"--report-format {fmt} needs pyarrow (pip install pyarrow).") from None
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._pa = pa
+        self._columns = list(columns)
+        self._schema = pa.schema(
+            [(name, pa.int64() if name in int_columns else pa.string()) for name in self._columns]
+        )
+        self._buffers: list[list[Any]] = [[] for _ in self._columns]
+        self._batch_rows = max(1, batch_rows)
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+
+            self._writer = pq.ParquetWriter(str(path), self._schema)
+        else:
+            import pyarrow.ipc as ipc
+
+            self._writer = ipc.new_file(str(path), self._schema)
+
+    def write(self, values: Sequence[Any]) -> None:
+        for buffer, value in zip(self._buffers, values):
+            buffer.append(value)
+        if len(self._buffers[0]) >= self._batch_rows:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._buffers[0]:
+            return
+        batch = self._pa.RecordBatch.from_arrays(
+            [self._pa.array(buffer, type=field.type) for buffer, field in zip(self._buffers, self._schema)],
+            schema=self._schema,
+        )
+        self._writer.write_batch(batch)
+        self._buffers = [[] for _ in self._columns]
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+
+def open_report_writer(
+    path: Path,
+    columns: Sequence[str],
+    fmt: str = "csv",
+    int_columns: frozenset[str] = frozenset(),
+) -> CsvReportWriter | ArrowReportWriter:
+    """Open a writer for `path` with the format's extension (`.csv`, `.parquet`, `.arrow`)."""
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"Unknown report format: {fmt}")
+    path = path.with_suffix(f".{fmt}")
+    if fmt == "csv":
+        return CsvReportWriter(path, columns)
+    return ArrowReportWriter(path, columns, fmt=fmt, int_columns=int_columns)
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Incremental nightly refresh: migrations -> ZIP import -> sync.
+
+Derived tables (`listing_search_index`, `category_listing_stats`) are kept
+current by triggers on `listings`, so they have no stage; their scripts are
+repair tools. `supabase/migrations/20260214040200_import_calvia_businesses.sql`
+is tracked and checksummed, so regenerate it by hand, not here.
+
+Each stage runs one of the existing scripts as a subprocess. After a stage
+succeeds the runner records two fingerprints in `--state`:
+
+- inputs: the command line, the script's source, its input files
+  (content hashes), the table columns it reads and the output fingerprints
+  of the stages it depends on
+- outputs: its output files and the table columns it writes
+
+A table is fingerprinted by its row count and the sum of a 64-bit hash of
+each row's listed columns: one sequential scan, no sort and constant memory.
+Columns a stage neither reads nor writes, such as `view_count`, do not make
+it run again.
+
+On the next run a stage is skipped when both still match, like make for
+data. Inputs are fingerprinted before the stage runs, so a change made while
+it runs is picked up next time. Only tables a stage reads and also writes
+itself (the importer and `businesses`) are re-read afterwards, so it settles
+instead of re-running forever. Stages whose dependencies are done run
+concurrently, up to `--jobs`. Each stage logs to
+`<work-dir>/logs/<stage>.log`, and the run ends with one timing report,
+printed and written to `<work-dir>/pipeline_report.json`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+
+import psycopg
+from psycopg import sql
+from psycopg.rows import tuple_row
+from psycopg_pool import ConnectionPool
+
+from db_connection import open_pool, run_with_retry
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+SCRIPTS_DIR = Path(__file__).resolve().parent
+STATE_VERSION = 1
+DEFAULT_JOBS = 2
+
+# Order-independent: the sum of the first 64 bits of each row's md5.
+TABLE_DIGEST_SQL = """
+SELECT count(*) || ':' || COALESCE(sum(('x' || left(md5(ROW({columns})::text), 16))::bit(64)::bigint::numeric), 0)
+FROM {table}
+"""
+
+
+@dataclass(frozen=True)
+class TableColumns:
+    table: str
+    columns: tuple[str, ...]
+
+
+CATEGORY_COLUMNS = TableColumns("categories", ("id", "slug", "name", "parent_id", "display_order"))
+AREA_COLUMNS = TableColumns("areas", ("id", "slug", "name", "latitude", "longitude"))
+# What import_zip_businesses reads for dedupe; see taxonomy_snapshot.STATE_SQL.
+IMPORT_BUSINESS_COLUMNS = TableColumns("businesses", ("id", "slug", "name", "address", "website", "area_id"))
+# BUSINESSES_SQL in sync_businesses_to_listings.py.
+SYNC_BUSINESS_COLUMNS = TableColumns(
+    "businesses",
+    (
+        "id",
+        "name",
+        "slug",
+        "description",
+        "phone",
+        "email",
+        "website",
+        "address",
+        "image_url",
+        "social_links",
+        "rating",
+        "notes",
+        "category_id",
+        "area_id",
+    ),
+)
+# UPSERT_LISTING_SQL in sync_businesses_to_listings.py.
+SYNC_LISTING_COLUMNS = TableColumns(
+    "listings",
+    (
+        "id",
+        "category_id",
+        "name",
+        "description",
+        "image_url",
+        "contact_phone",
+        "contact_email",
+        "website_url",
+        "address",
+        "neighborhood",
+        "social_media",
+        "tags",
+    ),
+)
+
+
+@dataclass(frozen=True)
+class PipelineStage:
+    name: str
+    script: str
+    args: tuple[str, ...] = ()
+    deps: tuple[str, ...] = ()
+    input_files: tuple[Path, ...] = ()
+    input_tables: tuple[TableColumns, ...] = ()
+    output_files: tuple[Path, ...] = ()
+    output_tables: tuple[TableColumns, ...] = ()
+
+
+@dataclass
+class StageResult:
+    name: str
+    status: str
+    seconds: float = 0.0
+    check_seconds: float = 0.0
+    detail: str = ""
+
+
+@dataclass
+class PipelineState:
+    path: Path
+    stages: dict[str, dict[str, str]] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def outputs_of(self, name: str) -> str:
+        with self.lock:
+            return self.stages.get(name, {}).get("outputs", "")
+
+    def record(self, name: str, inputs: str, outputs: str) -> None:
+        with self.lock:
+            self.stages[name] = {
+                "inputs": inputs,
+                "outputs": outputs,
+                "finished_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            }
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            tmp_path.write_text(
+                json.dumps({"version": STATE_VERSION, "stages": self.stages}, indent=2), encoding="utf-8"
+            )
+            tmp_path.replace(self.path)
+
+
+def load_state(path: Path) -> PipelineState:
+    if not path.exists():
+        return PipelineState(path)
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    if payload.get("version") != STATE_VERSION:
+        raise SystemExit(f"Unsupported pipeline state version in {path}; delete it to run every stage.")
+    return PipelineState(path, payload["stages"])
+
+
+def build_stages(zip_path: Path | None, work_dir: Path) -> list[PipelineStage]:
+    migrations_dir = REPO_ROOT / "supabase" / "migrations"
+    stages = [
+        PipelineStage(
+            "migrate",
+            "run_sql_migrations.py",
+            ("--path", str(migrations_dir)),
+            input_files=(migrations_dir,),
+            output_tables=(TableColumns("codex_external_migrations", ("migration_id", "checksum")),),
+        ),
+    ]
+    sync_deps = ("migrate",)
+    if zip_path is not None:
+        stages.append(
+            PipelineStage(
+                "import_zip",
+                "import_zip_businesses.py",
+                ("--apply", "--zip-path", str(zip_path), "--reports-dir", str(work_dir / "import")),
+                deps=("migrate",),
+                input_files=(zip_path,),
+                input_tables=(CATEGORY_COLUMNS, AREA_COLUMNS, IMPORT_BUSINESS_COLUMNS),
+                output_tables=(IMPORT_BUSINESS_COLUMNS,),
+            )
+        )
+        sync_deps = ("migrate", "import_zip")
+    stages.append(
+        PipelineStage(
+            "sync",
+            "sync_businesses_to_listings.py",
+            deps=sync_deps,
+            input_tables=(SYNC_BUSINESS_COLUMNS, CATEGORY_COLUMNS, AREA_COLUMNS),
+            output_tables=(SYNC_LISTING_COLUMNS, TableColumns("business_listing_map", ("business_id", "listing_id"))),
+        )
+    )
+    return stages
+
+
+def file_digest(path: Path) -> str:
+    """Content hash of a file, or of every file below a directory (names included)."""
+    digest = hashlib.sha256()
+    if not path.exists():
+        return "missing"
+    files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+    for f in files:
+        digest.update(str(f.relative_to(path) if path.is_dir() else f.name).encode("utf-8"))
+        digest.update(b"\0")
+        with f.open("rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                digest.update(chunk)
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def table_digest(conn: psycopg.Connection, source: TableColumns) -> str:
+    if conn.execute("SELECT to_regclass(%s)", (source.table,)).fetchone()[0] is None:
+        return "missing"
+    query = sql.SQL(TABLE_DIGEST_SQL).format(
+        columns=sql.SQL(", ").join(map(sql.Identifier, source.columns)),
+        table=sql.Identifier(source.table),
+    )
+    return conn.execute(query).fetchone()[0]
+
+
+def table_digests(pool: ConnectionPool, tables: tuple[TableColumns, ...]) -> dict[TableColumns, str]:
+    if not tables:
+        return {}
+    digests = run_with_retry(pool, lambda conn: [table_digest(conn, t) for t in tables], label="table_digest")
+    return dict(zip(tables, digests))
+
+
+def fingerprint(
+    pool: ConnectionPool,
+    files: tuple[Path, ...],
+    tables: tuple[TableColumns, ...],
+    extra: list[str],
+    digests: dict[TableColumns, str] | None = None,
+) -> str:
+    """Tables missing from `digests` are read now."""
+    digests = dict(digests or {})
+    digests.update(table_digests(pool, tuple(t for t in tables if t not in digests)))
+    parts = list(extra)
+    parts += [f"{f}={file_digest(f)}" for f in files]
+    parts += [f"{t.table}({','.join(t.columns)})={digests[t]}" for t in tables]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def input_fingerprint(
+    pool: ConnectionPool,
+    stage: PipelineStage,
+    state: PipelineState,
+    digests: dict[TableColumns, str] | None = None,
+) -> str:
+    extra = [" ".join((stage.script, *stage.args)), file_digest(SCRIPTS_DIR / stage.script)]
+    extra += [f"{dep}>{state.outputs_of(dep)}" for dep in stage.deps]
+    return fingerprint(pool, stage.input_files, stage.input_tables, extra, digests)
+
+
+def output_fingerprint(pool: ConnectionPool, stage: PipelineStage) -> str:
+    return fingerprint(pool, stage.output_files, stage.output_tables, [])
+
+
+def run_stage(
+    pool: ConnectionPool,
+    stage: PipelineStage,
+    state: PipelineState,
+    work_dir: Path,
+    db_url: str,
+    force: bool,
+    profile: bool,
+) -> StageResult:
+    started = time.perf_counter()
+    recorded = state.stages.get(stage.name, {})
+    # Taken before the run: an input changed while the stage runs must not count as consumed.
+    input_digests = table_digests(pool, stage.input_tables)
+    inputs = input_fingerprint(pool, stage, state, input_digests)
+    if not force and recorded:
+        if recorded.get("inputs") == inputs and recorded.get("outputs") == output_fingerprint(pool, stage):
+            return StageResult(stage.name, "skipped", check_seconds=time.perf_counter() - started)
+    check_seconds = time.perf_counter() - started
+
+    command = [sys.executable, str(SCRIPTS_DIR / stage.script), *stage.args]
+    if profile:
+        command += ["--profile", str(work_dir / "profiles" / f"{stage.name}.pstats")]
+    log_path = work_dir / "logs" / f"{stage.name}.log"
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    run_started = time.perf_counter()
+    with log_path.open("w", encoding="utf-8") as log:
+        # The URL goes through the environment so it never shows up in `ps`.
+        returncode = subprocess.run(
+            command,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            env={**os.environ, "CALVIA_DB_URL": db_url},
+            cwd=REPO_ROOT,
+        ).returncode
+    seconds = time.perf_counter() - run_started
+    if returncode != 0:
+        return StageResult(stage.name, "failed", seconds, check_seconds, f"exit {returncode}, see {log_path}")
+
+    record_started = time.perf_counter()
+    written = {t.table for t in stage.output_tables}
+    if any(t.table in written for t in stage.input_tables):
+        # Re-read only what the stage wrote itself, so its own writes do not trigger a re-run.
+        kept = {t: d for t, d in input_digests.items() if t.table not in written}
+        inputs = input_fingerprint(pool, stage, state, kept)
+    state.record(stage.name, inputs, output_fingerprint(pool, stage))
+    return StageResult(stage.name, "ran", seconds, check_seconds + time.perf_counter() - record_started)
+
+
+def run_pipeline(
+    pool: ConnectionPool,
+    stages: list[PipelineStage],
+    state: PipelineState,
+    work_dir: Path,
+    db_url: str,
+    jobs: int,
+    force: set[str],
+    profile: bool,
+) -> list[StageResult]:
+    results: dict[str, StageResult] = {}
+    waiting = list(stages)
+    running: dict[Future[StageResult], PipelineStage] = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        while waiting or running:
+            for stage in list(waiting):
+                if any(results.get(dep) and results[dep].status in ("failed", "blocked") for dep in stage.deps):
+                    waiting.remove(stage)
+                    results[stage.name] = StageResult(stage.name, "blocked", detail="a dependency failed")
+                elif all(dep in results for dep in stage.deps):
+                    waiting.remove(stage)
+                    forced = stage.name in force or "all" in force
+                    print(f"START {stage.name}")
+                    future = executor.submit(run_stage, pool, stage, state, work_dir, db_url, forced, profile)
+                    running[future] = stage
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                result = future.result()
+                results[stage.name] = result
+                suffix = f" ({result.detail})" if result.detail else ""
+                print(f"{result.status.upper():<7} {stage.name} in {result.seconds + result.check_seconds:.1f}s{suffix}")
+    return [results[s.name] for s in stages]
+
+
+def timing_table(results: list[StageResult], total_seconds: float) -> str:
+    header = f"{'stage':<20} {'status':<8} {'run_s':>9} {'check_s':>9}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(f"{r.name:<20} {r.status:<8} {r.seconds:>9.2f} {r.check_seconds:>9.2f}")
+    lines.append("-" * len(header))
+    lines.append(f"{'total (wall)':<20} {'':<8} {total_seconds:>9.2f}")
+    return "\n".join(lines)
+
+
+def write_report(path: Path, results: list[StageResult], started_at: str, total_seconds: float) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "started_at": started_at,
+        "total_seconds": round(total_seconds, 3),
+        "stages": [asdict(r) for r in results],
+    }
+    path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run the nightly import -> sync -> derived data refresh")
+    parser.add_argument("--db-url", default=os.environ.get("CALVIA_DB_URL", ""))
+    parser.add_argument("--zip-path", help="ZIP of CSV sheets; adds the import_zip stage")
+    parser.add_argument(
+        "--work-dir",
+        default=str(REPO_ROOT / "reports" / "pipeline"),
+        help="State file, logs, importer reports and the timing report",
+    )
+    parser.add_argument("--state", help="Fingerprint state file (default: <work-dir>/pipeline_state.json)")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="Stages run at the same time")
+    parser.add_argument(
+        "--force",
+        action="append",
+        default=[],
+        metavar="STAGE",
+        help="Run STAGE even if its fingerprints match; 'all' forces every stage. May be repeated",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Pass --profile to every stage; pstats files go to <work-dir>/profiles",
+    )
+    args = parser.parse_args()
+
+    if not args.db_url:
+        raise SystemExit("Missing --db-url (or CALVIA_DB_URL).")
+
+    work_dir = Path(args.work_dir).expanduser().resolve()
+    zip_path = Path(args.zip_path).expanduser().resolve() if args.zip_path else None
+    if zip_path is not None and not zip_path.exists():
+        raise SystemExit(f"ZIP not found: {zip_path}")
+    stages = build_stages(zip_path, work_dir)
+    unknown = set(args.force) - {s.name for s in stages} - {"all"}
+    if unknown:
+        raise SystemExit(f"Unknown stage(s) for --force: {', '.join(sorted(unknown))}")
+    state = load_state(Path(args.state).expanduser().resolve() if args.state else work_dir / "pipeline_state.json")
+
+    started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    started = time.perf_counter()
+    # Concurrent stages each check their fingerprints through the pool.
+    with open_pool(args.db_url, row_factory=tuple_row, max_size=max(2, args.jobs)) as pool:
+        results = run_pipeline(pool, stages, state, work_dir, args.db_url, args.jobs, set(args.force), args.profile)
+    total_seconds = time.perf_counter() - started
+
+    report_path = work_dir / "pipeline_report.json"
+    write_report(report_path, results, started_at, total_seconds)
+    print("Pipeline timing:")
+    print(timing_table(results, total_seconds))
+    print(f"Wrote report: {report_path}")
+    return 1 if any(r.status in ("failed", "blocked") for r in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
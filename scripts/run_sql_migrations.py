@@ -4,6 +4,28 @@ Apply SQL migration files (idempotent-safe runner with ledger).
 
 This runner tracks applied files by absolute path + checksum in:
   public.codex_external_migrations
+
+`--create-test-db NAME` clones a throwaway database from a migrated template
+(`calvia_tpl_<checksum>`, keyed by the combined checksum of all files), so
+tests skip replaying every migration. The template is rebuilt only when a
+file changes; `--db-url` must then point at a maintenance database such as
+`postgres` on a server where the role may CREATE DATABASE.
+
+`--squash OUT` dumps that template (public schema + data) into one baseline
+file whose header lists the files it covers. Triggers the migrations put on
+tables outside public (the `auth.users` signup hooks) are not in that dump,
+so they are read from the template's catalog and appended. Applying a baseline to a
+database whose ledger already has every covered file only records it; a
+fresh database runs it once and records the covered files as applied.
+
+`--online` is for live databases. `CREATE INDEX` / `DROP INDEX` on a table
+that already exists runs as `CONCURRENTLY` in autocommit instead of holding
+a write-blocking lock for the whole build; the statements around it still
+run in transactions, in file order. Every statement waits at most
+`--lock-timeout` for its locks and is retried with backoff, so a migration
+queued behind a long query gives up instead of stalling app traffic behind
+it. A file is split at each concurrent build, so this relies on migrations
+being idempotent (IF NOT EXISTS / CREATE OR REPLACE), as they are here.
 """
 
 from __future__ import annotations
@@ -11,10 +33,21 @@ from __future__ import annotations
 import argparse
 import hashlib
 import os
+import re
+import shutil
+import subprocess
+import time
 from pathlib import Path
 from typing import Iterable
 
 import psycopg
+from psycopg import sql
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import tuple_row
+from psycopg_pool import ConnectionPool
+
+from db_connection import DEFAULT_ATTEMPTS, connection_kwargs, open_pool, run_with_retry
+from stage_profiler import add_profile_argument, session, stage
 
 
 def sha256_text(text: str) -> str:
@@ -45,13 +78,17 @@ def ensure_ledger(conn: psycopg.Connection) -> None:
 
 
 def was_applied(conn: psycopg.Connection, migration_id: str, checksum: str) -> bool:
+    # Ledger ids are absolute paths; a file with the same name and checksum counts
+    # as applied from any checkout (and when recorded by a squashed baseline).
+    suffix = "/" + Path(migration_id).name
     row = conn.execute(
         """
         SELECT 1
         FROM public.codex_external_migrations
-        WHERE migration_id = %s AND checksum = %s
+        WHERE checksum = %s
+          AND (migration_id = %s OR right(migration_id, %s) = %s)
         """,
-        (migration_id, checksum),
+        (checksum, migration_id, len(suffix), suffix),
     ).fetchone()
     return row is not None
 
@@ -68,7 +105,13 @@ def mark_applied(conn: psycopg.Connection, migration_id: str, checksum: str) ->
     )
 
 
-def apply_file(conn: psycopg.Connection, path: Path) -> None:
+def set_lock_timeout(conn: psycopg.Connection, lock_timeout_ms: int, local: bool = True) -> None:
+    if lock_timeout_ms > 0:
+        conn.execute("SELECT set_config('lock_timeout', %s, %s)", (f"{lock_timeout_ms}ms", local))
+
+
+@stage("apply_file", rows=lambda *_: 1)
+def apply_file(conn: psycopg.Connection, path: Path, lock_timeout_ms: int = 0) -> None:
     sql_text = path.read_text(encoding="utf-8")
     migration_id = str(path.resolve())
     checksum = sha256_text(sql_text)
@@ -77,9 +120,14 @@ def apply_file(conn: psycopg.Connection, path: Path) -> None:
         print(f"SKIP  {path.name} (already applied)")
         return
 
-    print(f"APPLY {path.name}")
+    covered = parse_baseline_manifest(sql_text)
     try:
-        conn.execute(sql_text)
+        if covered is not None:
+            apply_baseline(conn, path, sql_text, covered)
+        else:
+            print(f"APPLY {path.name}")
+            set_lock_timeout(conn, lock_timeout_ms)
+            conn.execute(sql_text)
         mark_applied(conn, migration_id, checksum)
         conn.commit()
     except Exception:
@@ -87,25 +135,494 @@ def apply_file(conn: psycopg.Connection, path: Path) -> None:
         raise
 
 
+BASELINE_MARKER = "-- calvia:squash-baseline"
+COVERS_RE = re.compile(r"^-- calvia:covers (\S+) ([0-9a-f]{64})$", re.MULTILINE)
+PSQL_RESTRICT_RE = re.compile(r"^\\(?:un)?restrict \S+$")
+
+
+def parse_baseline_manifest(sql_text: str) -> list[tuple[str, str]] | None:
+    """(file name, sha256) pairs covered by a squashed baseline, or None for a normal file."""
+    if BASELINE_MARKER not in sql_text:
+        return None
+    return COVERS_RE.findall(sql_text)
+
+
+def apply_baseline(conn: psycopg.Connection, path: Path, sql_text: str, covered: list[tuple[str, str]]) -> None:
+    applied = [name for name, checksum in covered if was_applied(conn, str(path.parent / name), checksum)]
+    if len(applied) == len(covered):
+        print(f"SKIP  {path.name} (baseline; all {len(covered)} squashed files already applied)")
+        return
+    if applied:
+        raise SystemExit(
+            f"{path.name} squashes {len(covered)} files but only {len(applied)} are applied here; "
+            "apply the original migrations up to the squash point instead."
+        )
+    print(f"APPLY {path.name} (baseline for {len(covered)} files)")
+    conn.execute(sql_text)
+    # pg_dump output changes session settings such as search_path.
+    conn.execute("RESET ALL")
+    for name, checksum in covered:
+        mark_applied(conn, str(path.parent / name), checksum)
+
+
+DOLLAR_TAG_RE = re.compile(r"\$(?:[A-Za-z_][A-Za-z0-9_]*)?\$")
+LEADING_COMMENTS_RE = re.compile(r"\A(?:\s+|--[^\n]*(?:\n|\Z)|/\*.*?\*/)*", re.DOTALL)
+CREATE_INDEX_RE = re.compile(
+    r"CREATE\s+(UNIQUE\s+)?INDEX\s+(?!CONCURRENTLY\b)(?:IF\s+NOT\s+EXISTS\s+)?([\w.\"]+)\s+ON\s+(?!ONLY\b)([\w.\"]+)",
+    re.IGNORECASE,
+)
+DROP_INDEX_RE = re.compile(r"DROP\s+INDEX\s+(?!CONCURRENTLY\b)(?:IF\s+EXISTS\s+)?([\w.\"]+)\s*\Z", re.IGNORECASE)
+DEFAULT_LOCK_TIMEOUT_MS = 2000
+
+
+def split_statements(sql_text: str) -> list[str]:
+    """Split on top-level `;`, keeping quoted strings, comments and $$ bodies intact."""
+    statements: list[str] = []
+    start = 0
+    i = 0
+    n = len(sql_text)
+    while i < n:
+        ch = sql_text[i]
+        if sql_text.startswith("--", i):
+            end = sql_text.find("\n", i)
+            i = n if end < 0 else end + 1
+            continue
+        if sql_text.startswith("/*", i):
+            end = sql_text.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            continue
+        if ch in "'\"":
+            backslashes = ch == "'" and i > 0 and sql_text[i - 1] in "eE"
+            i += 1
+            while i < n:
+                if backslashes and sql_text[i] == "\\":
+                    i += 2
+                    continue
+                if sql_text[i] == ch:
+                    if sql_text.startswith(ch, i + 1):
+                        i += 2
+                        continue
+                    break
+                i += 1
+            i += 1
+            continue
+        if ch == "$" and (i == 0 or not (sql_text[i - 1].isalnum() or sql_text[i - 1] == "_")):
+            tag = DOLLAR_TAG_RE.match(sql_text, i)
+            if tag:
+                end = sql_text.find(tag.group(0), tag.end())
+                i = n if end < 0 else end + len(tag.group(0))
+                continue
+        if ch == ";":
+            statements.append(sql_text[start:i])
+            start = i + 1
+        i += 1
+    statements.append(sql_text[start:])
+    return [s.strip() for s in statements if statement_head(s)]
+
+
+def statement_head(statement: str) -> str:
+    """The statement without leading whitespace and comments."""
+    return statement[LEADING_COMMENTS_RE.match(statement).end() :].strip()
+
+
+def concurrent_rewrite(conn: psycopg.Connection, statement: str) -> tuple[str, str] | None:
+    """(index name, CONCURRENTLY statement) for an index build/drop on an existing relation, else None."""
+    head = statement_head(statement)
+    match = CREATE_INDEX_RE.match(head)
+    if match:
+        unique, name, table = match.groups()
+        # A table created earlier in the same file is empty; building inside the transaction is cheaper.
+        if conn.execute("SELECT to_regclass(%s)", (table,)).fetchone()[0] is None:
+            return None
+        rest = head[match.end(2) :]
+        return name, f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY IF NOT EXISTS {name}{rest}"
+    match = DROP_INDEX_RE.match(head)
+    if match:
+        name = match.group(1)
+        if conn.execute("SELECT to_regclass(%s)", (name,)).fetchone()[0] is None:
+            return None
+        return name, f"DROP INDEX CONCURRENTLY IF EXISTS {name}"
+    return None
+
+
+def plan_online(conn: psycopg.Connection, sql_text: str) -> list[tuple[str, str | None]]:
+    """
+    File as ordered steps: (sql, None) runs in a transaction, (sql, index) runs
+    concurrently. Consecutive transactional statements are merged into one step.
+    """
+    steps: list[tuple[str, str | None]] = []
+    pending: list[str] = []
+    for statement in split_statements(sql_text):
+        rewrite = concurrent_rewrite(conn, statement)
+        if rewrite is None:
+            pending.append(statement)
+            continue
+        if pending:
+            steps.append((";\n".join(pending), None))
+            pending = []
+        name, concurrent_sql = rewrite
+        steps.append((concurrent_sql, name))
+    if pending:
+        steps.append((";\n".join(pending), None))
+    return steps
+
+
+def drop_invalid_index(conn: psycopg.Connection, name: str) -> None:
+    # A failed or interrupted CONCURRENTLY build leaves an INVALID index that IF NOT EXISTS would keep.
+    row = conn.execute(
+        "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,)
+    ).fetchone()
+    if row and row[0]:
+        print(f"  dropping invalid index {name} left by an earlier build")
+        conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def run_concurrent(conn: psycopg.Connection, statement: str, index_name: str, lock_timeout_ms: int) -> None:
+    # CONCURRENTLY cannot run inside a transaction block.
+    conn.autocommit = True
+    try:
+        set_lock_timeout(conn, lock_timeout_ms, local=False)
+        drop_invalid_index(conn, index_name)
+        conn.execute(statement)
+        drop_invalid_index(conn, index_name)
+    finally:
+        conn.execute("RESET lock_timeout")
+        conn.autocommit = False
+
+
+def run_transactional(conn: psycopg.Connection, statement: str, lock_timeout_ms: int) -> None:
+    set_lock_timeout(conn, lock_timeout_ms)
+    conn.execute(statement)
+
+
+@stage("apply_file_online", rows=lambda *_: 1)
+def apply_file_online(pool: ConnectionPool, path: Path, lock_timeout_ms: int, attempts: int) -> None:
+    sql_text = path.read_text(encoding="utf-8")
+    migration_id = str(path.resolve())
+    checksum = sha256_text(sql_text)
+
+    with pool.connection() as conn:
+        applied = was_applied(conn, migration_id, checksum)
+        steps = [] if applied else plan_online(conn, sql_text)
+        baseline = parse_baseline_manifest(sql_text) is not None
+    if applied:
+        print(f"SKIP  {path.name} (already applied)")
+        return
+    concurrent = [name for _, name in steps if name]
+    if baseline or not concurrent:
+        # Nothing to build concurrently: one transaction, as without --online.
+        run_with_retry(
+            pool, lambda conn: apply_file(conn, path, lock_timeout_ms), attempts=attempts, label=path.name
+        )
+        return
+
+    print(f"APPLY {path.name} (online; {len(concurrent)} concurrent index operations)")
+    # LockNotAvailable (lock_timeout) is an OperationalError, so run_with_retry backs off and retries it.
+    for number, (statement, index_name) in enumerate(steps, start=1):
+        label = f"{path.name} step {number}/{len(steps)}"
+        if index_name:
+            print(f"  CONCURRENTLY {index_name}")
+            run_with_retry(
+                pool,
+                lambda conn, s=statement, i=index_name: run_concurrent(conn, s, i, lock_timeout_ms),
+                attempts=attempts,
+                label=label,
+            )
+        else:
+            run_with_retry(
+                pool,
+                lambda conn, s=statement: run_transactional(conn, s, lock_timeout_ms),
+                attempts=attempts,
+                label=label,
+            )
+    run_with_retry(pool, lambda conn: mark_applied(conn, migration_id, checksum), label=path.name)
+
+
+def apply_files(
+    db_url: str,
+    files: list[Path],
+    online: bool = False,
+    lock_timeout_ms: int = 0,
+    attempts: int = DEFAULT_ATTEMPTS,
+) -> None:
+    with open_pool(db_url, row_factory=tuple_row) as pool:
+        run_with_retry(pool, ensure_ledger, label="ensure_ledger")
+        for f in files:
+            if online:
+                apply_file_online(pool, f, lock_timeout_ms, attempts)
+                continue
+            # Each file is one transaction, so a dropped connection replays only that file.
+            run_with_retry(
+                pool, lambda conn, f=f: apply_file(conn, f, lock_timeout_ms), attempts=attempts, label=f.name
+            )
+
+
+TEMPLATE_PREFIX = "calvia_tpl_"
+
+
+def combined_checksum(files: list[Path]) -> str:
+    """Checksum over every file's name and content, in apply order."""
+    digest = hashlib.sha256()
+    for f in files:
+        digest.update(f.name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(sha256_text(f.read_text(encoding="utf-8")).encode("ascii"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def template_name(files: list[Path]) -> str:
+    return f"{TEMPLATE_PREFIX}{combined_checksum(files)[:16]}"
+
+
+def database_url(db_url: str, dbname: str) -> str:
+    return make_conninfo(db_url, dbname=dbname)
+
+
+def connect_admin(db_url: str) -> psycopg.Connection:
+    # CREATE/DROP DATABASE cannot run inside a transaction block.
+    return psycopg.connect(db_url, autocommit=True, **connection_kwargs(db_url, row_factory=tuple_row))
+
+
+def database_exists(admin: psycopg.Connection, dbname: str) -> bool:
+    return admin.execute("SELECT 1 FROM pg_database WHERE datname = %s", (dbname,)).fetchone() is not None
+
+
+def drop_database(admin: psycopg.Connection, dbname: str) -> None:
+    admin.execute(sql.SQL("DROP DATABASE IF EXISTS {} WITH (FORCE)").format(sql.Identifier(dbname)))
+
+
+@stage("build_template")
+def build_template(admin: psycopg.Connection, db_url: str, files: list[Path], name: str) -> None:
+    """Migrate a scratch database, then rename it into place so a half-built template is never cloned."""
+    building = f"{name}_building"
+    drop_database(admin, building)
+    admin.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(building)))
+    try:
+        apply_files(database_url(db_url, building), files)
+    except BaseException:
+        drop_database(admin, building)
+        raise
+    admin.execute(sql.SQL("ALTER DATABASE {} RENAME TO {}").format(sql.Identifier(building), sql.Identifier(name)))
+    admin.execute(sql.SQL("ALTER DATABASE {} WITH IS_TEMPLATE true").format(sql.Identifier(name)))
+
+
+def drop_stale_templates(admin: psycopg.Connection, keep: str) -> None:
+    rows = admin.execute(
+        "SELECT datname FROM pg_database WHERE datname LIKE %s AND datname <> %s",
+        (TEMPLATE_PREFIX + "%", keep),
+    ).fetchall()
+    for (dbname,) in rows:
+        if dbname.endswith("_building"):
+            continue
+        admin.execute(sql.SQL("ALTER DATABASE {} WITH IS_TEMPLATE false").format(sql.Identifier(dbname)))
+        drop_database(admin, dbname)
+        print(f"Dropped stale template {dbname}")
+
+
+def ensure_template(admin: psycopg.Connection, db_url: str, files: list[Path], rebuild: bool = False) -> str:
+    name = template_name(files)
+    # Serialize concurrent test runs building the same template.
+    admin.execute("SELECT pg_advisory_lock(hashtext(%s))", (name,))
+    try:
+        if rebuild and database_exists(admin, name):
+            admin.execute(sql.SQL("ALTER DATABASE {} WITH IS_TEMPLATE false").format(sql.Identifier(name)))
+            drop_database(admin, name)
+        if database_exists(admin, name):
+            print(f"Template {name} is current")
+        else:
+            print(f"Building template {name} from {len(files)} files")
+            build_template(admin, db_url, files, name)
+            drop_stale_templates(admin, name)
+    finally:
+        admin.execute("SELECT pg_advisory_unlock(hashtext(%s))", (name,))
+    return name
+
+
+def extension_statements(template_url: str) -> list[str]:
+    """CREATE EXTENSION lines for the template, which a public-schema dump leaves out."""
+    with psycopg.connect(template_url, row_factory=tuple_row) as conn:
+        rows = conn.execute(
+            """
+            SELECT e.extname, n.nspname
+            FROM pg_extension e
+            JOIN pg_namespace n ON n.oid = e.extnamespace
+            WHERE e.extname <> 'plpgsql'
+            ORDER BY e.extname
+            """
+        ).fetchall()
+    return [f'CREATE EXTENSION IF NOT EXISTS "{name}" WITH SCHEMA "{schema}";' for name, schema in rows]
+
+
+def foreign_trigger_statements(template_url: str) -> list[str]:
+    """
+    CREATE TRIGGER lines for triggers on non-public tables that call public
+    functions, i.e. the ones our migrations added (e.g. on_auth_user_created);
+    the platform's own triggers in auth/storage call their own schema's functions.
+    """
+    with psycopg.connect(template_url, row_factory=tuple_row) as conn:
+        # Empty search_path: pg_get_triggerdef then schema-qualifies the function,
+        # which the dump body (it also clears search_path) needs.
+        conn.execute("SET search_path = ''")
+        rows = conn.execute(
+            """
+            SELECT t.tgname, n.nspname, c.relname, pg_get_triggerdef(t.oid)
+            FROM pg_trigger t
+            JOIN pg_class c ON c.oid = t.tgrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            JOIN pg_proc p ON p.oid = t.tgfoid
+            JOIN pg_namespace pn ON pn.oid = p.pronamespace
+            WHERE NOT t.tgisinternal AND n.nspname <> 'public' AND pn.nspname = 'public'
+            ORDER BY n.nspname, c.relname, t.tgname
+            """
+        ).fetchall()
+    statements: list[str] = []
+    for trigger, schema, table, definition in rows:
+        statements.append(f'DROP TRIGGER IF EXISTS "{trigger}" ON "{schema}"."{table}";')
+        statements.append(f"{definition};")
+    return statements
+
+
+@stage("squash")
+def write_baseline(template_url: str, files: list[Path], out_path: Path) -> None:
+    pg_dump = shutil.which("pg_dump")
+    if not pg_dump:
+        raise SystemExit("--squash needs pg_dump on PATH.")
+    dump = subprocess.run(
+        [
+            pg_dump,
+            f"--dbname={template_url}",
+            "--schema=public",
+            "--exclude-table=public.codex_external_migrations",
+            "--no-owner",
+            # Plain INSERTs so the runner can execute the file without psql's COPY FROM stdin.
+            "--inserts",
+            "--rows-per-insert=500",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    # Drop psql-only \restrict/\unrestrict lines (pg_dump 17.6+); the runner executes plain SQL.
+    body = "\n".join(line for line in dump.splitlines() if not PSQL_RESTRICT_RE.match(line))
+
+    header = [
+        "/*",
+        "  # Squashed baseline",
+        "",
+        f"  Generated by scripts/run_sql_migrations.py --squash from {len(files)} files",
+        f"  (combined checksum {combined_checksum(files)}). Move the covered files out",
+        "  of the migration path; databases that already applied them skip this file.",
+        "*/",
+        "",
+        BASELINE_MARKER,
+        *(f"-- calvia:covers {f.name} {sha256_text(f.read_text(encoding='utf-8'))}" for f in files),
+        "",
+        *extension_statements(template_url),
+        "",
+    ]
+    footer = foreign_trigger_statements(template_url)
+    if footer:
+        footer = ["", "-- Triggers on tables outside the public schema", *footer]
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text("\n".join(header) + body + "\n".join(footer) + "\n", encoding="utf-8")
+
+
+@stage("create_test_db")
+def create_test_db(admin: psycopg.Connection, template: str, dbname: str) -> None:
+    drop_database(admin, dbname)
+    admin.execute(
+        sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(sql.Identifier(dbname), sql.Identifier(template))
+    )
+
+
 def main() -> int:
     parser = argparse.ArgumentParser()
     parser.add_argument("--db-url", default=os.environ.get("CALVIA_DB_URL", ""))
-    parser.add_argument("--path", action="append", required=True, help="SQL file or directory; may be repeated")
+    parser.add_argument("--path", action="append", help="SQL file or directory; may be repeated")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--create-test-db",
+        metavar="NAME",
+        help="(Re)create database NAME from the cached migrated template instead of applying files to --db-url",
+    )
+    mode.add_argument("--drop-test-db", metavar="NAME", help="Drop a database made with --create-test-db")
+    mode.add_argument(
+        "--squash",
+        metavar="OUT",
+        help="Write a single baseline .sql covering every file in --path (uses the migrated template)",
+    )
+    parser.add_argument(
+        "--rebuild-template",
+        action="store_true",
+        help="With --create-test-db/--squash: rebuild the template even if its checksum matches",
+    )
+    parser.add_argument(
+        "--online",
+        action="store_true",
+        help="Build/drop indexes on existing tables CONCURRENTLY outside the file's transaction",
+    )
+    parser.add_argument(
+        "--lock-timeout",
+        type=int,
+        default=None,
+        metavar="MS",
+        help=f"lock_timeout per statement in ms; 0 disables (default: {DEFAULT_LOCK_TIMEOUT_MS} with --online, else 0)",
+    )
+    parser.add_argument(
+        "--lock-retries",
+        type=int,
+        default=DEFAULT_ATTEMPTS,
+        help="Attempts per transaction or index build when a lock is not granted in time",
+    )
+    add_profile_argument(parser, "run_sql_migrations")
     args = parser.parse_args()
 
     if not args.db_url:
         raise SystemExit("Missing --db-url (or CALVIA_DB_URL).")
+    lock_timeout_ms = args.lock_timeout
+    if lock_timeout_ms is None:
+        lock_timeout_ms = DEFAULT_LOCK_TIMEOUT_MS if args.online else 0
 
+    if args.drop_test_db:
+        if args.drop_test_db.startswith(TEMPLATE_PREFIX):
+            raise SystemExit("Refusing to drop a template database.")
+        with connect_admin(args.db_url) as admin:
+            drop_database(admin, args.drop_test_db)
+        print(f"Dropped {args.drop_test_db}")
+        return 0
+
+    if not args.path:
+        raise SystemExit("Missing --path.")
     paths = [Path(p).expanduser().resolve() for p in args.path]
     files = iter_sql_files(paths)
     if not files:
         raise SystemExit("No .sql files found in provided paths.")
 
-    with psycopg.connect(args.db_url) as conn:
-        ensure_ledger(conn)
-        conn.commit()
-        for f in files:
-            apply_file(conn, f)
+    if args.squash:
+        out_path = Path(args.squash).expanduser().resolve()
+        if out_path in files:
+            raise SystemExit("--squash output must not be one of the files being squashed.")
+        with session(args.profile):
+            with connect_admin(args.db_url) as admin:
+                template = ensure_template(admin, args.db_url, files, args.rebuild_template)
+            write_baseline(database_url(args.db_url, template), files, out_path)
+        print(f"Wrote baseline {out_path} covering {len(files)} files.")
+        return 0
+
+    if args.create_test_db:
+        with session(args.profile), connect_admin(args.db_url) as admin:
+            template = ensure_template(admin, args.db_url, files, args.rebuild_template)
+            started = time.perf_counter()
+            create_test_db(admin, template, args.create_test_db)
+        print(
+            f"Created {args.create_test_db} from {template} in {time.perf_counter() - started:.2f}s. "
+            f"Connect with dbname={args.create_test_db}."
+        )
+        return 0
+
+    with session(args.profile):
+        apply_files(args.db_url, files, args.online, lock_timeout_ms, args.lock_retries)
 
     print(f"Done. Applied/checked {len(files)} files.")
     return 0
@@ -0,0 +1,207 @@
+"""
+Per-stage instrumentation shared by the import/sync/migration scripts.
+
+Functions are tagged with `@stage(...)`. While a `session()` is active each
+call records wall time, rows, DB round trips and peak RSS under the stage
+name; outside a session the decorator is a plain passthrough. Round trips
+are reported through `note_round_trip()`, which the counting cursors in
+db_connection.py call for every statement. This module stays stdlib-only
+so scripts without psycopg can still be profiled.
+
+`--profile [PATH]` (see `add_profile_argument`) also runs cProfile and dumps
+a pstats file next to the stage summary table.
+"""
+
+from __future__ import annotations
+
+import argparse
+import cProfile
+import functools
+import inspect
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Iterator, TypeVar
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None  # type: ignore[assignment]
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@dataclass
+class StageStats:
+    name: str
+    calls: int = 0
+    seconds: float = 0.0
+    rows: int = 0
+    round_trips: int = 0
+    peak_rss_mb: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+class Profiler:
+    def __init__(self) -> None:
+        self.stages: dict[str, StageStats] = {}
+        self.round_trips = 0
+
+    def record(self, name: str, seconds: float, rows: int, round_trips: int) -> None:
+        stats = self.stages.setdefault(name, StageStats(name=name))
+        stats.calls += 1
+        stats.seconds += seconds
+        stats.rows += rows
+        stats.round_trips += round_trips
+        stats.peak_rss_mb = max(stats.peak_rss_mb, peak_rss_mb())
+
+    def summary_table(self) -> str:
+        header = f"{'stage':<28} {'calls':>6} {'seconds':>10} {'rows':>10} {'rows/s':>11} {'db_rt':>8} {'rss_mb':>8}"
+        lines = [header, "-" * len(header)]
+        for s in self.stages.values():
+            lines.append(
+                f"{s.name:<28} {s.calls:>6} {s.seconds:>10.3f} {s.rows:>10} "
+                f"{s.rows_per_sec:>11.1f} {s.round_trips:>8} {s.peak_rss_mb:>8.1f}"
+            )
+        return "\n".join(lines)
+
+
+_active: Profiler | None = None
+
+
+def active() -> Profiler | None:
+    return _active
+
+
+def peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def note_round_trip(count: int = 1) -> None:
+    if _active is not None:
+        _active.round_trips += count
+
+
+def count_result(result: Any, *args: Any, **kwargs: Any) -> int:
+    try:
+        return len(result)
+    except TypeError:
+        return 0
+
+
+def stage(name: str, rows: Callable[..., int] = count_result) -> Callable[[F], F]:
+    """
+    Record calls to the decorated function under `name`.
+
+    `rows` receives the return value followed by the call arguments. Generator
+    functions are timed only while producing items, and their rows are the
+    number of items yielded.
+    """
+
+    def decorate(fn: F) -> F:
+        if inspect.isgeneratorfunction(fn):
+
+            @functools.wraps(fn)
+            def gen_wrapper(*args: Any, **kwargs: Any) -> Iterator[Any]:
+                profiler = _active
+                if profiler is None:
+                    yield from fn(*args, **kwargs)
+                    return
+                seconds = 0.0
+                produced = 0
+                trips_before = profiler.round_trips
+                inner = fn(*args, **kwargs)
+                try:
+                    while True:
+                        started = time.perf_counter()
+                        try:
+                            item = next(inner)
+                        except StopIteration:
+                            seconds += time.perf_counter() - started
+                            break
+                        seconds += time.perf_counter() - started
+                        produced += 1
+                        yield item
+                finally:
+                    inner.close()
+                    profiler.record(name, seconds, produced, profiler.round_trips - trips_before)
+
+            return gen_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            profiler = _active
+            if profiler is None:
+                return fn(*args, **kwargs)
+            trips_before = profiler.round_trips
+            started = time.perf_counter()
+            result = fn(*args, **kwargs)
+            elapsed = time.perf_counter() - started
+            profiler.record(name, elapsed, rows(result, *args, **kwargs), profiler.round_trips - trips_before)
+            return result
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+@contextmanager
+def timed_stage(name: str) -> Iterator[StageStats]:
+    """Context-manager form of `stage` for inline blocks; set `.rows` on the yielded stats."""
+    pending = StageStats(name=name)
+    profiler = _active
+    if profiler is None:
+        yield pending
+        return
+    trips_before = profiler.round_trips
+    started = time.perf_counter()
+    try:
+        yield pending
+    finally:
+        profiler.record(name, time.perf_counter() - started, pending.rows, profiler.round_trips - trips_before)
+
+
+def add_profile_argument(parser: argparse.ArgumentParser, script_name: str) -> None:
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=f"{script_name}.pstats",
+        default=None,
+        metavar="PATH",
+        help="Run under cProfile, dump pstats to PATH and print a per-stage summary",
+    )
+
+
+@contextmanager
+def session(profile_path: str | None) -> Iterator[Profiler | None]:
+    """Activate stage recording and cProfile when `profile_path` is set; no-op otherwise."""
+    global _active
+    if not profile_path:
+        yield None
+        return
+
+    profiler = Profiler()
+    cprofile = cProfile.Profile()
+    _active = profiler
+    cprofile.enable()
+    try:
+        yield profiler
+    finally:
+        cprofile.disable()
+        _active = None
+        out_path = Path(profile_path).expanduser().resolve()
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        cprofile.dump_stats(str(out_path))
+        print("Stage summary:")
+        print(profiler.summary_table())
+        print(f"Wrote profile: {out_path} (inspect with `python -m pstats {out_path}`)")
@@ -0,0 +1,244 @@
+"""
+Asyncio engine for sync_businesses_to_listings.py (`--engine async`).
+
+Businesses are read in keyset pages while earlier pages are still being
+written on other pooled `AsyncConnection`s, so round trips to a remote
+database overlap instead of adding up. A semaphore caps how many pages can be
+read but not yet written. Missing target categories are resolved once per
+page and created in their own committed transaction, before any listing
+that references them is written. With `--lock-categories wait` each page
+write also takes the job_locks.py category locks. Pages are in id order
+and usually share categories, so in-flight writers of one run then queue
+on each other. For that reason it is opt-in for this engine.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import Counter
+from typing import Any, AsyncIterator
+
+import psycopg
+
+from db_connection import open_async_pool, run_with_retry_async
+from job_locks import LOCK_SQL, category_lock_keys, metrics as lock_metrics
+from listing_stats import (
+    APPLY_DELTA_SQL,
+    DEFER_LISTING_STATS_SQL,
+    LISTING_KEYS_SQL,
+    delta_params,
+    keys_from_rows,
+    stats_delta,
+)
+from refresh_search_index import DEFER_SEARCH_INDEX_SQL, REFRESH_SEARCH_INDEX_SQL
+from sync_businesses_to_listings import (
+    BACKFILL_REVIEWS_SQL,
+    BUSINESSES_SQL,
+    CDC_ORIGIN_SQL,
+    CATEGORIES_SQL,
+    INSERT_CATEGORY_SQL,
+    LOCK_LISTINGS_SQL,
+    PENDING_LISTING_EDITS_SQL,
+    SUPPRESS_REVIEW_TRIGGER_SQL,
+    UPSERT_LISTING_SQL,
+    UPSERT_MAPPING_SQL,
+    CategoryRow,
+    categories_from_rows,
+    category_insert_params,
+    find_target_category,
+    listing_ids_for,
+    listing_params,
+    new_target_category,
+    source_category,
+    stats_key,
+)
+
+
+PAGE_SQL = BUSINESSES_SQL + """WHERE (%s::uuid IS NULL OR b.id > %s::uuid)
+ORDER BY b.id
+LIMIT %s
+"""
+
+DEFAULT_MAX_IN_FLIGHT = 4
+
+
+class CategoryResolver:
+    """Shared category cache; creation is serialized so concurrent pages never race on a slug."""
+
+    def __init__(self, pool: Any, categories_by_slug: dict[str, list[CategoryRow]]) -> None:
+        self.pool = pool
+        self.categories_by_slug = categories_by_slug
+        self._lock = asyncio.Lock()
+
+    async def resolve(self, sources: set[tuple[str, str]]) -> dict[str, str]:
+        """Map each (source_slug, source_name) to a target category id, creating missing ones."""
+        out: dict[str, str] = {}
+        missing: list[tuple[str, str]] = []
+        for source_slug, source_name in sorted(sources):
+            category_id = find_target_category(self.categories_by_slug, source_slug)
+            if category_id:
+                out[source_slug] = category_id
+            else:
+                missing.append((source_slug, source_name))
+        if not missing:
+            return out
+
+        async with self._lock:
+            # Another page may have created some of these while we waited.
+            created: dict[str, CategoryRow] = {}
+            pending: list[tuple[str, CategoryRow]] = []
+            for source_slug, source_name in missing:
+                category_id = find_target_category(self.categories_by_slug, source_slug)
+                if category_id:
+                    out[source_slug] = category_id
+                    continue
+                category = new_target_category(source_slug, source_name)
+                category = created.setdefault(category.slug, category)
+                pending.append((source_slug, category))
+
+            async def create(conn: psycopg.AsyncConnection) -> None:
+                async with conn.cursor() as cur:
+                    await cur.executemany(
+                        INSERT_CATEGORY_SQL,
+                        [category_insert_params(c) for c in created.values()],
+                    )
+
+            if created:
+                await run_with_retry_async(self.pool, create, label="create categories")
+            # Only cache categories once they are committed and visible to the writers.
+            for category in created.values():
+                self.categories_by_slug.setdefault(category.slug, []).append(category)
+            for source_slug, category in pending:
+                out[source_slug] = category.id
+        return out
+
+
+async def load_categories_async(conn: psycopg.AsyncConnection) -> dict[str, list[CategoryRow]]:
+    cur = await conn.execute(CATEGORIES_SQL)
+    return categories_from_rows(await cur.fetchall())
+
+
+async def read_pages(pool: Any, batch_size: int) -> AsyncIterator[list[dict[str, Any]]]:
+    last_id: Any = None
+    page_no = 0
+    while True:
+        page_no += 1
+
+        async def fetch(conn: psycopg.AsyncConnection) -> list[dict[str, Any]]:
+            cur = await conn.execute(PAGE_SQL, (last_id, last_id, batch_size))
+            return await cur.fetchall()
+
+        rows = await run_with_retry_async(pool, fetch, label=f"read page {page_no}")
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1]["id"]
+
+
+async def write_page(
+    pool: Any,
+    resolver: CategoryResolver,
+    page: list[dict[str, Any]],
+    page_no: int,
+    in_flight: asyncio.Semaphore,
+    bulk_reviews: bool = False,
+    listing_stats: bool = True,
+    lock_categories: bool = False,
+) -> int:
+    try:
+        targets = await resolver.resolve({source_category(b) for b in page})
+        listing_rows: list[tuple[Any, ...]] = []
+        mapping_rows: list[tuple[Any, str]] = []
+        for b, listing_id in zip(page, listing_ids_for([b["id"] for b in page])):
+            source_slug, _ = source_category(b)
+            listing_rows.append(listing_params(b, listing_id, targets[source_slug]))
+            mapping_rows.append((b["id"], listing_id))
+
+        listing_ids = [row[1] for row in mapping_rows]
+        lock_keys = category_lock_keys(source_category(b)[0] for b in page)
+
+        async def write(conn: psycopg.AsyncConnection) -> int:
+            async with conn.cursor() as cur:
+                await cur.execute(CDC_ORIGIN_SQL, ("batch_sync",))
+                await cur.execute(DEFER_SEARCH_INDEX_SQL)
+                if lock_categories:
+                    started = time.perf_counter()
+                    await cur.execute(LOCK_SQL, (lock_keys,))
+                    lock_metrics.record(len(lock_keys), 0, time.perf_counter() - started)
+                if bulk_reviews:
+                    await cur.execute(SUPPRESS_REVIEW_TRIGGER_SQL)
+                await cur.execute(LOCK_LISTINGS_SQL, (listing_ids,))
+                await cur.execute(PENDING_LISTING_EDITS_SQL, (listing_ids,))
+                pending = {r["row_id"] for r in await cur.fetchall()}
+                keep = [i for i, listing_id in enumerate(listing_ids) if listing_id not in pending]
+                if listing_stats:
+                    await cur.execute(DEFER_LISTING_STATS_SQL)
+                    await cur.execute(LISTING_KEYS_SQL, ([listing_ids[i] for i in keep],))
+                    old_keys = keys_from_rows(await cur.fetchall())
+                await cur.executemany(UPSERT_LISTING_SQL, [listing_rows[i] for i in keep])
+                await cur.executemany(UPSERT_MAPPING_SQL, [mapping_rows[i] for i in keep])
+                if listing_stats:
+                    new_keys = Counter(stats_key(listing_rows[i]) for i in keep)
+                    delta = stats_delta(old_keys, new_keys)
+                    if delta:
+                        await cur.execute(APPLY_DELTA_SQL, delta_params(delta))
+                if bulk_reviews:
+                    await cur.execute(BACKFILL_REVIEWS_SQL, ([page[i]["id"] for i in keep],))
+                await cur.execute(REFRESH_SEARCH_INDEX_SQL, ([listing_ids[i] for i in keep],))
+            return len(keep)
+
+        return await run_with_retry_async(pool, write, label=f"write page {page_no}")
+    finally:
+        in_flight.release()
+
+
+def raise_failed(tasks: list[asyncio.Task[int]]) -> None:
+    for task in tasks:
+        if task.done() and not task.cancelled() and task.exception() is not None:
+            raise task.exception()  # type: ignore[misc]
+
+
+async def sync_async(
+    db_url: str,
+    batch_size: int,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    bulk_reviews: bool = False,
+    listing_stats: bool = True,
+    lock_categories: bool = False,
+) -> tuple[int, int]:
+    """Upsert every business into listings/business_listing_map; returns (upserted, mapped)."""
+    max_in_flight = max(1, max_in_flight)
+    # One connection per in-flight writer, plus the reader and category creation.
+    async with open_async_pool(db_url, max_size=max_in_flight + 2) as pool:
+        categories_by_slug = await run_with_retry_async(pool, load_categories_async, label="load_categories")
+        resolver = CategoryResolver(pool, categories_by_slug)
+        in_flight = asyncio.Semaphore(max_in_flight)
+        tasks: list[asyncio.Task[int]] = []
+        try:
+            page_no = 0
+            async for page in read_pages(pool, batch_size):
+                page_no += 1
+                await in_flight.acquire()
+                raise_failed(tasks)
+                tasks.append(
+                    asyncio.create_task(
+                        write_page(
+                            pool,
+                            resolver,
+                            page,
+                            page_no,
+                            in_flight,
+                            bulk_reviews,
+                            listing_stats,
+                            lock_categories,
+                        )
+                    )
+                )
+            written = sum(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+    return written, written
@@ -1,23 +1,39 @@
 #!/usr/bin/env python3
 """
 Sync calvia.eu `businesses` into calvia.app `listings` (additive/upsert).
+
+`--engine async` runs the same upserts through sync_businesses_async.py,
+overlapping reads and writes for high-latency databases.
+
+Listings with an app edit still queued in `sync_outbox` are locked and left
+alone: cdc_consumer.py copies that edit back to the business first, and the
+next sync carries on from there.
 """
 
 from __future__ import annotations
 
 import argparse
+import asyncio
 import os
 import re
 import uuid
+from collections import Counter
 from dataclasses import dataclass
 from typing import Any
 
 import psycopg
-from psycopg.rows import dict_row
 from psycopg.types.json import Jsonb
 
+from db_connection import DEFAULT_BATCH_SIZE, open_pool, run_batches, run_with_retry
+from deterministic_ids import Uuid5Factory
+from job_locks import add_lock_argument, lock_categories, metrics as lock_metrics, parse_shard, shard_of
+from listing_stats import DEFER_LISTING_STATS_SQL, apply_stats_delta, read_listing_keys, stats_delta
+from refresh_search_index import DEFER_SEARCH_INDEX_SQL, refresh_search_index
+from stage_profiler import add_profile_argument, session, stage, timed_stage
+
 
 UUID_NS = uuid.UUID("11111111-1111-1111-1111-111111111111")
+sync_uuid5 = Uuid5Factory(UUID_NS)
 
 PARENT_BY_KEY = {
     "real_estate": "a1000000-0000-0000-0000-000000000001",
@@ -88,9 +104,96 @@ class CategoryRow:
     name: str
 
 
-def load_categories(conn: psycopg.Connection) -> dict[str, list[CategoryRow]]:
+CATEGORIES_SQL = "SELECT id, slug, parent_id, name FROM categories"
+
+INSERT_CATEGORY_SQL = """
+INSERT INTO categories (id, name, slug, description, icon_name, sort_order, display_order, parent_id)
+VALUES (%s, %s, %s, %s, %s, 999, 999, %s)
+ON CONFLICT (slug) DO NOTHING
+"""
+
+BUSINESSES_SQL = """
+SELECT
+  b.id,
+  b.name,
+  b.slug,
+  b.description,
+  b.phone,
+  b.email,
+  b.website,
+  b.address,
+  b.image_url,
+  b.social_links,
+  b.rating,
+  b.notes,
+  c.slug AS source_category_slug,
+  c.name AS source_category_name,
+  a.name AS area_name
+FROM businesses b
+JOIN categories c ON c.id = b.category_id
+LEFT JOIN areas a ON a.id = b.area_id
+"""
+
+UPSERT_LISTING_SQL = """
+INSERT INTO listings (
+  id,
+  category_id,
+  name,
+  description,
+  image_url,
+  contact_phone,
+  contact_email,
+  website_url,
+  address,
+  neighborhood,
+  social_media,
+  tags,
+  is_featured
+)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, COALESCE(%s, '{}'::jsonb), %s::text[], false)
+ON CONFLICT (id) DO UPDATE SET
+  category_id = EXCLUDED.category_id,
+  name = EXCLUDED.name,
+  description = EXCLUDED.description,
+  image_url = EXCLUDED.image_url,
+  contact_phone = EXCLUDED.contact_phone,
+  contact_email = EXCLUDED.contact_email,
+  website_url = EXCLUDED.website_url,
+  address = EXCLUDED.address,
+  neighborhood = EXCLUDED.neighborhood,
+  social_media = EXCLUDED.social_media,
+  tags = EXCLUDED.tags
+"""
+
+UPSERT_MAPPING_SQL = """
+INSERT INTO business_listing_map (business_id, listing_id)
+VALUES (%s, %s)
+ON CONFLICT (business_id) DO UPDATE SET listing_id = EXCLUDED.listing_id
+"""
+
+# See 20260220000500_bulk_review_backfill_for_mapping_sync.sql: the per-row mapping
+# trigger is skipped for the transaction and reviews are backfilled once per batch.
+SUPPRESS_REVIEW_TRIGGER_SQL = "SET LOCAL calvia.bulk_review_backfill = 'on'"
+
+BACKFILL_REVIEWS_SQL = "SELECT backfill_reviews_for_businesses(%s::uuid[])"
+
+# See 20260220000900_create_sync_outbox.sql: writes tagged with an origin are not
+# enqueued for the CDC consumer, since this sync already wrote both sides.
+CDC_ORIGIN_SQL = "SELECT set_config('calvia.cdc_origin', %s, true)"
+
+# Lock first, then look for queued edits in a fresh statement: an edit committed
+# while we waited for the lock is then visible, and later edits wait for us.
+LOCK_LISTINGS_SQL = "SELECT id FROM listings WHERE id = ANY(%s::uuid[]) ORDER BY id FOR UPDATE"
+
+PENDING_LISTING_EDITS_SQL = """
+SELECT DISTINCT row_id::text AS row_id
+FROM sync_outbox
+WHERE source_table = 'listings' AND row_id = ANY(%s::uuid[])
+"""
+
+
+def categories_from_rows(rows: list[dict[str, Any]]) -> dict[str, list[CategoryRow]]:
     out: dict[str, list[CategoryRow]] = {}
-    rows = conn.execute("SELECT id, slug, parent_id, name FROM categories").fetchall()
     for r in rows:
         row = CategoryRow(
             id=str(r["id"]),
@@ -102,12 +205,12 @@ def load_categories(conn: psycopg.Connection) -> dict[str, list[CategoryRow]]:
     return out
 
 
-def pick_target_category(
-    conn: psycopg.Connection,
-    categories_by_slug: dict[str, list[CategoryRow]],
-    source_slug: str,
-    source_name: str,
-) -> str:
+@stage("load_categories", rows=lambda result, *_: sum(len(v) for v in result.values()))
+def load_categories(conn: psycopg.Connection) -> dict[str, list[CategoryRow]]:
+    return categories_from_rows(conn.execute(CATEGORIES_SQL).fetchall())
+
+
+def find_target_category(categories_by_slug: dict[str, list[CategoryRow]], source_slug: str) -> str | None:
     preferred_slug = SLUG_MAP.get(source_slug, source_slug)
     candidates = categories_by_slug.get(preferred_slug, [])
     # Prefer discover subcategories (non-null parent_id) if available.
@@ -116,144 +219,281 @@ def pick_target_category(
             return c.id
     if candidates:
         return candidates[0].id
+    return None
 
+
+def new_target_category(source_slug: str, source_name: str) -> CategoryRow:
+    preferred_slug = SLUG_MAP.get(source_slug, source_slug)
     parent_key = choose_parent_key(source_slug)
     parent_id = PARENT_BY_KEY[parent_key]
-    new_slug = preferred_slug
     new_name = source_name.strip() if source_name.strip() else titleize_slug(preferred_slug)
-    new_id = str(uuid.uuid5(UUID_NS, f"calvia-sync-category:{new_slug}:{parent_id}"))
-
-    conn.execute(
-        """
-        INSERT INTO categories (id, name, slug, description, icon_name, sort_order, display_order, parent_id)
-        VALUES (%s, %s, %s, %s, %s, 999, 999, %s)
-        ON CONFLICT (slug) DO NOTHING
-        """,
-        (
-            new_id,
-            new_name,
-            new_slug,
-            "Auto-created during businesses->listings sync",
-            "folder",
-            parent_id,
-        ),
+    new_id = sync_uuid5(f"calvia-sync-category:{preferred_slug}:{parent_id}")
+    return CategoryRow(id=new_id, slug=preferred_slug, parent_id=parent_id, name=new_name)
+
+
+def category_insert_params(category: CategoryRow) -> tuple[Any, ...]:
+    return (
+        category.id,
+        category.name,
+        category.slug,
+        "Auto-created during businesses->listings sync",
+        "folder",
+        category.parent_id,
     )
+
+
+def new_categories(
+    before: dict[str, list[CategoryRow]], after: dict[str, list[CategoryRow]]
+) -> dict[str, list[CategoryRow]]:
+    """Categories in `after` (a working copy of `before`) that `pick_target_category` created."""
+    added: dict[str, list[CategoryRow]] = {}
+    for slug, rows in after.items():
+        known = len(before.get(slug, []))
+        if len(rows) > known:
+            added[slug] = rows[known:]
+    return added
+
+
+def merge_categories(cache: dict[str, list[CategoryRow]], added: dict[str, list[CategoryRow]]) -> None:
+    for slug, rows in added.items():
+        cache.setdefault(slug, []).extend(rows)
+
+
+def pick_target_category(
+    conn: psycopg.Connection,
+    categories_by_slug: dict[str, list[CategoryRow]],
+    source_slug: str,
+    source_name: str,
+) -> str:
+    existing_id = find_target_category(categories_by_slug, source_slug)
+    if existing_id:
+        return existing_id
+
+    category = new_target_category(source_slug, source_name)
+    conn.execute(INSERT_CATEGORY_SQL, category_insert_params(category))
     # Refresh cache for this slug
-    categories_by_slug.setdefault(new_slug, []).append(
-        CategoryRow(id=new_id, slug=new_slug, parent_id=parent_id, name=new_name)
+    categories_by_slug.setdefault(category.slug, []).append(category)
+    return category.id
+
+
+def source_category(b: dict[str, Any]) -> tuple[str, str]:
+    source_slug = b["source_category_slug"] or "imported"
+    source_name = b["source_category_name"] or titleize_slug(source_slug)
+    return source_slug, source_name
+
+
+def listing_ids_for(business_ids: list[Any]) -> list[str]:
+    return sync_uuid5.many([f"business-listing:{business_id}" for business_id in business_ids])
+
+
+def listing_params(b: dict[str, Any], listing_id: str, target_category_id: str) -> tuple[Any, ...]:
+    source_slug, _ = source_category(b)
+    tags = [source_slug]
+    if b["slug"]:
+        tags.append(slugify(str(b["slug"])))
+    return (
+        listing_id,
+        target_category_id,
+        b["name"] or "",
+        b["description"] or "",
+        b["image_url"] or "",
+        b["phone"] or "",
+        b["email"] or "",
+        b["website"] or "",
+        b["address"] or "",
+        b["area_name"] or "Calvia",
+        Jsonb(b["social_links"] or {}),
+        tags,
     )
-    return new_id
+
+
+def stats_key(params: tuple[Any, ...]) -> tuple[str, str]:
+    """category_listing_stats key of a listing_params() tuple."""
+    return str(params[1]), params[9]
+
+
+def pending_listing_edits(conn: psycopg.Connection, listing_ids: list[str]) -> set[str]:
+    """Lock `listing_ids` and return those whose app edit the CDC consumer has not applied yet."""
+    conn.execute(LOCK_LISTINGS_SQL, (listing_ids,))
+    return {r["row_id"] for r in conn.execute(PENDING_LISTING_EDITS_SQL, (listing_ids,)).fetchall()}
+
+
+@stage("read_businesses")
+def read_businesses(conn: psycopg.Connection) -> list[dict[str, Any]]:
+    return conn.execute(BUSINESSES_SQL + "ORDER BY b.created_at, b.name").fetchall()
+
+
+@stage("sync_businesses", rows=lambda result, *_: result[0])
+def sync_businesses(
+    conn: psycopg.Connection,
+    categories_by_slug: dict[str, list[CategoryRow]],
+    businesses: list[dict[str, Any]],
+    bulk_reviews: bool = False,
+    listing_stats: bool = True,
+) -> tuple[int, int]:
+    """Upsert `businesses` into listings/business_listing_map in the caller's transaction."""
+    upserted = 0
+    mapped = 0
+    conn.execute(CDC_ORIGIN_SQL, ("batch_sync",))
+    # One search index refresh for the whole batch instead of one per upsert statement.
+    conn.execute(DEFER_SEARCH_INDEX_SQL)
+    if bulk_reviews:
+        conn.execute(SUPPRESS_REVIEW_TRIGGER_SQL)
+    if listing_stats:
+        # Applied once per batch below instead of once per upsert statement.
+        conn.execute(DEFER_LISTING_STATS_SQL)
+    listing_ids = listing_ids_for([b["id"] for b in businesses])
+    pending = pending_listing_edits(conn, listing_ids)
+    if pending:
+        kept = [(b, listing_id) for b, listing_id in zip(businesses, listing_ids) if listing_id not in pending]
+        businesses = [b for b, _ in kept]
+        listing_ids = [listing_id for _, listing_id in kept]
+    old_keys = read_listing_keys(conn, listing_ids) if listing_stats else Counter()
+    new_keys: Counter[tuple[str, str]] = Counter()
+    for b, listing_id in zip(businesses, listing_ids):
+        source_slug, source_name = source_category(b)
+        target_category_id = pick_target_category(conn, categories_by_slug, source_slug, source_name)
+
+        params = listing_params(b, listing_id, target_category_id)
+        conn.execute(UPSERT_LISTING_SQL, params)
+        conn.execute(UPSERT_MAPPING_SQL, (b["id"], listing_id))
+        new_keys[stats_key(params)] += 1
+        upserted += 1
+        mapped += 1
+
+    if bulk_reviews and businesses:
+        conn.execute(BACKFILL_REVIEWS_SQL, ([b["id"] for b in businesses],))
+    if listing_stats:
+        apply_stats_delta(conn, stats_delta(old_keys, new_keys))
+    refresh_search_index(conn, listing_ids)
+    return upserted, mapped
 
 
 def main() -> int:
     parser = argparse.ArgumentParser()
     parser.add_argument("--db-url", default=os.environ.get("CALVIA_DB_URL", ""))
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Businesses per transaction; a dropped connection only replays the current batch",
+    )
+    parser.add_argument("--engine", choices=("sync", "async"), default="sync")
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=4,
+        help="Async engine only: batches read but not yet written",
+    )
+    parser.add_argument(
+        "--bulk-review-backfill",
+        action="store_true",
+        help="Skip the per-row mapping trigger and backfill reviews once per batch (needs migration 20260220000500)",
+    )
+    parser.add_argument(
+        "--listing-stats",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Apply each batch's (category, neighborhood) delta to category_listing_stats (migration 20260220000700)",
+    )
+    # Default depends on the engine: wait for sync, off for async (see sync_businesses_async.py).
+    add_lock_argument(parser, default=None)
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="K/N",
+        help="Sync engine only: handle the categories of shard K out of N, so N instances can run side by side",
+    )
+    add_profile_argument(parser, "sync_businesses_to_listings")
     args = parser.parse_args()
 
     if not args.db_url:
         raise SystemExit("Missing --db-url (or CALVIA_DB_URL).")
-
-    # Supabase pooler (PgBouncer transaction mode) can reject prepared statements.
-    with psycopg.connect(args.db_url, row_factory=dict_row, prepare_threshold=None) as conn:
-        categories_by_slug = load_categories(conn)
-
-        businesses = conn.execute(
-            """
-            SELECT
-              b.id,
-              b.name,
-              b.slug,
-              b.description,
-              b.phone,
-              b.email,
-              b.website,
-              b.address,
-              b.image_url,
-              b.social_links,
-              b.rating,
-              b.notes,
-              c.slug AS source_category_slug,
-              c.name AS source_category_name,
-              a.name AS area_name
-            FROM businesses b
-            JOIN categories c ON c.id = b.category_id
-            LEFT JOIN areas a ON a.id = b.area_id
-            ORDER BY b.created_at, b.name
-            """
-        ).fetchall()
-
-        upserted = 0
-        mapped = 0
-        for b in businesses:
-            source_slug = b["source_category_slug"] or "imported"
-            source_name = b["source_category_name"] or titleize_slug(source_slug)
-            target_category_id = pick_target_category(conn, categories_by_slug, source_slug, source_name)
-
-            listing_id = str(uuid.uuid5(UUID_NS, f"business-listing:{b['id']}"))
-            tags = [source_slug]
-            if b["slug"]:
-                tags.append(slugify(str(b["slug"])))
-
-            conn.execute(
-                """
-                INSERT INTO listings (
-                  id,
-                  category_id,
-                  name,
-                  description,
-                  image_url,
-                  contact_phone,
-                  contact_email,
-                  website_url,
-                  address,
-                  neighborhood,
-                  social_media,
-                  tags,
-                  is_featured
+    if args.engine == "async" and (args.lock_categories == "skip" or args.shard):
+        raise SystemExit("--lock-categories skip and --shard need --engine sync.")
+    if args.lock_categories is None:
+        args.lock_categories = "wait" if args.engine == "sync" else "off"
+
+    if args.engine == "async":
+        # Imported lazily: the async engine builds on this module's SQL and helpers.
+        from sync_businesses_async import sync_async
+
+        with session(args.profile), timed_stage("sync_async") as synced:
+            upserted, mapped = asyncio.run(
+                sync_async(
+                    args.db_url,
+                    args.batch_size,
+                    args.max_in_flight,
+                    args.bulk_review_backfill,
+                    args.listing_stats,
+                    args.lock_categories == "wait",
                 )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, COALESCE(%s, '{}'::jsonb), %s::text[], false)
-                ON CONFLICT (id) DO UPDATE SET
-                  category_id = EXCLUDED.category_id,
-                  name = EXCLUDED.name,
-                  description = EXCLUDED.description,
-                  image_url = EXCLUDED.image_url,
-                  contact_phone = EXCLUDED.contact_phone,
-                  contact_email = EXCLUDED.contact_email,
-                  website_url = EXCLUDED.website_url,
-                  address = EXCLUDED.address,
-                  neighborhood = EXCLUDED.neighborhood,
-                  social_media = EXCLUDED.social_media,
-                  tags = EXCLUDED.tags
-                """,
-                (
-                    listing_id,
-                    target_category_id,
-                    b["name"] or "",
-                    b["description"] or "",
-                    b["image_url"] or "",
-                    b["phone"] or "",
-                    b["email"] or "",
-                    b["website"] or "",
-                    b["address"] or "",
-                    b["area_name"] or "Calvia",
-                    Jsonb(b["social_links"] or {}),
-                    tags,
-                ),
             )
-
-            conn.execute(
-                """
-                INSERT INTO business_listing_map (business_id, listing_id)
-                VALUES (%s, %s)
-                ON CONFLICT (business_id) DO UPDATE SET listing_id = EXCLUDED.listing_id
-                """,
-                (b["id"], listing_id),
+            synced.rows = upserted
+        print(f"Synced businesses -> listings: {upserted} upserts, {mapped} mappings.")
+        if args.lock_categories == "wait":
+            print(lock_metrics.summary())
+        return 0
+
+    # Pooler URLs get prepared statements disabled in db_connection.
+    with session(args.profile), open_pool(args.db_url) as pool:
+        categories_by_slug = run_with_retry(pool, load_categories, label="load_categories")
+        businesses = run_with_retry(pool, read_businesses, label="read_businesses")
+        if args.shard:
+            index, count = args.shard
+            businesses = [b for b in businesses if shard_of(source_category(b)[0], count) == index]
+        if args.lock_categories != "off":
+            # Stable sort: a batch then spans few categories, so it waits on (or skips) few locks.
+            businesses.sort(key=lambda b: source_category(b)[0])
+
+        def sync_batch(
+            conn: psycopg.Connection, batch: list[dict[str, Any]]
+        ) -> tuple[int, int, list[dict[str, Any]], dict[str, list[CategoryRow]]]:
+            busy: list[dict[str, Any]] = []
+            if args.lock_categories != "off":
+                held = lock_categories(
+                    conn, {source_category(b)[0] for b in batch}, skip_if_busy=args.lock_categories == "skip"
+                )
+                busy = [b for b in batch if source_category(b)[0] not in held]
+                batch = [b for b in batch if source_category(b)[0] in held]
+            # Work on a copy: categories auto-created here reach the cache only in
+            # cache_categories, after the batch has committed.
+            batch_categories = {slug: list(rows) for slug, rows in categories_by_slug.items()}
+            upserted, mapped = sync_businesses(
+                conn,
+                batch_categories,
+                list(batch),
+                args.bulk_review_backfill,
+                args.listing_stats,
             )
-            upserted += 1
-            mapped += 1
+            return upserted, mapped, busy, new_categories(categories_by_slug, batch_categories)
+
+        def cache_categories(result: tuple[int, int, list[dict[str, Any]], dict[str, list[CategoryRow]]]) -> None:
+            merge_categories(categories_by_slug, result[3])
 
-        conn.commit()
+        results = run_batches(
+            pool, businesses, sync_batch, batch_size=args.batch_size, label="sync", on_commit=cache_categories
+        )
+        deferred = [b for r in results for b in r[2]]
+        retried = []
+        if deferred:
+            print(f"Retrying {len(deferred)} businesses whose categories were busy")
+            retried = run_batches(
+                pool,
+                deferred,
+                sync_batch,
+                batch_size=args.batch_size,
+                label="sync deferred",
+                on_commit=cache_categories,
+            )
+        upserted = sum(r[0] for r in results + retried)
+        mapped = sum(r[1] for r in results + retried)
         print(f"Synced businesses -> listings: {upserted} upserts, {mapped} mappings.")
+        skipped = sum(len(r[2]) for r in retried)
+        if skipped:
+            print(f"Skipped {skipped} businesses in categories still busy; the next run picks them up.")
+        if args.lock_categories != "off":
+            print(lock_metrics.summary())
     return 0
 
 
@@ -0,0 +1,122 @@
+"""
+Local taxonomy snapshot for import_zip_businesses.py (`--export-snapshot` / `--snapshot`).
+
+A snapshot holds everything a dry run reads from the database: categories,
+areas and the normalized dedupe keys of existing businesses, so
+`--dry-run --snapshot FILE` runs without `--db-url` and without a single
+round trip. It also records a digest per source table, taken in the same
+REPEATABLE READ transaction as the data. `--apply --snapshot FILE` compares
+those digests with the live database first and refuses a stale snapshot
+instead of deduping against outdated keys.
+"""
+
+from __future__ import annotations
+
+import json
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Sequence
+
+import psycopg
+
+from import_zip_businesses import (
+    Area,
+    BusinessKey,
+    Category,
+    existing_business_keys,
+    load_areas,
+    load_categories,
+    pack_business_keys,
+    read_existing_businesses,
+)
+from stage_profiler import stage
+
+
+SNAPSHOT_VERSION = 1
+
+# One digest per table over exactly the columns the importer reads from it.
+STATE_SQL = """
+SELECT
+  (SELECT md5(COALESCE(string_agg(ROW(id, slug, name, parent_id, display_order)::text, ',' ORDER BY id), ''))
+   FROM categories) AS categories,
+  (SELECT md5(COALESCE(string_agg(ROW(id, slug, name, latitude, longitude)::text, ',' ORDER BY id), ''))
+   FROM areas) AS areas,
+  (SELECT md5(COALESCE(string_agg(ROW(id, slug, name, address, website, area_id)::text, ',' ORDER BY id), ''))
+   FROM businesses) AS businesses
+"""
+
+
+@dataclass
+class TaxonomySnapshot:
+    created_at: str = ""
+    state: dict[str, str] = field(default_factory=dict)
+    categories_by_slug: dict[str, list[Category]] = field(default_factory=dict)
+    areas_by_slug: dict[str, Area] = field(default_factory=dict)
+    existing_keys: Sequence[BusinessKey] = field(default_factory=list)
+
+
+def taxonomy_state(conn: psycopg.Connection) -> dict[str, str]:
+    return dict(conn.execute(STATE_SQL).fetchone())
+
+
+@stage("read_snapshot", rows=lambda result, *_: len(result.existing_keys))
+def read_snapshot(conn: psycopg.Connection) -> TaxonomySnapshot:
+    # The digests must describe exactly the rows read below.
+    conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+    return TaxonomySnapshot(
+        created_at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        state=taxonomy_state(conn),
+        categories_by_slug=load_categories(conn),
+        areas_by_slug=load_areas(conn),
+        existing_keys=existing_business_keys(read_existing_businesses(conn)),
+    )
+
+
+def write_snapshot(path: Path, snapshot: TaxonomySnapshot) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "version": SNAPSHOT_VERSION,
+        "created_at": snapshot.created_at,
+        "state": snapshot.state,
+        "categories": [asdict(c) for rows in snapshot.categories_by_slug.values() for c in rows],
+        "areas": [asdict(a) for a in snapshot.areas_by_slug.values()],
+        # Positional rows keep the file small for large business tables.
+        "business_keys": [[k.name, k.address, k.area_id, k.website, k.slug] for k in snapshot.existing_keys],
+    }
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps(payload, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    tmp_path.replace(path)
+
+
+@stage("load_snapshot", rows=lambda result, *_: len(result.existing_keys))
+def load_snapshot(path: Path, compact_keys: bool = False) -> TaxonomySnapshot:
+    if not path.exists():
+        raise SystemExit(f"Taxonomy snapshot not found: {path} (create it with --export-snapshot).")
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    if payload.get("version") != SNAPSHOT_VERSION:
+        raise SystemExit(f"Unsupported taxonomy snapshot version in {path}; export it again.")
+    categories_by_slug: dict[str, list[Category]] = {}
+    for item in payload["categories"]:
+        categories_by_slug.setdefault(item["slug"], []).append(Category(**item))
+    return TaxonomySnapshot(
+        created_at=payload["created_at"],
+        state=payload["state"],
+        categories_by_slug=categories_by_slug,
+        areas_by_slug={item["slug"]: Area(**item) for item in payload["areas"]},
+        existing_keys=(
+            pack_business_keys(payload["business_keys"])
+            if compact_keys
+            else [BusinessKey(*values) for values in payload["business_keys"]]
+        ),
+    )
+
+
+def check_snapshot_fresh(conn: psycopg.Connection, snapshot: TaxonomySnapshot) -> None:
+    live = taxonomy_state(conn)
+    stale = sorted(table for table, digest in live.items() if snapshot.state.get(table) != digest)
+    if stale:
+        raise SystemExit(
+            f"Taxonomy snapshot from {snapshot.created_at} is stale ({', '.join(stale)} changed since); "
+            "re-run --export-snapshot or apply without --snapshot."
+        )
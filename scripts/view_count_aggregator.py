@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Buffered replacement for the per-view `increment_view_count(business_uuid)` RPC.
+
+The RPC (20260220000200_add_calvia_eu_compat_rls_and_rpc.sql) updates one
+`businesses` row per page view, so a popular listing's row becomes a lock
+hot spot during traffic spikes. This service accepts view events over HTTP:
+
+  POST /views    {"business_id": "<uuid>"} or {"business_ids": ["<uuid>", ...]}
+  GET  /metrics  queue depth and flush latency as JSON
+
+It coalesces events in memory per business and applies them every
+`--flush-interval` seconds, or sooner once `--max-pending` businesses are
+waiting. Each flush is one UPDATE over an unnest of (id, delta) in id
+order, so every row is locked once per window instead of once per view.
+A failed flush puts its deltas back into the buffer. Views still buffered
+when the process dies are lost, an accepted trade-off for a counter.
+
+`--simulate N` replays N synthetic views over `--simulate-businesses`
+existing businesses through the same buffer and flusher, checks that
+view_count grew by exactly N and prints the metrics. Use it against a
+local Postgres.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psycopg
+from psycopg_pool import ConnectionPool
+
+from db_connection import open_pool, run_with_retry
+from stage_profiler import add_profile_argument, session, stage
+
+
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_MAX_PENDING = 5000
+DEFAULT_PORT = 8787
+MAX_BODY_BYTES = 1 << 20
+
+FLUSH_SQL = """
+UPDATE businesses AS b
+SET view_count = COALESCE(b.view_count, 0) + v.delta
+FROM unnest(%s::uuid[], %s::integer[]) AS v(id, delta)
+WHERE b.id = v.id
+"""
+
+
+class ViewBuffer:
+    """Thread-safe per-business view counts waiting for the next flush."""
+
+    def __init__(self, max_pending: int = DEFAULT_MAX_PENDING) -> None:
+        self.max_pending = max_pending
+        self.full = threading.Event()
+        self._lock = threading.Lock()
+        self._pending: Counter[str] = Counter()
+        self._events = 0
+
+    def add(self, business_ids: list[str]) -> None:
+        with self._lock:
+            self._pending.update(business_ids)
+            self._events += len(business_ids)
+            if len(self._pending) >= self.max_pending:
+                self.full.set()
+
+    def drain(self) -> Counter[str]:
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._events = 0
+            self.full.clear()
+        return pending
+
+    def restore(self, deltas: Counter[str]) -> None:
+        with self._lock:
+            self._pending.update(deltas)
+            self._events += sum(deltas.values())
+
+    def depth(self) -> tuple[int, int]:
+        """(businesses, events) currently buffered."""
+        with self._lock:
+            return len(self._pending), self._events
+
+
+@dataclass
+class FlushMetrics:
+    flushes: int = 0
+    failed_flushes: int = 0
+    rows: int = 0
+    events: int = 0
+    last_latency_ms: float = 0.0
+    max_latency_ms: float = 0.0
+    total_latency_ms: float = 0.0
+    max_flush_rows: int = 0
+
+    def record(self, rows: int, events: int, latency_ms: float) -> None:
+        self.flushes += 1
+        self.rows += rows
+        self.events += events
+        self.last_latency_ms = latency_ms
+        self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+        self.total_latency_ms += latency_ms
+        self.max_flush_rows = max(self.max_flush_rows, rows)
+
+    def snapshot(self, buffer: ViewBuffer) -> dict[str, float]:
+        businesses, events = buffer.depth()
+        out = asdict(self)
+        out["avg_latency_ms"] = self.total_latency_ms / self.flushes if self.flushes else 0.0
+        out["queue_businesses"] = businesses
+        out["queue_events"] = events
+        return out
+
+
+@stage("flush_view_counts", rows=lambda result, *_: result)
+def apply_deltas(conn: psycopg.Connection, deltas: Counter[str]) -> int:
+    ids = sorted(deltas)
+    conn.execute(FLUSH_SQL, (ids, [deltas[i] for i in ids]))
+    return len(ids)
+
+
+def flush(pool: ConnectionPool, buffer: ViewBuffer, metrics: FlushMetrics) -> int:
+    deltas = buffer.drain()
+    if not deltas:
+        return 0
+    started = time.perf_counter()
+    try:
+        run_with_retry(pool, lambda conn: apply_deltas(conn, deltas), label="flush_view_counts")
+    except Exception:
+        buffer.restore(deltas)
+        metrics.failed_flushes += 1
+        raise
+    metrics.record(len(deltas), sum(deltas.values()), (time.perf_counter() - started) * 1000)
+    return len(deltas)
+
+
+class Flusher(threading.Thread):
+    def __init__(self, pool: ConnectionPool, buffer: ViewBuffer, metrics: FlushMetrics, interval: float) -> None:
+        super().__init__(name="view-count-flusher", daemon=True)
+        self.pool = pool
+        self.buffer = buffer
+        self.metrics = metrics
+        self.interval = interval
+        self.stopping = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopping.is_set():
+            self.buffer.full.wait(self.interval)
+            try:
+                flush(self.pool, self.buffer, self.metrics)
+            except Exception as exc:
+                print(f"Flush failed, deltas kept for the next window: {type(exc).__name__}: {exc}")
+        try:
+            flush(self.pool, self.buffer, self.metrics)
+        except Exception as exc:
+            businesses, events = self.buffer.depth()
+            print(f"Final flush failed, {events} views for {businesses} businesses lost: {type(exc).__name__}: {exc}")
+
+    def stop(self) -> None:
+        self.stopping.set()
+        self.buffer.full.set()
+        self.join()
+
+
+def parse_business_ids(payload: object) -> list[str]:
+    if not isinstance(payload, dict):
+        raise ValueError("expected a JSON object")
+    ids = payload.get("business_ids")
+    if ids is None:
+        ids = [payload.get("business_id")]
+    if not isinstance(ids, list):
+        raise ValueError("business_ids must be a list")
+    return [str(uuid.UUID(str(i))) for i in ids]
+
+
+def make_handler(buffer: ViewBuffer, metrics: FlushMetrics) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body: dict[str, object]) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self) -> None:
+            if self.path != "/views":
+                self._reply(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                if length < 0:
+                    raise ValueError("must not be negative")
+            except ValueError as exc:
+                self._reply(400, {"error": f"invalid Content-Length: {exc}"})
+                return
+            if length > MAX_BODY_BYTES:
+                self._reply(413, {"error": "body too large"})
+                return
+            try:
+                ids = parse_business_ids(json.loads(self.rfile.read(length) or b"null"))
+            except ValueError as exc:
+                self._reply(400, {"error": str(exc)})
+                return
+            buffer.add(ids)
+            self._reply(202, {"accepted": len(ids)})
+
+        def do_GET(self) -> None:
+            if self.path != "/metrics":
+                self._reply(404, {"error": "not found"})
+                return
+            self._reply(200, metrics.snapshot(buffer))
+
+        def log_message(self, format: str, *args: object) -> None:
+            pass
+
+    return Handler
+
+
+def read_view_counts(conn: psycopg.Connection, ids: list[str]) -> dict[str, int]:
+    rows = conn.execute(
+        "SELECT id::text AS id, COALESCE(view_count, 0) AS view_count FROM businesses WHERE id = ANY(%s::uuid[])",
+        (ids,),
+    ).fetchall()
+    return {r["id"]: int(r["view_count"]) for r in rows}
+
+
+def simulate(pool: ConnectionPool, flusher: Flusher, events: int, businesses: int, threads: int = 8) -> bool:
+    """Push `events` views through a running flusher, stop it and check the counts; True when they match."""
+    ids = [
+        r["id"]
+        for r in run_with_retry(
+            pool,
+            lambda conn: conn.execute(
+                "SELECT id::text AS id FROM businesses ORDER BY id LIMIT %s", (businesses,)
+            ).fetchall(),
+            label="pick_businesses",
+        )
+    ]
+    if not ids:
+        raise SystemExit("--simulate needs at least one row in businesses.")
+    before = run_with_retry(pool, lambda conn: read_view_counts(conn, ids), label="read_view_counts")
+    # Skewed traffic: a few hot listings get most views, like a spike on a popular page.
+    weights = [1.0 / (rank + 1) for rank in range(len(ids))]
+    views = random.choices(ids, weights=weights, k=events)
+
+    def send(chunk: list[str]) -> None:
+        for business_id in chunk:
+            flusher.buffer.add([business_id])
+
+    started = time.perf_counter()
+    senders = [threading.Thread(target=send, args=(views[n::threads],)) for n in range(threads)]
+    for sender in senders:
+        sender.start()
+    for sender in senders:
+        sender.join()
+    flusher.stop()
+    elapsed = time.perf_counter() - started
+
+    after = run_with_retry(pool, lambda conn: read_view_counts(conn, ids), label="read_view_counts")
+    expected = Counter(views)
+    mismatched = [i for i in ids if after[i] - before[i] != expected[i]]
+    print(f"Simulated {events} views over {len(ids)} businesses in {elapsed:.2f}s ({events / elapsed:.0f} views/s)")
+    if mismatched:
+        print(f"MISMATCH for {len(mismatched)} businesses, e.g. {mismatched[0]}")
+    return not mismatched
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Buffer business view events and flush them as batched deltas")
+    parser.add_argument("--db-url", default=os.environ.get("CALVIA_DB_URL", ""))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=DEFAULT_FLUSH_INTERVAL,
+        help="Seconds between flushes; views are coalesced per business within a window",
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=DEFAULT_MAX_PENDING,
+        help="Flush early once this many distinct businesses are buffered",
+    )
+    parser.add_argument("--simulate", type=int, metavar="N", help="Replay N synthetic views, verify the counts and exit")
+    parser.add_argument("--simulate-businesses", type=int, default=100, help="Businesses the simulated views go to")
+    add_profile_argument(parser, "view_count_aggregator")
+    args = parser.parse_args()
+
+    if not args.db_url:
+        raise SystemExit("Missing --db-url (or CALVIA_DB_URL).")
+
+    buffer = ViewBuffer(args.max_pending)
+    metrics = FlushMetrics()
+    with session(args.profile), open_pool(args.db_url) as pool:
+        flusher = Flusher(pool, buffer, metrics, args.flush_interval)
+        flusher.start()
+        if args.simulate:
+            ok = simulate(pool, flusher, args.simulate, args.simulate_businesses)
+            print(json.dumps(metrics.snapshot(buffer), indent=2))
+            return 0 if ok else 1
+
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(buffer, metrics))
+        print(f"Listening on http://{args.host}:{args.port} (POST /views, GET /metrics)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            flusher.stop()
+            print(json.dumps(metrics.snapshot(buffer), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
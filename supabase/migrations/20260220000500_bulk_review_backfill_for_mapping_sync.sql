@@ -0,0 +1,55 @@
+/*
+  # Set-based review backfill for bulk business_listing_map syncs
+
+  `trg_backfill_reviews_from_mapping` runs two `UPDATE reviews` per mapping row,
+  so a full businesses->listings sync scans reviews 2×N times even when nothing
+  changed.
+
+  Bulk syncs now `SET LOCAL calvia.bulk_review_backfill = 'on'` for their
+  transaction, which makes the row trigger a no-op, and call
+  `backfill_reviews_for_businesses()` once per batch instead. Both mapping
+  columns are unique, so the set-based updates reach the same end state as the
+  per-row trigger.
+*/
+
+CREATE OR REPLACE FUNCTION backfill_reviews_from_mapping()
+RETURNS trigger AS $$
+BEGIN
+  IF current_setting('calvia.bulk_review_backfill', true) = 'on' THEN
+    RETURN NEW;
+  END IF;
+
+  UPDATE reviews
+  SET business_id = NEW.business_id
+  WHERE listing_id = NEW.listing_id
+    AND business_id IS NULL;
+
+  UPDATE reviews
+  SET listing_id = NEW.listing_id
+  WHERE business_id = NEW.business_id
+    AND listing_id IS NULL;
+
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION backfill_reviews_for_businesses(business_ids uuid[])
+RETURNS void AS $$
+BEGIN
+  UPDATE reviews r
+  SET business_id = m.business_id
+  FROM business_listing_map m
+  WHERE m.business_id = ANY(business_ids)
+    AND r.listing_id = m.listing_id
+    AND r.business_id IS NULL;
+
+  UPDATE reviews r
+  SET listing_id = m.listing_id
+  FROM business_listing_map m
+  WHERE m.business_id = ANY(business_ids)
+    AND r.business_id = m.business_id
+    AND r.listing_id IS NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+REVOKE ALL ON FUNCTION backfill_reviews_for_businesses(uuid[]) FROM PUBLIC;
@@ -0,0 +1,177 @@
+/*
+  # Denormalized listing search projection
+
+  1. New Tables
+    - `listing_search_index` (one row per listing)
+      - listing/category columns used by global search, copied from
+        `listings` + `categories` so search never joins at query time
+      - `search_vector` (tsvector) weighted name (A), category + tags (B),
+        neighborhood (C), description (D)
+      - `search_text` (text) lowercased name/category/neighborhood/tags for
+        trigram matching
+
+  2. Functions
+    - `refresh_listing_search_index(listing_ids uuid[])` upserts the projection
+      for the given listings and only rewrites rows whose source columns
+      changed; returns the number of rows written. Called per batch by
+      scripts/sync_businesses_to_listings.py and by
+      scripts/refresh_search_index.py.
+    - `search_listings(search_query, result_limit)` ranked full-text + trigram
+      search over the projection.
+
+  3. Security
+    - Enable RLS, public read access like `listings`
+*/
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA extensions;
+
+CREATE TABLE IF NOT EXISTS listing_search_index (
+  listing_id uuid PRIMARY KEY REFERENCES listings(id) ON DELETE CASCADE,
+  name text NOT NULL,
+  description text NOT NULL DEFAULT '',
+  tags text[] NOT NULL DEFAULT '{}',
+  neighborhood text NOT NULL DEFAULT '',
+  is_featured boolean NOT NULL DEFAULT false,
+  category_id uuid,
+  category_name text NOT NULL DEFAULT '',
+  category_slug text NOT NULL DEFAULT '',
+  category_parent_id uuid,
+  search_vector tsvector NOT NULL,
+  search_text text NOT NULL DEFAULT '',
+  refreshed_at timestamptz NOT NULL DEFAULT now()
+);
+
+ALTER TABLE listing_search_index ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Listing search index is publicly readable" ON listing_search_index;
+CREATE POLICY "Listing search index is publicly readable"
+  ON listing_search_index FOR SELECT
+  TO authenticated, anon
+  USING (listing_id IS NOT NULL);
+
+CREATE INDEX IF NOT EXISTS idx_listing_search_vector
+  ON listing_search_index USING gin(search_vector);
+CREATE INDEX IF NOT EXISTS idx_listing_search_text_trgm
+  ON listing_search_index USING gin(search_text extensions.gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_listing_search_name_trgm
+  ON listing_search_index USING gin(lower(name) extensions.gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_listing_search_category_parent
+  ON listing_search_index(category_parent_id);
+
+CREATE OR REPLACE FUNCTION refresh_listing_search_index(listing_ids uuid[])
+RETURNS integer AS $$
+DECLARE
+  written integer;
+BEGIN
+  INSERT INTO listing_search_index (
+    listing_id,
+    name,
+    description,
+    tags,
+    neighborhood,
+    is_featured,
+    category_id,
+    category_name,
+    category_slug,
+    category_parent_id,
+    search_vector,
+    search_text,
+    refreshed_at
+  )
+  SELECT
+    l.id,
+    l.name,
+    COALESCE(l.description, ''),
+    COALESCE(l.tags, '{}'),
+    COALESCE(l.neighborhood, ''),
+    COALESCE(l.is_featured, false),
+    c.id,
+    COALESCE(c.name, ''),
+    COALESCE(c.slug, ''),
+    c.parent_id,
+    setweight(to_tsvector('simple', COALESCE(l.name, '')), 'A')
+      || setweight(to_tsvector('simple', COALESCE(c.name, '') || ' ' || array_to_string(COALESCE(l.tags, '{}'), ' ')), 'B')
+      || setweight(to_tsvector('simple', COALESCE(l.neighborhood, '')), 'C')
+      || setweight(to_tsvector('simple', COALESCE(l.description, '')), 'D'),
+    lower(concat_ws(' ', l.name, c.name, l.neighborhood, array_to_string(COALESCE(l.tags, '{}'), ' '))),
+    now()
+  FROM listings l
+  LEFT JOIN categories c ON c.id = l.category_id
+  WHERE l.id = ANY(listing_ids)
+  ON CONFLICT (listing_id) DO UPDATE SET
+    name = EXCLUDED.name,
+    description = EXCLUDED.description,
+    tags = EXCLUDED.tags,
+    neighborhood = EXCLUDED.neighborhood,
+    is_featured = EXCLUDED.is_featured,
+    category_id = EXCLUDED.category_id,
+    category_name = EXCLUDED.category_name,
+    category_slug = EXCLUDED.category_slug,
+    category_parent_id = EXCLUDED.category_parent_id,
+    search_vector = EXCLUDED.search_vector,
+    search_text = EXCLUDED.search_text,
+    refreshed_at = EXCLUDED.refreshed_at
+  WHERE (
+    listing_search_index.name,
+    listing_search_index.description,
+    listing_search_index.tags,
+    listing_search_index.neighborhood,
+    listing_search_index.is_featured,
+    listing_search_index.category_id,
+    listing_search_index.category_name,
+    listing_search_index.category_slug,
+    listing_search_index.category_parent_id
+  ) IS DISTINCT FROM (
+    EXCLUDED.name,
+    EXCLUDED.description,
+    EXCLUDED.tags,
+    EXCLUDED.neighborhood,
+    EXCLUDED.is_featured,
+    EXCLUDED.category_id,
+    EXCLUDED.category_name,
+    EXCLUDED.category_slug,
+    EXCLUDED.category_parent_id
+  );
+
+  GET DIAGNOSTICS written = ROW_COUNT;
+  RETURN written;
+END;
+$$ LANGUAGE plpgsql;
+
+REVOKE ALL ON FUNCTION refresh_listing_search_index(uuid[]) FROM PUBLIC;
+
+CREATE OR REPLACE FUNCTION search_listings(search_query text, result_limit integer DEFAULT 20)
+RETURNS TABLE (
+  listing_id uuid,
+  name text,
+  neighborhood text,
+  category_name text,
+  category_slug text,
+  is_featured boolean,
+  rank real
+)
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+SET search_path = public, extensions
+AS $$
+  SELECT
+    s.listing_id,
+    s.name,
+    s.neighborhood,
+    s.category_name,
+    s.category_slug,
+    s.is_featured,
+    (ts_rank(s.search_vector, q) + similarity(s.search_text, lower(search_query)))::real AS rank
+  FROM listing_search_index s,
+       websearch_to_tsquery('simple', search_query) q
+  WHERE s.search_vector @@ q
+     OR s.search_text % lower(search_query)
+  ORDER BY rank DESC, s.is_featured DESC, s.name
+  LIMIT LEAST(GREATEST(result_limit, 1), 100);
+$$;
+
+GRANT EXECUTE ON FUNCTION search_listings(text, integer) TO anon, authenticated;
+
+-- Initial population; later refreshes are incremental per sync batch.
+SELECT refresh_listing_search_index(ARRAY(SELECT id FROM listings));
@@ -0,0 +1,61 @@
+/*
+  # Precomputed listing counts per category and neighborhood
+
+  1. New Tables
+    - `category_listing_stats`
+      - `category_id` (uuid, FK categories)
+      - `neighborhood` (text)
+      - `listing_count` (integer)
+      - `updated_at` (timestamptz)
+      Maintained incrementally by scripts/sync_businesses_to_listings.py from
+      the (category, neighborhood) delta of the listings each batch touched;
+      `scripts/listing_stats.py --rebuild` recounts from scratch.
+
+  2. Views
+    - `category_listing_totals` rolls subcategory rows up to their parent so
+      discover pages read one count per category.
+
+  3. Security
+    - Enable RLS, public read access like `listings`
+*/
+
+CREATE TABLE IF NOT EXISTS category_listing_stats (
+  category_id uuid NOT NULL REFERENCES categories(id) ON DELETE CASCADE,
+  neighborhood text NOT NULL DEFAULT '',
+  listing_count integer NOT NULL DEFAULT 0,
+  updated_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (category_id, neighborhood)
+);
+
+ALTER TABLE category_listing_stats ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Category listing stats are publicly readable" ON category_listing_stats;
+CREATE POLICY "Category listing stats are publicly readable"
+  ON category_listing_stats FOR SELECT
+  TO authenticated, anon
+  USING (category_id IS NOT NULL);
+
+CREATE OR REPLACE VIEW category_listing_totals
+WITH (security_invoker = true) AS
+SELECT rollup.category_id, SUM(rollup.listing_count)::integer AS listing_count
+FROM (
+  SELECT s.category_id, s.listing_count
+  FROM category_listing_stats s
+  UNION ALL
+  SELECT c.parent_id, s.listing_count
+  FROM category_listing_stats s
+  JOIN categories c ON c.id = s.category_id
+  WHERE c.parent_id IS NOT NULL
+) rollup
+GROUP BY rollup.category_id;
+
+GRANT SELECT ON category_listing_totals TO anon, authenticated;
+
+-- Initial population; later runs apply deltas only.
+INSERT INTO category_listing_stats (category_id, neighborhood, listing_count)
+SELECT category_id, COALESCE(neighborhood, ''), COUNT(*)
+FROM listings
+GROUP BY category_id, COALESCE(neighborhood, '')
+ON CONFLICT (category_id, neighborhood) DO UPDATE SET
+  listing_count = EXCLUDED.listing_count,
+  updated_at = now();
@@ -0,0 +1,89 @@
+/*
+  # Database-backed business slug reservations
+
+  `import_zip_businesses.py` picked slugs against an in-memory set read at
+  start-up, so concurrent imports could pick the same slug and the loser's
+  row was dropped by `ON CONFLICT (slug) DO NOTHING`.
+
+  1. New Tables
+    - `business_slug_reservations`
+      - `slug` (text, primary key)
+      - `business_id` (uuid, unique): one slug per business, so re-running or
+        resuming a batch gets the same slug back
+      - `reserved_at` (timestamptz)
+      Backfilled from existing `businesses`.
+
+  2. Functions
+    - `reserve_business_slugs(business_ids, base_slugs, area_slugs, id_slugs)`
+      reserves one slug per business in a single call, trying the base slug,
+      then base+area, then base+id prefix, then numbered suffixes. Rows are
+      resolved in array order, so the outcome is deterministic for a batch;
+      the unique indexes make concurrent callers safe.
+
+  3. Security
+    - RLS enabled with no policies; only the service role uses this table
+*/
+
+CREATE TABLE IF NOT EXISTS business_slug_reservations (
+  slug text PRIMARY KEY,
+  business_id uuid NOT NULL UNIQUE,
+  reserved_at timestamptz NOT NULL DEFAULT now()
+);
+
+ALTER TABLE business_slug_reservations ENABLE ROW LEVEL SECURITY;
+
+INSERT INTO business_slug_reservations (slug, business_id)
+SELECT slug, id
+FROM businesses
+ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION reserve_business_slugs(
+  business_ids uuid[],
+  base_slugs text[],
+  area_slugs text[],
+  id_slugs text[]
+)
+RETURNS TABLE (business_id uuid, slug text) AS $$
+DECLARE
+  i integer;
+  n integer;
+  candidate text;
+  chosen text;
+BEGIN
+  FOR i IN 1 .. COALESCE(array_length(business_ids, 1), 0) LOOP
+    chosen := NULL;
+    n := 0;
+    LOOP
+      -- Already reserved (earlier run, resumed batch, or a concurrent caller that just committed).
+      SELECT r.slug INTO chosen
+      FROM business_slug_reservations r
+      WHERE r.business_id = business_ids[i];
+      EXIT WHEN chosen IS NOT NULL;
+
+      n := n + 1;
+      candidate := CASE n
+        WHEN 1 THEN base_slugs[i]
+        WHEN 2 THEN area_slugs[i]
+        WHEN 3 THEN id_slugs[i]
+        ELSE id_slugs[i] || '-' || (n - 2)
+      END;
+
+      IF NOT EXISTS (
+        SELECT 1 FROM businesses b WHERE b.slug = candidate AND b.id <> business_ids[i]
+      ) THEN
+        INSERT INTO business_slug_reservations AS r (slug, business_id)
+        VALUES (candidate, business_ids[i])
+        ON CONFLICT DO NOTHING
+        RETURNING r.slug INTO chosen;
+        EXIT WHEN chosen IS NOT NULL;
+      END IF;
+    END LOOP;
+
+    reserve_business_slugs.business_id := business_ids[i];
+    reserve_business_slugs.slug := chosen;
+    RETURN NEXT;
+  END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+REVOKE ALL ON FUNCTION reserve_business_slugs(uuid[], text[], text[], text[]) FROM PUBLIC;
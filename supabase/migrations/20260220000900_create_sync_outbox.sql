@@ -0,0 +1,90 @@
+/*
+  # Change data capture outbox between businesses and listings
+
+  Replaces "full batch sync on a schedule" with near-real-time propagation
+  consumed by scripts/cdc_consumer.py.
+
+  1. New Tables
+    - `sync_outbox`
+      - `id` (bigserial): apply order; later ids win conflicts
+      - `source_table` ('businesses' | 'listings')
+      - `row_id` (uuid)
+      - `op` ('INSERT' | 'UPDATE' | 'DELETE')
+      - `changed_at` (timestamptz)
+
+  2. Triggers
+    - `trg_businesses_outbox` / `trg_listings_outbox` enqueue a row when a
+      column that is mirrored on the other side changes, then
+      `pg_notify('calvia_sync_outbox')` so the consumer wakes immediately.
+    - Writes made with `calvia.cdc_origin` set (the consumer itself, or a bulk
+      sync that already wrote both sides) are not enqueued, which prevents
+      ping-pong between the two tables.
+
+  3. Security
+    - RLS enabled with no policies; only the service role reads the outbox
+*/
+
+CREATE TABLE IF NOT EXISTS sync_outbox (
+  id bigserial PRIMARY KEY,
+  source_table text NOT NULL CHECK (source_table IN ('businesses', 'listings')),
+  row_id uuid NOT NULL,
+  op text NOT NULL CHECK (op IN ('INSERT', 'UPDATE', 'DELETE')),
+  changed_at timestamptz NOT NULL DEFAULT now()
+);
+
+ALTER TABLE sync_outbox ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION enqueue_sync_outbox()
+RETURNS trigger AS $$
+DECLARE
+  changed_id uuid;
+BEGIN
+  IF COALESCE(current_setting('calvia.cdc_origin', true), '') <> '' THEN
+    RETURN NULL;
+  END IF;
+
+  IF TG_OP = 'DELETE' THEN
+    changed_id := OLD.id;
+  ELSE
+    changed_id := NEW.id;
+  END IF;
+
+  IF TG_OP = 'UPDATE' THEN
+    IF TG_TABLE_NAME = 'businesses' AND (
+      NEW.name, NEW.description, NEW.image_url, NEW.phone, NEW.email, NEW.website,
+      NEW.address, NEW.social_links, NEW.category_id, NEW.area_id
+    ) IS NOT DISTINCT FROM (
+      OLD.name, OLD.description, OLD.image_url, OLD.phone, OLD.email, OLD.website,
+      OLD.address, OLD.social_links, OLD.category_id, OLD.area_id
+    ) THEN
+      RETURN NULL;
+    END IF;
+    IF TG_TABLE_NAME = 'listings' AND (
+      NEW.name, NEW.description, NEW.image_url, NEW.contact_phone, NEW.contact_email,
+      NEW.website_url, NEW.address, NEW.social_media
+    ) IS NOT DISTINCT FROM (
+      OLD.name, OLD.description, OLD.image_url, OLD.contact_phone, OLD.contact_email,
+      OLD.website_url, OLD.address, OLD.social_media
+    ) THEN
+      RETURN NULL;
+    END IF;
+  END IF;
+
+  INSERT INTO sync_outbox (source_table, row_id, op)
+  VALUES (TG_TABLE_NAME, changed_id, TG_OP);
+  PERFORM pg_notify('calvia_sync_outbox', TG_TABLE_NAME);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_businesses_outbox ON businesses;
+CREATE TRIGGER trg_businesses_outbox
+  AFTER INSERT OR UPDATE OR DELETE ON businesses
+  FOR EACH ROW
+  EXECUTE FUNCTION enqueue_sync_outbox();
+
+DROP TRIGGER IF EXISTS trg_listings_outbox ON listings;
+CREATE TRIGGER trg_listings_outbox
+  AFTER INSERT OR UPDATE OR DELETE ON listings
+  FOR EACH ROW
+  EXECUTE FUNCTION enqueue_sync_outbox();
@@ -0,0 +1,129 @@
+/*
+  # Precomputed loyalty totals from store visits
+
+  1. New Tables
+    - `user_visit_totals`
+      - `user_id` (uuid, PK, FK profiles)
+      - `visit_count` (integer)
+      - `points` (integer)
+      - `last_visit_at` (timestamptz)
+      - `updated_at` (timestamptz)
+    - `listing_visit_totals`
+      - `listing_id` (uuid, PK, FK listings)
+      - `visit_count`, `points`, `last_visit_at`, `updated_at` as above
+    - `loyalty_rollup_state`
+      - single row holding the (created_at, id) watermark of the last
+        `store_visits` row folded into the totals
+    Maintained by scripts/loyalty_rollup.py, which applies visits past the
+    watermark in batches and also keeps `profiles.loyalty_points` and
+    `profiles.loyalty_tier` in step; `--rebuild` recounts from scratch.
+    This migration fills the totals and profiles up to the newest visit
+    older than the rollup's settle margin and seeds the watermark there.
+
+  2. Indexes
+    - `store_visits (created_at, id)` for the watermark scan
+
+  3. Security
+    - Enable RLS on all three tables
+    - Users can read their own totals; listing totals are readable by
+      signed-in users; the rollup state has no policies (service role only)
+*/
+
+CREATE TABLE IF NOT EXISTS user_visit_totals (
+  user_id uuid PRIMARY KEY REFERENCES profiles(id) ON DELETE CASCADE,
+  visit_count integer NOT NULL DEFAULT 0,
+  points integer NOT NULL DEFAULT 0,
+  last_visit_at timestamptz,
+  updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS listing_visit_totals (
+  listing_id uuid PRIMARY KEY REFERENCES listings(id) ON DELETE CASCADE,
+  visit_count integer NOT NULL DEFAULT 0,
+  points integer NOT NULL DEFAULT 0,
+  last_visit_at timestamptz,
+  updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS loyalty_rollup_state (
+  id boolean PRIMARY KEY DEFAULT true CHECK (id),
+  last_created_at timestamptz NOT NULL DEFAULT '-infinity',
+  last_visit_id uuid NOT NULL DEFAULT '00000000-0000-0000-0000-000000000000',
+  updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS store_visits_created_at_id_idx
+  ON store_visits (created_at, id);
+
+ALTER TABLE user_visit_totals ENABLE ROW LEVEL SECURITY;
+ALTER TABLE listing_visit_totals ENABLE ROW LEVEL SECURITY;
+ALTER TABLE loyalty_rollup_state ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view own visit totals" ON user_visit_totals;
+CREATE POLICY "Users can view own visit totals"
+  ON user_visit_totals FOR SELECT
+  TO authenticated
+  USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Listing visit totals are readable by signed-in users" ON listing_visit_totals;
+CREATE POLICY "Listing visit totals are readable by signed-in users"
+  ON listing_visit_totals FOR SELECT
+  TO authenticated
+  USING (listing_id IS NOT NULL);
+
+-- Watermark: the newest visit older than the rollup's default settle margin
+-- (60s), so a visit still committing is left for the first run.
+INSERT INTO loyalty_rollup_state (id, last_created_at, last_visit_id)
+SELECT true, created_at, id
+FROM store_visits
+WHERE created_at < now() - interval '60 seconds'
+ORDER BY created_at DESC, id DESC
+LIMIT 1
+ON CONFLICT (id) DO UPDATE SET
+  last_created_at = EXCLUDED.last_created_at,
+  last_visit_id = EXCLUDED.last_visit_id,
+  updated_at = now();
+
+INSERT INTO loyalty_rollup_state (id) VALUES (true) ON CONFLICT (id) DO NOTHING;
+
+-- Initial population up to the watermark; later runs fold in visits past it.
+INSERT INTO user_visit_totals (user_id, visit_count, points, last_visit_at)
+SELECT v.user_id, COUNT(*), COALESCE(SUM(v.points_earned), 0), MAX(v.created_at)
+FROM store_visits v
+JOIN loyalty_rollup_state s ON s.id
+WHERE v.verified_at IS NOT NULL AND (v.created_at, v.id) <= (s.last_created_at, s.last_visit_id)
+GROUP BY v.user_id
+ON CONFLICT (user_id) DO UPDATE SET
+  visit_count = EXCLUDED.visit_count,
+  points = EXCLUDED.points,
+  last_visit_at = EXCLUDED.last_visit_at,
+  updated_at = now();
+
+INSERT INTO listing_visit_totals (listing_id, visit_count, points, last_visit_at)
+SELECT v.listing_id, COUNT(*), COALESCE(SUM(v.points_earned), 0), MAX(v.created_at)
+FROM store_visits v
+JOIN loyalty_rollup_state s ON s.id
+WHERE v.verified_at IS NOT NULL AND v.listing_id IS NOT NULL
+  AND (v.created_at, v.id) <= (s.last_created_at, s.last_visit_id)
+GROUP BY v.listing_id
+ON CONFLICT (listing_id) DO UPDATE SET
+  visit_count = EXCLUDED.visit_count,
+  points = EXCLUDED.points,
+  last_visit_at = EXCLUDED.last_visit_at,
+  updated_at = now();
+
+-- Same tiers as scripts/loyalty_rollup.py and components/loyalty-tier-card.tsx.
+UPDATE profiles AS p
+SET loyalty_points = t.points, loyalty_tier = t.tier
+FROM (
+  SELECT
+    pr.id AS user_id,
+    COALESCE(u.points, 0) AS points,
+    CASE WHEN COALESCE(u.points, 0) >= 1500 THEN 'Platinum'
+         WHEN COALESCE(u.points, 0) >= 500 THEN 'Gold'
+         ELSE 'Silver' END AS tier
+  FROM profiles pr
+  LEFT JOIN user_visit_totals u ON u.user_id = pr.id
+) t
+WHERE p.id = t.user_id
+  AND (p.loyalty_points, p.loyalty_tier) IS DISTINCT FROM (t.points, t.tier);
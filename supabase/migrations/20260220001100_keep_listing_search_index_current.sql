@@ -0,0 +1,136 @@
+/*
+  # Keep listing_search_index current for every write path
+
+  `listing_search_index` was refreshed only by the sync scripts, and only when
+  asked to, so listings written by the app, seeds or admin were missing from
+  search or showed stale names and categories.
+
+  1. Triggers
+    - `listings_search_index_insert` / `listings_search_index_update`:
+      statement-level, refresh the projection for the rows the statement
+      wrote. Deletes are covered by the ON DELETE CASCADE foreign key.
+    - `categories_search_index_update`: refreshes listings of a category whose
+      name, slug or parent changed.
+    Bulk writers (the sync scripts) `SET LOCAL calvia.defer_search_index = 'on'`,
+    which makes the listings triggers a no-op, and call
+    `refresh_listing_search_index()` once per batch instead.
+
+  2. Functions
+    - `search_listings(search_query, result_limit, synonyms, root_category_slugs)`
+      replaces the two-argument version. `synonyms` are OR-ed into the
+      full-text query, a substring match on `search_text` keeps partial words
+      working, and `root_category_slugs` restricts results to listings in, or
+      directly under, those top-level categories.
+
+  3. Backfill
+    - Refresh every listing once to pick up rows written since the projection
+      was created.
+*/
+
+CREATE OR REPLACE FUNCTION refresh_search_index_for_listings()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, extensions
+AS $$
+BEGIN
+  IF current_setting('calvia.defer_search_index', true) = 'on' THEN
+    RETURN NULL;
+  END IF;
+
+  PERFORM refresh_listing_search_index(ARRAY(SELECT id FROM new_rows));
+  RETURN NULL;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION refresh_search_index_for_listings() FROM PUBLIC;
+
+-- Transition tables allow one event per trigger, hence two triggers.
+DROP TRIGGER IF EXISTS listings_search_index_insert ON listings;
+CREATE TRIGGER listings_search_index_insert
+  AFTER INSERT ON listings
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION refresh_search_index_for_listings();
+
+DROP TRIGGER IF EXISTS listings_search_index_update ON listings;
+CREATE TRIGGER listings_search_index_update
+  AFTER UPDATE ON listings
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION refresh_search_index_for_listings();
+
+CREATE OR REPLACE FUNCTION refresh_search_index_for_category()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, extensions
+AS $$
+BEGIN
+  PERFORM refresh_listing_search_index(ARRAY(SELECT id FROM listings WHERE category_id = NEW.id));
+  RETURN NULL;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION refresh_search_index_for_category() FROM PUBLIC;
+
+DROP TRIGGER IF EXISTS categories_search_index_update ON categories;
+CREATE TRIGGER categories_search_index_update
+  AFTER UPDATE OF name, slug, parent_id ON categories
+  FOR EACH ROW
+  WHEN ((OLD.name, OLD.slug, OLD.parent_id) IS DISTINCT FROM (NEW.name, NEW.slug, NEW.parent_id))
+  EXECUTE FUNCTION refresh_search_index_for_category();
+
+DROP FUNCTION IF EXISTS search_listings(text, integer);
+
+CREATE OR REPLACE FUNCTION search_listings(
+  search_query text,
+  result_limit integer DEFAULT 20,
+  synonyms text[] DEFAULT '{}',
+  root_category_slugs text[] DEFAULT NULL
+)
+RETURNS TABLE (
+  listing_id uuid,
+  name text,
+  neighborhood text,
+  category_name text,
+  category_slug text,
+  is_featured boolean,
+  rank real
+)
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+SET search_path = public, extensions
+AS $$
+  WITH params AS (
+    SELECT
+      websearch_to_tsquery(
+        'simple',
+        concat_ws(' or ', VARIADIC array_prepend(search_query, COALESCE(synonyms, '{}')))
+      ) AS q,
+      lower(search_query) AS needle,
+      '%' || replace(replace(replace(lower(search_query), '\', '\\'), '%', '\%'), '_', '\_') || '%' AS pattern
+  )
+  SELECT
+    s.listing_id,
+    s.name,
+    s.neighborhood,
+    s.category_name,
+    s.category_slug,
+    s.is_featured,
+    (ts_rank(s.search_vector, p.q) + similarity(s.search_text, p.needle))::real AS rank
+  FROM listing_search_index s
+  CROSS JOIN params p
+  LEFT JOIN categories parent ON parent.id = s.category_parent_id
+  WHERE (s.search_vector @@ p.q OR s.search_text % p.needle OR s.search_text LIKE p.pattern)
+    AND (
+      root_category_slugs IS NULL
+      OR s.category_slug = ANY(root_category_slugs)
+      OR (parent.parent_id IS NULL AND parent.slug = ANY(root_category_slugs))
+    )
+  ORDER BY rank DESC, s.is_featured DESC, s.name
+  LIMIT LEAST(GREATEST(result_limit, 1), 100);
+$$;
+
+GRANT EXECUTE ON FUNCTION search_listings(text, integer, text[], text[]) TO anon, authenticated;
+
+SELECT refresh_listing_search_index(ARRAY(SELECT id FROM listings));
@@ -0,0 +1,111 @@
+/*
+  # Maintain category_listing_stats for every listings write path
+
+  `category_listing_stats` was adjusted only by the sync and CDC deltas, so
+  listings created, moved or deleted by the app, seeds or admin left
+  subcategories wrongly hidden or lingering on discover pages.
+
+  1. Triggers
+    - `listings_stats_insert` / `listings_stats_update` / `listings_stats_delete`:
+      statement-level, apply the (category_id, neighborhood) count delta of the
+      rows the statement wrote, read from its transition tables.
+    Scripts that apply their own per-batch delta (see scripts/listing_stats.py)
+    `SET LOCAL calvia.defer_listing_stats = 'on'`, which makes the triggers a
+    no-op for their transaction.
+
+  2. Backfill
+    - Recount once to repair drift from writes made before the triggers.
+*/
+
+-- Positive net changes are upserted, negative ones subtracted (never below 0).
+CREATE OR REPLACE FUNCTION listings_stats_delta_trigger()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  IF current_setting('calvia.defer_listing_stats', true) = 'on' THEN
+    RETURN NULL;
+  END IF;
+
+  -- Each branch only references the transition tables its event defines.
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO category_listing_stats AS s (category_id, neighborhood, listing_count)
+    SELECT category_id, COALESCE(neighborhood, ''), COUNT(*)
+    FROM new_rows
+    WHERE category_id IS NOT NULL
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (category_id, neighborhood) DO UPDATE SET
+      listing_count = s.listing_count + EXCLUDED.listing_count,
+      updated_at = now();
+  ELSIF TG_OP = 'DELETE' THEN
+    UPDATE category_listing_stats AS s
+    SET listing_count = GREATEST(s.listing_count - d.n, 0), updated_at = now()
+    FROM (
+      SELECT category_id, COALESCE(neighborhood, '') AS neighborhood, COUNT(*) AS n
+      FROM old_rows
+      GROUP BY 1, 2
+    ) d
+    WHERE s.category_id = d.category_id AND s.neighborhood = d.neighborhood;
+  ELSE
+    INSERT INTO category_listing_stats AS s (category_id, neighborhood, listing_count)
+    SELECT category_id, neighborhood, SUM(delta)
+    FROM (
+      SELECT category_id, COALESCE(neighborhood, '') AS neighborhood, 1 AS delta FROM new_rows
+      UNION ALL
+      SELECT category_id, COALESCE(neighborhood, '') AS neighborhood, -1 AS delta FROM old_rows
+    ) x
+    WHERE category_id IS NOT NULL
+    GROUP BY 1, 2
+    HAVING SUM(delta) > 0
+    ORDER BY 1, 2
+    ON CONFLICT (category_id, neighborhood) DO UPDATE SET
+      listing_count = s.listing_count + EXCLUDED.listing_count,
+      updated_at = now();
+
+    UPDATE category_listing_stats AS s
+    SET listing_count = GREATEST(s.listing_count + d.delta, 0), updated_at = now()
+    FROM (
+      SELECT category_id, neighborhood, SUM(delta) AS delta
+      FROM (
+        SELECT category_id, COALESCE(neighborhood, '') AS neighborhood, 1 AS delta FROM new_rows
+        UNION ALL
+        SELECT category_id, COALESCE(neighborhood, '') AS neighborhood, -1 AS delta FROM old_rows
+      ) x
+      GROUP BY 1, 2
+      HAVING SUM(delta) < 0
+    ) d
+    WHERE s.category_id = d.category_id AND s.neighborhood = d.neighborhood;
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION listings_stats_delta_trigger() FROM PUBLIC;
+
+-- Transition tables allow one event per trigger, hence three triggers.
+DROP TRIGGER IF EXISTS listings_stats_insert ON listings;
+CREATE TRIGGER listings_stats_insert
+  AFTER INSERT ON listings
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION listings_stats_delta_trigger();
+
+DROP TRIGGER IF EXISTS listings_stats_update ON listings;
+CREATE TRIGGER listings_stats_update
+  AFTER UPDATE ON listings
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION listings_stats_delta_trigger();
+
+DROP TRIGGER IF EXISTS listings_stats_delete ON listings;
+CREATE TRIGGER listings_stats_delete
+  AFTER DELETE ON listings
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION listings_stats_delta_trigger();
+
+DELETE FROM category_listing_stats;
+INSERT INTO category_listing_stats (category_id, neighborhood, listing_count)
+SELECT category_id, COALESCE(neighborhood, ''), COUNT(*)
+FROM listings
+GROUP BY category_id, COALESCE(neighborhood, '');
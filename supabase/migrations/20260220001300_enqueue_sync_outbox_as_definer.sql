@@ -0,0 +1,15 @@
+/*
+  # Let app writes enqueue into sync_outbox
+
+  `enqueue_sync_outbox()` ran as the writing role, and `sync_outbox` has RLS
+  with no policies, so every write by an app role (e.g. an owner editing their
+  business under "Calvia EU owners update own businesses") failed in the
+  trigger's INSERT.
+
+  1. Functions
+    - `enqueue_sync_outbox()` now runs as SECURITY DEFINER with a pinned
+      search_path. The outbox itself stays unreadable and unwritable for app
+      roles. scripts/check_owner_update.py verifies an owner update end to end.
+*/
+
+ALTER FUNCTION enqueue_sync_outbox() SECURITY DEFINER SET search_path = public;
@@ -0,0 +1,39 @@
+/*
+  # Server-assigned store_visits.created_at
+
+  scripts/loyalty_rollup.py advances a (created_at, id) watermark over
+  `store_visits`, but `created_at` was only a column default: the
+  "Users can insert own visits" policy let clients send any value, so a
+  backdated visit landed behind the watermark and was never counted, and a
+  future-dated one was held back until that time.
+
+  1. Triggers
+    - `store_visits_created_at`: sets `created_at` to `now()` on INSERT and
+      keeps the stored value on UPDATE, whatever the writer sent.
+
+  2. Data
+    - Rows with a future or missing `created_at` are moved to now so the
+      rollup reaches them. Rows backdated before this migration are only
+      counted by `loyalty_rollup.py --rebuild`.
+*/
+
+CREATE OR REPLACE FUNCTION set_store_visit_created_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    NEW.created_at := now();
+  ELSE
+    NEW.created_at := OLD.created_at;
+  END IF;
+  RETURN NEW;
+END;
+$$;
+
+UPDATE store_visits SET created_at = now() WHERE created_at IS NULL OR created_at > now();
+
+DROP TRIGGER IF EXISTS store_visits_created_at ON store_visits;
+CREATE TRIGGER store_visits_created_at
+  BEFORE INSERT OR UPDATE OF created_at ON store_visits
+  FOR EACH ROW EXECUTE FUNCTION set_store_visit_created_at();